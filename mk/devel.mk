@@ -33,7 +33,10 @@ endif
 # Set the C++ compiler flags
 CXXFLAGS_EIGEN = -I /usr/include/eigen3
 INCLUDES = $(CXXFLAGS_EIGEN) #-Iinclude
-CXXFLAGS := -std=c++17 -Wall $(INCLUDES) $(CXXFLAGS_MODE)
+# zlib compresses the state files of SaveState. Set ZLIB= to build without it
+ZLIB ?= -DARRITMIC3D_ZLIB
+LDLIBS_ZLIB := $(if $(ZLIB),-lz)
+CXXFLAGS := -std=c++17 -Wall $(INCLUDES) $(CXXFLAGS_MODE) $(ZLIB)
 
 # ---------- Python settings ----------
 # Set the name of the Python interpreter to use
@@ -59,16 +62,16 @@ HEADERS := $(shell find src -type f \( -name '*.hpp' -o -name '*.h' \))
 
 # Set the source files
 TEST_DIR = test
-TARGET_CPP = test1 test2 test_reentry test_spline test_spline2d test_save test_load test_init
+TARGET_CPP = test1 test2 test_reentry test_spline test_spline2d test_save test_load test_init test_run_until test_model_tables test_anisotropy_table benchmark_event_queue
 
 all: $(TARGET_PY) $(TARGET_CPP)
 
 # Define the build rule for the module
 $(TARGET_PY): $(SRC_PY) $(HEADERS)
-	$(CXX) $(CXXFLAGS) $(CXXFLAGS_PY) $(SRC_PY) -o $(TARGET_PY)
+	$(CXX) $(CXXFLAGS) $(CXXFLAGS_PY) $(SRC_PY) -o $(TARGET_PY) $(LDLIBS_ZLIB)
 
 $(TARGET_CPP): %: $(TEST_DIR)/%.cpp $(HEADERS)
-	$(CXX) $(CXXFLAGS) $< -o $@
+	$(CXX) $(CXXFLAGS) $< -o $@ $(LDLIBS_ZLIB)
 
 # Added: path to restitution CSVs (will be packaged as package_data)
 RESTITUTION_DIR := RestitutionSurfaces
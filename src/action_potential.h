@@ -99,6 +99,9 @@ public:
             return this->peak_potential;
     };
 
+    /** Get the potential of the inactive cells */
+    static constexpr float GetRestingPotential() { return resting_potential; }
+
     /**
      * @brief Check if the cell is active at time t.
     */
@@ -135,6 +135,19 @@ public:
         return true;
     };
 
+    /**
+     * @brief Set the activation time and the APD of the last activation.
+     * It is used to copy the state of a node simulated in another subdomain.
+     *
+     * @param ta_ Activation time.
+     * @param apd_ Action potential duration.
+     */
+    void SetActivation(float ta_, float apd_)
+    {
+        this->ta = ta_;
+        this->apd = apd_;
+    };
+
     /**
      * @brief Simple polynomial approximation of a Ventricular Cardiomyocyte Action Potential.
      *
@@ -196,6 +209,9 @@ public:
         return pseudoAP( getLife(t_) );
     };
 
+    /** Get the potential of the inactive cells */
+    static constexpr float GetRestingPotential() { return resting_potential; }
+
     /**
      * @brief Check if the cell is active at time t.
     */
@@ -36,30 +36,41 @@ public:
     ActionPotentialRestSurface()
     {
         this->parameters = nullptr;
+        this->restitution_model = nullptr;
         this->last_di = 100.0;
         this->ta = 0.0;
         this->apd = 0.0;
         this->delta_apd = 0.0;
     };
 
-    static void InitModel(const std::string &path)
+    using ModelTable = SplineContainer2D; ///< Table of restitution models, one per cell type.
+
+    /**
+     * @brief Load the table of APD restitution models.
+     *
+     * Tables loaded from the same configuration file are shared.
+     * @param path Configuration file with the list of restitution models.
+     * @return Shared pointer to the table.
+     */
+    static std::shared_ptr<const ModelTable> LoadModel(const std::string &path)
     {
-        splines.Init(path);
+        return ModelTable::Load(path);
     }
 
     /**
      * @brief Initialize the action potential.
      *
-     * @param parameters Pointer to the node parameters.
+     * @param params Pointer to the node parameters.
+     * @param models Table of restitution models.
      * @param type Cell type.
      * @param apd_ Action potential duration.
      * @param t0_ Time of the activation.
      * @param di_ Diastolic interval.
      */
-    void Init(NodeParameters* params, CellType type, float apd_, float t0_, float di_ = 0.0)
+    void Init(NodeParameters* params, const ModelTable & models, CellType type, float apd_, float t0_, float di_ = 0.0)
     {
         this->parameters = params;
-        SetRestitutionModel(type);
+        SetRestitutionModel(models, type);
         if(type == CELL_TYPE_VOID)
             return;
 
@@ -90,11 +101,12 @@ public:
     /**
      * @brief Set the restitution model.
      *
+     * @param models Table of restitution models.
      * @param type Cell type.
      */
-    void SetRestitutionModel(CellType type)
+    void SetRestitutionModel(const ModelTable & models, CellType type)
     {
-        this->restitution_model = splines.getSpline(type);
+        this->restitution_model = models.getSpline(type);
         if(this->restitution_model == nullptr && type != CELL_TYPE_VOID)
             throw std::runtime_error("action_potential_rs.h: : no APD restitution model found for cell type " + std::to_string(static_cast<int>(type)));
     };
@@ -139,6 +151,19 @@ public:
         return true;
     };
 
+    /**
+     * @brief Set the activation time and the APD of the last activation.
+     * It is used to copy the state of a node simulated in another subdomain.
+     *
+     * @param ta_ Activation time.
+     * @param apd_ Action potential duration.
+     */
+    void SetActivation(float ta_, float apd_)
+    {
+        this->ta = ta_;
+        this->apd = apd_;
+    };
+
     /**
      * @brief Simple polynomial approximation of a Ventricular Cardiomyocyte Action Potential.
      *
@@ -200,6 +225,9 @@ public:
         return pseudoAP( getLife(t_) );
     };
 
+    /** Get the potential of the inactive cells */
+    static constexpr float GetRestingPotential() { return resting_potential; }
+
     /**
      * @brief Check if the cell is active at time t.
     */
@@ -287,30 +315,34 @@ public:
     };
 
 
+    /// Number of values of the state of the model
+    static constexpr int STATE_SIZE = 4;
+
     /**
-     * Save the state of the model to a file.
+     * Save the state of the model to STATE_SIZE values.
      * The correct restitution model will be set when loading according to the cell type.
      */
-    void SaveState(std::ofstream & f) const
+    void SaveState(float * state) const
     {
-        f.write( (char *) &apd, sizeof(float) );
-        f.write( (char *) &ta, sizeof(float) );
-        f.write( (char *) &last_di, sizeof(float) );
-        f.write( (char *) &delta_apd, sizeof(float) );
+        state[0] = apd;
+        state[1] = ta;
+        state[2] = last_di;
+        state[3] = delta_apd;
     }
 
     /**
-    * Load the state of the model from a file.
+    * Load the state of the model from STATE_SIZE values.
     * The correct restitution model will be set according to the cell type.
     */
-    void LoadState(std::ifstream & f, CellType type)
+    void LoadState(const float * state, NodeParameters* params, const ModelTable & models, CellType type)
     {
-        f.read( (char *) &apd, sizeof(float) );
-        f.read( (char *) &ta, sizeof(float) );
-        f.read( (char *) &last_di, sizeof(float) );
-        f.read( (char *) &delta_apd, sizeof(float) );
+        this->parameters = params;
+        apd = state[0];
+        ta = state[1];
+        last_di = state[2];
+        delta_apd = state[3];
 
-        SetRestitutionModel(type);
+        SetRestitutionModel(models, type);
     }
 
 private:
@@ -321,8 +353,7 @@ private:
     float last_di; /**< Last diastolic interval. */
     float delta_apd; ///< Change in APD due to restitution models (without electrotonic effect).
 
-    Spline2D * restitution_model; /**< APD restitution model. */
-    static SplineContainer2D splines; /**< Container of APD restitution models. */
+    const Spline2D * restitution_model; /**< APD restitution model. */
 
     static constexpr bool normalized_potential = false; /**< Whether the potential is normalized. */
     static constexpr float resting_potential = -80.0; // 0.0; /**< Resting potential. */
@@ -333,6 +364,4 @@ private:
 
 std::string ActionPotentialRestSurface::config_file = "";
 
-SplineContainer2D ActionPotentialRestSurface::splines;
-
 #endif
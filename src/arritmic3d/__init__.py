@@ -11,7 +11,7 @@ __license__ = "LGPL-3.0-or-later"
 
 # Import the compiled C++ module
 try:
-    from ._core import CardiacTissue, SystemEventType
+    from ._core import CardiacTissue, SystemEventType, EventQueueType
     # Expose arritmic3d and test_case lazily (avoid exposing submodules in package namespace)
     def __getattr__(name):
         if name == "arritmic3d":
@@ -26,6 +26,21 @@ try:
         if name == "load_case_config":
             from .arr3D_config import load_case_config
             return load_case_config
+        if name == "load_xdmf_field":
+            from .arr3D_output import load_xdmf_field
+            return load_xdmf_field
+        if name == "DeltaSeriesReader":
+            from .arr3D_output import DeltaSeriesReader
+            return DeltaSeriesReader
+        if name == "lead_field":
+            from .arr3D_ecg import lead_field
+            return lead_field
+        if name == "PartitionedTissue":
+            from .arr3D_partition import PartitionedTissue
+            return PartitionedTissue
+        if name == "search_s2":
+            from .arr3D_search import search_s2
+            return search_s2
         raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
     def __dir__():
@@ -46,5 +61,10 @@ __all__ = [
     "arritmic3d",
     "test_case",
     "build_slab",
-    "load_case_config"
+    "load_case_config",
+    "load_xdmf_field",
+    "DeltaSeriesReader",
+    "lead_field",
+    "PartitionedTissue",
+    "search_s2"
 ]
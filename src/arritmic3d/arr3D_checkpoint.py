@@ -0,0 +1,76 @@
+"""
+Checkpoints of a simulation run by the arritmic3d driver.
+
+A checkpoint is a directory <case_dir>/checkpoints/checkpoint_<time>/ with the state of the
+tissue (state.bin, see SaveState), with the pending stimuli, and the state of the driver
+(driver.json): the position of each output file. It is written as <name>.tmp and then
+renamed, so an interrupted write never leaves an incomplete checkpoint.
+"""
+
+import json
+import os
+import shutil
+
+CHECKPOINTS_DIR = "checkpoints"
+STATE_FILE = "state.bin"
+DRIVER_FILE = "driver.json"
+
+
+def list_checkpoints(case_dir):
+    """ Complete checkpoints of a case, as a list of (time, path) sorted by time. """
+    dir_name = os.path.join(case_dir, CHECKPOINTS_DIR)
+    if not os.path.isdir(dir_name):
+        return []
+    checkpoints = []
+    for name in os.listdir(dir_name):
+        path = os.path.join(dir_name, name)
+        if name.startswith("checkpoint_") and not name.endswith(".tmp") and os.path.isfile(os.path.join(path, DRIVER_FILE)):
+            checkpoints.append((float(name[len("checkpoint_"):]), path))
+    return sorted(checkpoints)
+
+
+def remove_checkpoints(case_dir):
+    """ Remove the checkpoints of a case, complete or not. """
+    shutil.rmtree(os.path.join(case_dir, CHECKPOINTS_DIR), ignore_errors=True)
+
+
+def save_checkpoint(case_dir, tissue, driver_state, keep=2, compress=False):
+    """
+    Save a checkpoint of the simulation at the current time of the tissue, and remove the
+    older ones so that only the last keep checkpoints remain.
+
+    Args:
+        case_dir (str): Case directory.
+        tissue: CardiacTissue or PartitionedTissue.
+        driver_state (dict): State of the driver, saved as JSON.
+        keep (int): Number of checkpoints kept.
+        compress (bool): Compress the state of the tissue, if arritmic3d was built with zlib.
+
+    Returns:
+        The path of the checkpoint.
+    """
+    path = os.path.join(case_dir, CHECKPOINTS_DIR, f"checkpoint_{tissue.GetTime():.3f}")
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    tissue.SaveState(os.path.join(tmp_path, STATE_FILE), compress)
+    with open(os.path.join(tmp_path, DRIVER_FILE), "w") as f:
+        json.dump(driver_state, f)
+    # A checkpoint at the same time of a previous run is replaced
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    for _, old_path in list_checkpoints(case_dir)[:-max(keep, 1)]:
+        shutil.rmtree(old_path)
+    return path
+
+
+def load_checkpoint(path, tissue):
+    """
+    Load the state of the tissue from a checkpoint. The tissue must have been created and
+    initialized as in the run that saved it.
+    Returns the state of the driver.
+    """
+    tissue.LoadState(os.path.join(path, STATE_FILE))
+    with open(os.path.join(path, DRIVER_FILE)) as f:
+        return json.load(f)
@@ -178,10 +178,24 @@ def make_default_config():
         "VTK_OUTPUT_FIELDS": ["State", "APD", "DI", "CV", "AP", "LAT", "Beat"],
         "VTK_OUTPUT_PERIOD": 20.0,
         "VTK_OUTPUT_INITIAL_TIME": 0.0,
+        "VTK_OUTPUT_BUFFERS": 2,
+        "VTK_OUTPUT_KEYFRAME_PERIOD": 100,
+        "VTK_OUTPUT_ROI": None,
+        "VTK_OUTPUT_STRIDE": 1,
         "SENSORS_OUTPUT_SAVE": True,
+        "BEAT_MAPS_SAVE": False,
+        "BEAT_MAPS_RANGE": [0, -1],
+        "ECG_ELECTRODES": [],
+        "ECG_SAMPLING_PERIOD": 1.0,
+        "ECG_CUTOFF": None,
         "SIMULATION_DURATION": 6000.0,
         "CV_MEMORY_COEFF": 0.0,
         "APD_MEMORY_COEFF": 0.0,
+        "EVENT_QUEUE": "HEAP",
+        "N_PARTITIONS": 1,
+        "CHECKPOINT_PERIOD": 0.0,
+        "CHECKPOINT_KEEP": 2,
+        "CHECKPOINT_COMPRESS": False,
         # PROTOCOL / ACTIVATE_NODES intentionally omitted; can be provided via --config-param
     }
 
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+def lead_field(live, spacing, electrodes, cutoff=None):
+    """
+    Weights of the nodes for the pseudo-ECG computed by CardiacTissue.SetElectrogram.
+
+    The pseudo-ECG at an electrode is phi = -sum(grad(AP) . grad(1/r) dV) over the live nodes,
+    without the conductivity factor, with r the distance from the node to the electrode.
+    The gradient of the AP is discretized with central differences (one-sided at the border of
+    the tissue), so phi is a weighted sum of the AP of the nodes. The weights of each electrode
+    add up to zero.
+
+    Args:
+        live (numpy.ndarray): Live (not VOID) nodes, as a boolean array of shape (size_z, size_y, size_x).
+        spacing (tuple): Spacing (dx, dy, dz) between nodes.
+        electrodes (array_like): Positions of the electrodes, one row (x, y, z) per electrode, with
+            the node (i, j, k) at (i*dx, j*dy, k*dz).
+        cutoff (float): If given, only the nodes closer than cutoff to an electrode contribute to it.
+
+    Returns:
+        A tuple (nodes, weights): the ids of the nodes with a non-zero weight and their weights,
+        with one row per node and one column per electrode.
+    """
+    live = np.asarray(live, dtype=bool)
+    electrodes = np.atleast_2d(np.asarray(electrodes, dtype=np.float64))
+    spacing = np.asarray(spacing, dtype=np.float64)
+    volume = np.prod(spacing)
+    # Coordinates of the nodes along x, y and z, and the array axis of each one
+    coords = [np.arange(n) * h for n, h in zip(live.shape[::-1], spacing)]
+    axes = (2, 1, 0)
+
+    # Live neighbours at each side of the nodes, along each axis
+    neighbours = []
+    for axis in axes:
+        plus = np.zeros_like(live)
+        minus = np.zeros_like(live)
+        inner = [slice(None)] * 3
+        outer = [slice(None)] * 3
+        inner[axis] = slice(None, -1)
+        outer[axis] = slice(1, None)
+        plus[tuple(inner)] = live[tuple(outer)]
+        minus[tuple(outer)] = live[tuple(inner)]
+        neighbours.append((plus & live, minus & live, tuple(inner), tuple(outer)))
+
+    weights = np.zeros((len(electrodes),) + live.shape, dtype=np.float64)
+    for e, electrode in enumerate(electrodes):
+        d = [c - p for c, p in zip(coords, electrode)]
+        r2 = d[0][None, None, :]**2 + d[1][None, :, None]**2 + d[2][:, None, None]**2
+        # Nodes at the electrode are considered half a node away
+        r = np.maximum(np.sqrt(r2), 0.5 * spacing.min())
+        contributes = live if cutoff is None else live & (r <= cutoff)
+        w = weights[e]
+        for d_axis, h, axis, (plus, minus, inner, outer) in zip(d, spacing, axes, neighbours):
+            shape = [1, 1, 1]
+            shape[axis] = -1
+            # Term of each node: -grad(1/r) along the axis * dV. grad(1/r) = -(x - e) / r^3
+            term = np.where(contributes, volume * d_axis.reshape(shape) / r**3, 0.0)
+            both = plus & minus
+            step = np.where(both, term / (2 * h), term / h)
+            to_plus = np.where(plus, step, 0.0)
+            to_minus = np.where(minus, step, 0.0)
+            # d(AP)/dx ~ (AP[+1] - AP[-1]) / 2h, (AP[+1] - AP) / h or (AP - AP[-1]) / h
+            w[outer] += to_plus[inner]
+            w[inner] -= to_minus[outer]
+            w -= np.where(plus & ~minus, to_plus, 0.0)
+            w += np.where(minus & ~plus, to_minus, 0.0)
+
+    weights = weights.reshape(len(electrodes), -1).T
+    nodes = np.flatnonzero(np.any(weights != 0.0, axis=1))
+    return nodes, weights[nodes].astype(np.float32)
+
+
+def save_electrogram(file_name, times, signals):
+    """
+    Save a pseudo-ECG, as given by CardiacTissue.GetElectrogram, to a CSV file with the
+    columns Time, lead_0, lead_1, ...
+    """
+    header = ",".join(["Time"] + [f"lead_{i}" for i in range(signals.shape[1])])
+    np.savetxt(file_name, np.column_stack([times, signals]), delimiter=",", header=header, comments="")
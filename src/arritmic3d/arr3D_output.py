@@ -0,0 +1,563 @@
+import json
+import os
+import queue
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pyvista as pv
+
+# XDMF topology of the VTK cell types of a thresholded grid, and the order of their points in XDMF
+XDMF_CELL_TYPES = {
+    pv.CellType.VOXEL: ("Hexahedron", [0, 1, 3, 2, 4, 5, 7, 6]),
+    pv.CellType.HEXAHEDRON: ("Hexahedron", [0, 1, 2, 3, 4, 5, 6, 7]),
+    pv.CellType.PIXEL: ("Quadrilateral", [0, 1, 3, 2]),
+    pv.CellType.QUAD: ("Quadrilateral", [0, 1, 2, 3]),
+}
+
+
+def extract_live_grid(grid, mask=None, stride=1):
+    """
+    Extract the live nodes (restitution_model > 0) of the grid.
+    If mask is given, only the nodes where it is True are extracted. With a stride greater than 1,
+    the grid is first decimated to one node every stride nodes along each axis; stride is an int
+    or a tuple (sx, sy, sz). The decimation starts at the first extracted node along each axis
+    and always keeps the last one, so the padding VOID layers do not hide the tissue.
+    Returns the extracted unstructured grid and the ids in grid of its points.
+    """
+    stride = np.broadcast_to(np.asarray(stride, dtype=np.int64), 3)
+    if np.any(stride < 1):
+        raise ValueError(f"The output stride must be at least 1, got {stride.tolist()}.")
+    if np.any(stride > 1):
+        # Bounding box of the nodes to extract, as (z, y, x) indices
+        live = np.asarray(grid.point_data['restitution_model']) > 0.5
+        if mask is not None:
+            live &= np.asarray(mask, dtype=bool)
+        live = live.reshape(grid.dimensions[::-1])
+        if not live.any():
+            raise ValueError("The output region has no cells with all their nodes live.")
+        axes = []
+        for axis, step in enumerate(stride[::-1]):
+            indices = np.flatnonzero(np.moveaxis(live, axis, 0).any(axis=(1, 2)))
+            decimated = np.arange(indices[0], indices[-1] + 1, step)
+            if decimated[-1] != indices[-1]:
+                decimated = np.append(decimated, indices[-1])
+            axes.append(decimated)
+        # Structured grid of the decimated nodes, with their point data
+        ids = np.arange(grid.n_points).reshape(grid.dimensions[::-1])[np.ix_(*axes)]
+        ids_grid = pv.StructuredGrid()
+        ids_grid.points = grid.points[ids.ravel()]
+        ids_grid.dimensions = ids.shape[::-1]
+        ids = ids.ravel()
+        for name in grid.point_data.keys():
+            ids_grid.point_data[name] = np.asarray(grid.point_data[name])[ids]
+    else:
+        ids = np.arange(grid.n_points)
+        ids_grid = grid.copy(deep=False)
+    ids_grid.point_data['vtkOriginalPointIds'] = ids
+
+    if mask is None:
+        live_grid = ids_grid.threshold(0.5, scalars="restitution_model", all_scalars=True)
+    else:
+        live = (np.asarray(grid.point_data['restitution_model']) > 0.5) & np.asarray(mask, dtype=bool)
+        ids_grid.point_data['vtkOutputMask'] = live[ids].astype(np.uint8)
+        live_grid = ids_grid.threshold(0.5, scalars="vtkOutputMask", all_scalars=True)
+        live_grid.point_data.remove('vtkOutputMask')
+    live_ids = np.asarray(live_grid.point_data.pop('vtkOriginalPointIds'))
+    if live_grid.n_points == 0:
+        raise ValueError("The output region has no cells with all their nodes live.")
+    return live_grid, live_ids
+
+
+def xdmf_number_type(dtype):
+    """ NumberType and Precision attributes of an XDMF DataItem of the given dtype. """
+    dtype = np.dtype(dtype)
+    return {"NumberType": "Int" if dtype.kind in "iu" else "Float", "Precision": str(dtype.itemsize)}
+
+
+def reopen_truncated(file_name, size):
+    """
+    Open a binary file to append to it, after removing its contents beyond size bytes.
+    Used to resume a time series from a checkpoint.
+    """
+    if os.path.getsize(file_name) < size:
+        raise ValueError(f"{file_name} is shorter than expected ({size} bytes).")
+    f = open(file_name, "r+b")
+    f.truncate(size)
+    f.seek(size)
+    return f
+
+
+class XdmfSeries:
+    """
+    Time series of snapshots of the live nodes, saved as a single XDMF file that ParaView can open.
+
+    The mesh is written once. Each field is appended, one frame per snapshot, to its own raw
+    binary file <base_name>_<field>.bin, so a field can be read over time with load_xdmf_field
+    without loading the others. The XDMF index <base_name>.xdmf is written by close().
+    """
+
+    def __init__(self, base_name, live_grid):
+        """
+        Args:
+            base_name (str): Path of the output files, without extension.
+            live_grid: pyvista unstructured grid of the live nodes, as given by extract_live_grid.
+        """
+        cell_types = np.unique(live_grid.celltypes)
+        if len(cell_types) != 1 or cell_types[0] not in XDMF_CELL_TYPES:
+            raise ValueError(f"XDMF output needs a grid of voxels or hexahedra, got cell types {cell_types.tolist()}.")
+        topology_type, order = XDMF_CELL_TYPES[cell_types[0]]
+
+        self.base_name = base_name
+        self.n_points = live_grid.n_points
+        self.n_cells = live_grid.n_cells
+        self.topology_type = topology_type
+        self.points_per_cell = len(order)
+        self.times = []
+        self.files = {}
+        self.dtypes = {}
+
+        cells = live_grid.cell_connectivity.reshape(self.n_cells, len(order))[:, order]
+        cells.astype(np.int32).tofile(self._file_name("topology"))
+        np.asarray(live_grid.points, dtype=np.float32).tofile(self._file_name("geometry"))
+        self.static_fields = {}
+        if "restitution_model" in live_grid.point_data:
+            self.static_fields["restitution_model"] = np.int32
+            np.asarray(live_grid.point_data["restitution_model"], dtype=np.int32).tofile(self._file_name("restitution_model"))
+
+    def _file_name(self, field):
+        return f"{self.base_name}_{field}.bin"
+
+    def append(self, time, fields):
+        """ Append a snapshot. fields is a dictionary with an array of values of the live nodes for each field. """
+        for name, values in fields.items():
+            if name not in self.files:
+                self.files[name] = open(self._file_name(name), "wb")
+                self.dtypes[name] = values.dtype
+            values.tofile(self.files[name])
+        self.times.append(float(time))
+
+    def flush(self):
+        """ Flush the field files. """
+        for f in self.files.values():
+            f.flush()
+
+    def get_state(self):
+        """ State of the series, to resume it with restore(). The files must have been flushed. """
+        return {"times": self.times, "dtypes": {name: dtype.str for name, dtype in self.dtypes.items()}}
+
+    def restore(self, state):
+        """ Resume the series from a state given by get_state(). The snapshots appended after it are removed. """
+        self.times = list(state["times"])
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in state["dtypes"].items()}
+        for name, dtype in self.dtypes.items():
+            self.files[name] = reopen_truncated(self._file_name(name), len(self.times) * self.n_points * dtype.itemsize)
+
+    def close(self):
+        """ Close the field files and write the XDMF index. """
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+        xdmf = ET.Element("Xdmf", Version="2.0")
+        domain = ET.SubElement(xdmf, "Domain")
+        topology = ET.SubElement(domain, "Topology", Name="Mesh", TopologyType=self.topology_type,
+                                 NumberOfElements=str(self.n_cells))
+        self._data_item(topology, "topology", np.int32, f"{self.n_cells} {self.points_per_cell}")
+        geometry = ET.SubElement(domain, "Geometry", Name="Points", GeometryType="XYZ")
+        self._data_item(geometry, "geometry", np.float32, f"{self.n_points} 3")
+
+        series = ET.SubElement(domain, "Grid", Name="TimeSeries", GridType="Collection", CollectionType="Temporal")
+        for frame, time in enumerate(self.times):
+            grid = ET.SubElement(series, "Grid", Name=f"frame_{frame}", GridType="Uniform")
+            ET.SubElement(grid, "Time", Value=repr(time))
+            ET.SubElement(grid, "Topology", Reference="/Xdmf/Domain/Topology[@Name='Mesh']")
+            ET.SubElement(grid, "Geometry", Reference="/Xdmf/Domain/Geometry[@Name='Points']")
+            for name, dtype in self.static_fields.items():
+                attribute = ET.SubElement(grid, "Attribute", Name=name, AttributeType="Scalar", Center="Node")
+                self._data_item(attribute, name, dtype, str(self.n_points))
+            for name, dtype in self.dtypes.items():
+                attribute = ET.SubElement(grid, "Attribute", Name=name, AttributeType="Scalar", Center="Node")
+                self._data_item(attribute, name, dtype, str(self.n_points), seek=frame * self.n_points * dtype.itemsize)
+
+        ET.indent(xdmf)
+        ET.ElementTree(xdmf).write(f"{self.base_name}.xdmf", xml_declaration=True, encoding="utf-8")
+
+    def _data_item(self, parent, field, dtype, dimensions, seek=0):
+        item = ET.SubElement(parent, "DataItem", Dimensions=dimensions, Format="Binary", Endian="Little",
+                             Seek=str(seek), **xdmf_number_type(dtype))
+        # Relative to the XDMF file
+        item.text = os.path.basename(self._file_name(field))
+
+
+def load_xdmf_field(xdmf_file, field):
+    """
+    Load a field of an XDMF time series written by the simulation, without reading the other fields.
+    Returns the times of the snapshots and a read-only memory-mapped array of shape
+    (snapshots, live nodes).
+    """
+    root = ET.parse(xdmf_file).getroot()
+    grids = root.findall("./Domain/Grid[@CollectionType='Temporal']/Grid")
+    times = np.array([float(grid.find("Time").get("Value")) for grid in grids])
+    if not grids:
+        return times, np.empty((0, 0), dtype=np.float32)
+
+    item = grids[0].find(f"./Attribute[@Name='{field}']/DataItem")
+    if item is None:
+        raise ValueError(f"Field {field} not found in {xdmf_file}.")
+    dtype = np.dtype(f"{'i' if item.get('NumberType') == 'Int' else 'f'}{item.get('Precision')}").newbyteorder("<")
+    n_points = int(item.get("Dimensions"))
+    file_name = os.path.join(os.path.dirname(xdmf_file), item.text.strip())
+    return times, np.memmap(file_name, dtype=dtype, mode="r", shape=(len(grids), n_points))
+
+
+def save_beat_maps(tissue, grid, base_name, finished_only=False):
+    """
+    Save the activation maps recorded by the tissue (see SetBeatRecorder), one file
+    <base_name>_beat_<beat>.vtu per beat with the LAT, APD, DI and CV of the live nodes.
+    With finished_only, only the beats older than the oldest beat of the nodes still active or
+    waiting for activation are saved, as their maps can no longer change.
+    The saved maps are discarded from the tissue.
+    Returns the names of the saved files.
+    """
+    beats = tissue.GetRecordedBeats()
+    if finished_only and beats:
+        fields = tissue.GetFields(["State", "Beat"])
+        pending = fields["Beat"][fields["State"] != 0]  # CellActivationState::INACTIVE
+        if pending.size > 0:
+            beats = [beat for beat in beats if beat < pending.min()]
+    if not beats:
+        return []
+
+    live_grid, live_ids = extract_live_grid(grid)
+    file_names = []
+    for beat in beats:
+        for name, values in tissue.GetBeatMaps(beat).items():
+            live_grid.point_data[name] = values[live_ids]
+        live_grid.field_data['Beat'] = beat
+        file_name = f"{base_name}_beat_{beat:03d}.vtu"
+        live_grid.save(file_name)
+        tissue.EraseBeatMaps(beat)
+        file_names.append(file_name)
+    return file_names
+
+
+def map_binary_file(file_name, dtype):
+    """ Read-only memory map of a raw binary file. Empty files give an empty array. """
+    if os.path.getsize(file_name) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(file_name, dtype=dtype, mode="r")
+
+
+class DeltaSeries:
+    """
+    Time series of snapshots of the live nodes that only stores the nodes that changed.
+
+    Every keyframe_period snapshots, a keyframe stores all the live nodes. The snapshots in
+    between store the positions in the live grid of the nodes that changed since the previous
+    snapshot, in <base_name>_positions.bin, and their values, in <base_name>_<field>.bin.
+    The candidates to change are the nodes given by the change tracking of the tissue
+    (SetChangeTracking) and the active nodes, whose AP changes with time.
+    The mesh of the live nodes is saved to <base_name>_mesh.vtu, and the index
+    <base_name>.delta.json is written by close(). DeltaSeriesReader rebuilds the snapshots.
+    """
+
+    ACTIVE = 2  # CellActivationState::ACTIVE
+
+    def __init__(self, base_name, live_grid, live_ids, n_nodes, output_fields, keyframe_period=100):
+        """
+        Args:
+            base_name (str): Path of the output files, without extension.
+            live_grid: pyvista unstructured grid of the live nodes, as given by extract_live_grid.
+            live_ids: Ids in the tissue of the points of live_grid.
+            n_nodes (int): Number of nodes of the tissue.
+            output_fields (dict): Fields to save, as VTK name -> tissue field name.
+            keyframe_period (int): Number of snapshots between two keyframes.
+        """
+        if set(output_fields.values()) & {"DI", "Life"}:
+            raise ValueError("DI and Life change with time in all the nodes, they cannot be saved in a delta-encoded series.")
+        self.base_name = base_name
+        self.output_fields = output_fields
+        self.keyframe_period = max(keyframe_period, 1)
+        self.live_ids = live_ids
+        self.live_position = np.full(n_nodes, -1, dtype=np.int64)
+        self.live_position[live_ids] = np.arange(len(live_ids))
+        # State is needed to find the active nodes
+        self.tissue_fields = list(dict.fromkeys(list(output_fields.values()) + ["State"]))
+        self.current = None
+        self.active = np.empty(0, dtype=np.int64)
+        self.n_snapshots = 0
+
+        self.frames = []
+        self.dtypes = {}
+        self.files = {}
+        self.n_positions = 0
+        self.n_values = 0
+        live_grid.save(f"{base_name}_mesh.vtu")
+
+    def _file_name(self, field):
+        return f"{self.base_name}_{field}.bin"
+
+    def fill(self, tissue, buffer):
+        """ Copy into buffer the values of the nodes that changed since the previous snapshot. """
+        buffer.clear()
+        # After restore() there are no previous values, the first snapshot is a keyframe
+        if self.current is None or self.n_snapshots % self.keyframe_period == 0:
+            if not tissue.GetChangeTracking():
+                tissue.SetChangeTracking(True)
+            tissue.GetChangedNodes()
+            fields = tissue.GetFields(self.tissue_fields)
+            self.current = {name: values[self.live_ids] for name, values in fields.items()}
+            positions = None
+            values = {name: self.current[name].copy() for name in self.output_fields.values()}
+        else:
+            changed = self.live_position[tissue.GetChangedNodes()]
+            candidates = np.union1d(changed[changed >= 0], self.active)
+            fields = tissue.GetFields(self.tissue_fields, None, self.live_ids[candidates])
+            is_changed = np.zeros(len(candidates), dtype=bool)
+            for name in self.output_fields.values():
+                is_changed |= fields[name] != self.current[name][candidates]
+            for name in self.tissue_fields:
+                self.current[name][candidates] = fields[name]
+            positions = candidates[is_changed].astype(np.int32)
+            values = {name: fields[name][is_changed] for name in self.output_fields.values()}
+
+        self.active = np.flatnonzero(self.current["State"] == self.ACTIVE)
+        self.n_snapshots += 1
+        buffer["positions"] = positions
+        for vtk_name, field_name in self.output_fields.items():
+            buffer[vtk_name] = values[field_name]
+
+    def append(self, time, buffer):
+        """ Append a snapshot filled by fill(). """
+        positions = buffer["positions"]
+        count = len(self.live_ids) if positions is None else len(positions)
+        frame = {"time": float(time), "keyframe": positions is None, "count": count,
+                 "positions_offset": self.n_positions, "values_offset": self.n_values}
+        if positions is not None:
+            self._write("positions", positions)
+            self.n_positions += count
+        for vtk_name in self.output_fields:
+            self._write(vtk_name, buffer[vtk_name])
+        self.n_values += count
+        self.frames.append(frame)
+
+    def _write(self, name, values):
+        if name not in self.files:
+            self.files[name] = open(self._file_name(name), "wb")
+            self.dtypes[name] = values.dtype
+        values.tofile(self.files[name])
+
+    def flush(self):
+        """ Flush the field files. """
+        for f in self.files.values():
+            f.flush()
+
+    def get_state(self):
+        """ State of the series, to resume it with restore(). The files must have been flushed. """
+        return {"n_snapshots": self.n_snapshots, "frames": self.frames, "n_positions": self.n_positions,
+                "n_values": self.n_values, "dtypes": {name: dtype.str for name, dtype in self.dtypes.items()}}
+
+    def restore(self, state):
+        """
+        Resume the series from a state given by get_state(). The snapshots appended after it are removed,
+        and the next snapshot is a keyframe.
+        """
+        self.n_snapshots = state["n_snapshots"]
+        self.frames = list(state["frames"])
+        self.n_positions = state["n_positions"]
+        self.n_values = state["n_values"]
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in state["dtypes"].items()}
+        self.current = None
+        self.active = np.empty(0, dtype=np.int64)
+        for name, dtype in self.dtypes.items():
+            count = self.n_positions if name == "positions" else self.n_values
+            self.files[name] = reopen_truncated(self._file_name(name), count * dtype.itemsize)
+
+    def close(self):
+        """ Close the field files and write the index. """
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+        index = {
+            "n_points": len(self.live_ids),
+            "mesh": os.path.basename(f"{self.base_name}_mesh.vtu"),
+            "positions": os.path.basename(self._file_name("positions")),
+            "fields": {name: {"file": os.path.basename(self._file_name(name)), "dtype": self.dtypes[name].str}
+                       for name in self.output_fields if name in self.dtypes},
+            "frames": self.frames,
+        }
+        with open(f"{self.base_name}.delta.json", "w") as f:
+            json.dump(index, f)
+
+
+class DeltaSeriesReader:
+    """
+    Rebuilds the snapshots of a delta-encoded time series (see DeltaSeries).
+    """
+
+    def __init__(self, index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+        dir_name = os.path.dirname(index_file)
+        self.frames = index["frames"]
+        self.times = np.array([frame["time"] for frame in self.frames])
+        self.mesh_file = os.path.join(dir_name, index["mesh"])
+        self.mesh = None
+        positions_file = os.path.join(dir_name, index["positions"])
+        self.positions = map_binary_file(positions_file, np.int32) if os.path.exists(positions_file) else np.empty(0, np.int32)
+        self.values = {name: map_binary_file(os.path.join(dir_name, field["file"]), np.dtype(field["dtype"]))
+                       for name, field in index["fields"].items()}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def get_frame(self, i, fields=None):
+        """ Get the values of the live nodes in snapshot i, as a dictionary field -> array. """
+        fields = list(self.values) if fields is None else fields
+        key = i
+        while not self.frames[key]["keyframe"]:
+            key -= 1
+
+        frame = self.frames[key]
+        begin = frame["values_offset"]
+        snapshot = {name: np.array(self.values[name][begin:begin + frame["count"]]) for name in fields}
+        for frame in self.frames[key + 1:i + 1]:
+            begin = frame["values_offset"]
+            positions = self.positions[frame["positions_offset"]:frame["positions_offset"] + frame["count"]]
+            for name in fields:
+                snapshot[name][positions] = self.values[name][begin:begin + frame["count"]]
+        return snapshot
+
+    def get_grid(self, i):
+        """ Get snapshot i as a pyvista grid of the live nodes, as saved in the VTK outputs. """
+        if self.mesh is None:
+            self.mesh = pv.read(self.mesh_file)
+        grid = self.mesh.copy()
+        for name, values in self.get_frame(i).items():
+            grid.point_data[name] = values
+        grid.field_data['Time'] = self.times[i]
+        return grid
+
+
+class SnapshotWriter:
+    """
+    Writes the VTK snapshots of a simulation in a background thread, so the simulation
+    goes on while the files are saved.
+
+    The fields of the output nodes of each snapshot are gathered by the tissue into one of n_buffers
+    preallocated sets of arrays. If all of them are waiting to be written, write() blocks until the
+    thread frees one. With n_buffers = 0 the snapshots are written synchronously.
+    """
+
+    def __init__(self, grid, output_fields, n_buffers=2, series_name=None, keyframe_period=0, mask=None, stride=1):
+        """
+        Args:
+            grid: pyvista grid of the tissue, with the 'restitution_model' point data.
+            output_fields (dict): Fields to save, as VTK name -> tissue field name.
+            n_buffers (int): Number of snapshots that can be waiting to be written.
+            series_name (str): If given, the snapshots are appended to the XDMF time series
+                series_name.xdmf (see XdmfSeries) instead of saved in one file each.
+            keyframe_period (int): If greater than 0, the series is delta-encoded with a keyframe
+                every keyframe_period snapshots (see DeltaSeries).
+            mask: If given, boolean array with one value per node of grid. Only the nodes where it
+                is True are saved.
+            stride (int or tuple): Save one node every stride nodes along each axis.
+        """
+        # restitution_model does not change during the simulation, so the output nodes are extracted
+        # once and each snapshot only gathers the output fields of those nodes
+        self.live_grid, self.live_ids = extract_live_grid(grid, mask, stride)
+        self.series = None
+        if series_name is not None and keyframe_period > 0:
+            self.series = DeltaSeries(series_name, self.live_grid, self.live_ids, grid.n_points, output_fields, keyframe_period)
+        elif series_name is not None:
+            self.series = XdmfSeries(series_name, self.live_grid)
+        self.output_fields = output_fields
+        self.error = None
+        self.thread = None
+
+        self.free_buffers = queue.Queue()
+        for _ in range(max(n_buffers, 1)):
+            self.free_buffers.put({})
+        if n_buffers > 0:
+            self.pending = queue.Queue()
+            self.thread = threading.Thread(target=self._run, name="SnapshotWriter", daemon=True)
+            self.thread.start()
+
+    def write(self, tissue, time, file_name=None):
+        """ Copy the output fields of the tissue and save them to file_name, or to the time series. """
+        self._check_error()
+        buffer = self.free_buffers.get()
+        if isinstance(self.series, DeltaSeries):
+            self.series.fill(tissue, buffer)
+        else:
+            tissue.GetFields(list(self.output_fields.values()), buffer, self.live_ids)
+        if self.thread is None:
+            self._save(buffer, time, file_name)
+            self.free_buffers.put(buffer)
+        else:
+            self.pending.put((buffer, time, file_name))
+
+    def flush(self):
+        """ Wait until the snapshots given to write() are saved, and flush the files of the time series. """
+        if self.thread is not None:
+            self.pending.join()
+        self._check_error()
+        if self.series is not None:
+            self.series.flush()
+
+    def get_state(self):
+        """ State of the time series, to resume it with restore() from a checkpoint. flush() must be called first. """
+        return self.series.get_state() if self.series is not None else None
+
+    def restore(self, state):
+        """ Resume the time series from a state given by get_state(). """
+        if self.series is not None:
+            self.series.restore(state)
+
+    def close(self):
+        """ Wait until all the snapshots are written and stop the thread. """
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.series is not None:
+            self.series.close()
+            self.series = None
+        self._check_error()
+
+    def _check_error(self):
+        # Errors of the thread are raised in the simulation loop
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            buffer, time, file_name = item
+            try:
+                if self.error is None:
+                    self._save(buffer, time, file_name)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.free_buffers.put(buffer)
+                self.pending.task_done()
+
+    def _save(self, buffer, time, file_name):
+        if isinstance(self.series, DeltaSeries):
+            self.series.append(time, buffer)
+            return
+        live_fields = {vtk_name: buffer[field_name] for vtk_name, field_name in self.output_fields.items()}
+        if self.series is not None:
+            self.series.append(time, live_fields)
+            return
+        for vtk_name, values in live_fields.items():
+            # Assigned again so that VTK computes the range of the new values
+            self.live_grid.point_data[vtk_name] = values
+        self.live_grid.field_data['Time'] = time
+        self.live_grid.save(file_name)
@@ -0,0 +1,774 @@
+"""
+Spatial domain decomposition of a tissue for multi-process runs.
+
+The tissue is split into slabs along the z axis, and each slab is simulated by a
+CardiacTissue in its own process. Each subdomain keeps, besides the layers it owns,
+NEIGHBOURS_DISTANCE layers of ghost nodes on each side: read-only copies of the
+boundary nodes of the neighbour slabs.
+
+The subdomains advance in time windows no longer than the minimum travel time between
+two neighbours, so an activation in one window can only schedule activations in the
+next ones. Boundary nodes also read the state of their ghosts when they are activated, and
+the ghosts change when their owner activates them or schedules their activation. So the
+windows of two neighbour subdomains end before the nodes next to their common boundary (the
+edge nodes) are activated in a different order than in a single tissue: by time and, at the
+same time, by node. After each window, each subdomain publishes in shared memory the state of its
+boundary nodes and the activations it scheduled for its ghost nodes, and after a barrier
+reads those of its neighbours. The blocks are double-buffered, so one barrier per window
+is enough. The coordinator only sends one command for all the windows up to the next
+system event: the subdomains publish their next event times in a shared control block,
+and all of them compute the same windows from it.
+
+The results are the same as those of a single tissue.
+"""
+
+import heapq
+import json
+import multiprocessing
+import threading
+import weakref
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+import arritmic3d
+from ._core import NEIGHBOURS_DISTANCE
+
+MAX_TIME = float(np.finfo(np.float32).max)
+
+
+def _layout(arrays):
+    """ Offsets and shapes of a list of (name, dtype, shape) arrays in a shared memory block, and its size. """
+    layout = {}
+    offset = 0
+    for name, dtype, shape in arrays:
+        # Aligned to 8 bytes for the float64 arrays
+        offset = (offset + 7) // 8 * 8
+        layout[name] = (offset, dtype, shape)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, max(offset, 1)
+
+
+def _block_layout(n_boundary, n_ghost):
+    """
+    Offsets and shapes of the arrays of a subdomain in its shared memory block. There are two
+    buffers of each array, used in alternate windows.
+    """
+    n_fields = 6  # CardiacTissue::num_state_fields
+    return _layout([("states", np.float32, (2, n_boundary, n_fields)),
+                    ("times", np.float32, (2, n_ghost)),
+                    ("parents", np.int32, (2, n_ghost)),
+                    ("potentials", np.float32, (2, n_ghost))])
+
+
+def _control_layout(n_partitions):
+    """
+    Offsets and shapes of the control block, shared by all the subdomains. After each window, each
+    one publishes its time, its next event time, the earliest activation of the nodes next to its low and
+    high neighbours, the earliest activation it sent to each of them and whether it sent new boundary
+    states and ghost activations. There are two buffers of each array.
+    """
+    return _layout([("times", np.float64, (2, n_partitions)),
+                    ("next_times", np.float64, (2, n_partitions)),
+                    ("edge_times", np.float64, (2, n_partitions, 2)),
+                    ("sent_times", np.float64, (2, n_partitions, 2)),
+                    ("exported", np.bool_, (2, n_partitions, 2))])
+
+
+def _window_end(t_node, lookahead, t_system, priority, t_stop):
+    """ End of the window of node events starting at t_node. At least the events at t_node are processed. """
+    return min(t_node + lookahead,
+               t_system if priority == 0 else float(np.nextafter(np.float32(t_system), np.float32(np.inf))),
+               max(float(np.nextafter(np.float32(t_stop), np.float32(np.inf))),
+                   float(np.nextafter(np.float32(t_node), np.float32(np.inf)))))
+
+
+def _edge_window_ends(t_node, edge_times, sent_times):
+    """
+    Latest end of the window starting at t_node of each subdomain, so that the nodes on both sides
+    of the boundary between two subdomains are activated in the order of a single tissue: by time
+    and, at the same time, first those of the lower subdomain. They are computed from the earliest
+    activation of the edge nodes next to the low and high neighbours of each subdomain and the earliest
+    activation each one sent to them. Both are lower bounds, which can only make the windows shorter.
+    The events are not earlier than t_node, so earlier times are left by nodes without pending activations.
+    """
+    # Earliest activation of the edge nodes on both sides of each boundary
+    first = np.stack([np.minimum(edge_times[:-1, 1], sent_times[1:, 0]),
+                      np.minimum(edge_times[1:, 0], sent_times[:-1, 1])], axis=1)
+    first = np.where(first < t_node, MAX_TIME, first).astype(np.float32)
+    t_end = np.full(len(edge_times), MAX_TIME)
+    for i, (a, b) in enumerate(first):
+        if a != b:
+            t_end[i:i + 2] = np.minimum(t_end[i:i + 2], max(a, b))
+        else:
+            # The upper subdomain activates its edge nodes at that time in the next window
+            t_end[i] = min(t_end[i], float(np.nextafter(a, np.float32(np.inf))))
+            t_end[i + 1] = min(t_end[i + 1], float(a))
+    return t_end
+
+
+def _block_arrays(shm, layout):
+    """ Numpy views of the arrays of a shared memory block. """
+    return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            for name, (offset, dtype, shape) in layout.items()}
+
+
+def _slice_nodes(values, n_nodes, begin, end):
+    """ Slice a per-node list. Lists with a single value, shared by all the nodes, are kept. """
+    if len(values) == n_nodes:
+        return list(values[begin:end])
+    return list(values)
+
+
+class _Barrier:
+    """
+    Barrier of the processes of the subdomains. At each wait, a process releases once the semaphore
+    of each of the others and acquires its own once for each of them. Each process is woken up
+    at most once per wait, which makes it much cheaper than multiprocessing.Barrier.
+    """
+
+    # Seconds between the checks of abort() while waiting
+    ABORT_CHECK_PERIOD = 0.1
+
+    def __init__(self, context, n_processes):
+        self.semaphores = [context.Semaphore(0) for _ in range(n_processes)]
+        self.broken = context.Event()
+
+    def wait(self, index):
+        """ Wait until all the processes reach the barrier. index is the position of the calling process. """
+        for i, semaphore in enumerate(self.semaphores):
+            if i != index:
+                semaphore.release()
+        for _ in range(len(self.semaphores) - 1):
+            while not self.semaphores[index].acquire(timeout=self.ABORT_CHECK_PERIOD):
+                if self.broken.is_set():
+                    raise threading.BrokenBarrierError()
+
+    def abort(self):
+        """ Make the waiting processes, and those that wait later, raise BrokenBarrierError. """
+        self.broken.set()
+
+
+def _run_subdomain(conn, barrier, spec):
+    """
+    Main loop of the process of a subdomain.
+    The coordinator sends commands through conn, and each of them is answered. The windows of
+    the "run" and "synchronize" commands are synchronized with the other subdomains by barrier.
+    """
+    tissue = arritmic3d.CardiacTissue(*spec["size"], *spec["spacing"],
+                                      getattr(arritmic3d.EventQueueType, spec["queue_type"]))
+    tissue.InitModels(*spec["models"])
+    tissue.SetInitialAPD(spec["initial_apd"])
+    tissue.InitPy(spec["cell_types"], spec["parameters"], spec["fiber_orientation"])
+    tissue.SetExchangeNodes(spec["boundary_ids"], spec["ghost_ids"])
+
+    # Shared memory blocks: this subdomain and its neighbours (None at the ends of the tissue)
+    blocks = {}
+    arrays = {}
+    for key in ("own", "prev", "next", "control"):
+        if spec[key] is None:
+            continue
+        name, layout = spec[key]
+        blocks[key] = shared_memory.SharedMemory(name=name)
+        arrays[key] = _block_arrays(blocks[key], layout)
+    own = arrays["own"]
+    control = arrays["control"]
+    index = spec["index"]
+    neighbours = [(key, spec[key + "_index"], block)
+                  for key, block in (("prev", slice(-spec["n_boundary_low"], None)), ("next", slice(0, spec["n_boundary_high"])))
+                  if key in arrays]
+    boundary_states = np.empty_like(own["states"][0])
+    published_states = np.empty_like(own["states"][0])
+    # Low ghosts first, then the high ones
+    ghost_blocks = {"prev": slice(0, spec["n_boundary_low"]), "next": slice(spec["n_boundary_low"], None)}
+    ghost_states = np.empty((len(spec["ghost_ids"]), boundary_states.shape[1]), dtype=boundary_states.dtype)
+
+    def run_window(t_end, buffer, debug=0, force=False):
+        """
+        Process the events earlier than t_end, publish the boundary in the given buffer and read what
+        the neighbours published. With force, the boundary states are sent even if they did not change.
+        Returns the time of the subdomains, the time of their next event and the latest end of the next
+        window of this subdomain for its edge nodes.
+        """
+        tissue.RunWindow(t_end, debug)
+        tissue.GetBoundaryStates(boundary_states.reshape(-1))
+        states_changed = force or not np.array_equal(boundary_states, published_states)
+        if states_changed:
+            own["states"][buffer] = boundary_states
+            published_states[:] = boundary_states
+        times, parents, potentials = own["times"][buffer], own["parents"][buffer], own["potentials"][buffer]
+        tissue.ExportGhostActivations(times, parents, potentials)
+        sent = parents >= 0
+        control["times"][buffer, index] = tissue.GetTime()
+        control["next_times"][buffer, index] = tissue.GetNextEventTime()
+        # The low ghost nodes are before the high ones. The stimuli of the protocol may activate edge nodes.
+        t_stimulus = tissue.GetNextStimulusTime()
+        for side, (edge, ghosts) in enumerate(zip(spec["edge_ids"], (slice(0, spec["n_boundary_low"]), slice(spec["n_boundary_low"], None)))):
+            control["edge_times"][buffer, index, side] = min(tissue.GetNextActivationTime(edge), t_stimulus) if len(edge) else MAX_TIME
+            control["sent_times"][buffer, index, side] = times[ghosts][sent[ghosts]].min(initial=MAX_TIME)
+        control["exported"][buffer, index] = (states_changed, sent.any())
+        # The buffer of the next window can be written once all the subdomains have passed this barrier,
+        # as they have finished reading the previous one
+        barrier.wait(index)
+
+        # The low ghosts of this subdomain are the high boundary of the previous one, and its low
+        # boundary the high ghosts of the previous one: both blocks have the same nodes, in the
+        # same order. Likewise with the next one. Nothing is read if the neighbours have not
+        # published anything new: the states of a neighbour in this buffer are then those of an older window.
+        new_states = False
+        for key, i, block in neighbours:
+            if control["exported"][buffer, i, 0]:
+                ghost_states[ghost_blocks[key]] = arrays[key]["states"][buffer, block]
+                new_states = True
+        if new_states:
+            tissue.SetGhostStates(ghost_states)
+        new_activations = neighbours and control["exported"][buffer, [i for _, i, _ in neighbours], 1].any()
+        if new_activations:
+            times, parents, potentials = [], [], []
+            for key, _, block in neighbours:
+                other = arrays[key]
+                times.append(other["times"][buffer, block])
+                # Parent ids are local to the sender
+                p = other["parents"][buffer, block]
+                parents.append(np.where(p >= 0, p + spec[key + "_offset"] - spec["offset"], -1).astype(np.int32))
+                potentials.append(other["potentials"][buffer, block])
+            tissue.ImportActivations(np.concatenate(times), np.concatenate(parents), np.concatenate(potentials))
+        # The activations sent are imported by the neighbours, so the next event of all the subdomains is
+        # known without waiting for them. It may be too early if an imported activation is discarded, which
+        # only makes the next window shorter. The activations of edge nodes scheduled by the other nodes in
+        # the next window fall after its end, so the edge times also bound the activations in it.
+        t_node = float(min(control["next_times"][buffer].min(), control["sent_times"][buffer].min()))
+        return float(control["times"][buffer].max()), t_node, \
+            float(_edge_window_ends(t_node, control["edge_times"][buffer], control["sent_times"][buffer])[index])
+
+    conn.send((tissue.GetMinTravelTime(), tissue.GetNextEventTime()))
+    try:
+        while True:
+            command, args = conn.recv()
+            if command == "run":
+                # Windows up to the first system event, the end of the run or the end of the events.
+                # After each window all the subdomains read the same values from the control block,
+                # so they run the same windows.
+                t_system, priority, t_stop, lookahead, time, t_node, debug = args
+                # The boundaries may have changed since the last run: the first window only exchanges them
+                t_boundary = t_node
+                n_windows = 0
+                while time < t_stop:
+                    # Without system events, t_system is MAX_TIME with priority 0
+                    if t_system < t_node or (t_system == t_node and priority == 0):
+                        break
+                    t_end = min(_window_end(t_node, lookahead, t_system, priority, t_stop), t_boundary)
+                    window_time, t_node, t_boundary = run_window(t_end, n_windows % 2, debug)
+                    time = max(time, window_time)
+                    n_windows += 1
+                conn.send((time, n_windows, tissue.GetNextEventTime()))
+            elif command == "synchronize":
+                # Exchange the boundaries without processing any event
+                run_window(-MAX_TIME, 0, force=True)
+                conn.send(tissue.GetNextEventTime())
+            elif command == "activation":
+                # ExternalActivation or a stimulus of the protocol, that change the next event
+                method, method_args = args
+                getattr(tissue, method)(*method_args)
+                conn.send(tissue.GetNextEventTime())
+            elif command == "fields":
+                names, nodes = args
+                if nodes is None:
+                    fields = tissue.GetFields(names)
+                    conn.send({name: values[spec["owned"]] for name, values in fields.items()})
+                else:
+                    conn.send(tissue.GetFields(names, None, nodes))
+            elif command == "changed_nodes":
+                # Ghost nodes are changed by SetGhostStates, their owner reports them
+                owned = spec["owned"]
+                nodes = tissue.GetChangedNodes()
+                conn.send(nodes[(nodes >= owned.start) & (nodes < owned.stop)] + spec["offset"])
+            elif command == "sensors":
+                # Sensors in the ghost layers are reported by their owner
+                owned = spec["owned"]
+                if args[0] == "info":
+                    conn.send({node + spec["offset"]: data for node, data in tissue.GetSensorInfo().items()
+                               if owned.start <= node < owned.stop})
+                else:
+                    records = tissue.DrainSensorData() if args[0] == "drain" else tissue.GetSensorArray()
+                    records = records[(records["node_id"] >= owned.start) & (records["node_id"] < owned.stop)]
+                    records["node_id"] += spec["offset"]
+                    conn.send(records)
+            elif command == "beat_maps":
+                # A subdomain may have no activations of the beat in its nodes
+                beat, = args
+                if beat in tissue.GetRecordedBeats():
+                    conn.send({name: values[spec["owned"]] for name, values in tissue.GetBeatMaps(beat).items()})
+                else:
+                    conn.send(None)
+            elif command == "call":
+                method, method_args = args
+                conn.send(getattr(tissue, method)(*method_args))
+            elif command == "close":
+                break
+    except BaseException:
+        # The other subdomains may be waiting for this one
+        barrier.abort()
+        raise
+    finally:
+        for shm in blocks.values():
+            shm.close()
+        conn.close()
+
+
+def _close_subdomains(connections, processes, barrier, blocks):
+    """ Stop the processes of the subdomains and release the shared memory. """
+    barrier.abort()
+    for conn in connections:
+        try:
+            conn.send(("close", ()))
+            conn.close()
+        except (OSError, EOFError):
+            pass
+    for process in processes:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+
+class PartitionedTissue:
+    """
+    Tissue split into slabs along z, each one simulated in its own process.
+
+    It offers the methods of CardiacTissue used by run_arritmic3D, so it can replace it
+    in the simulation loop. Node ids are global, as in a CardiacTissue of the same size.
+    The processes are started by InitPy, and stopped by close() or when the object is
+    destroyed.
+    """
+
+    def __init__(self, size_x, size_y, size_z, dx, dy, dz, n_partitions, queue_type=arritmic3d.EventQueueType.HEAP):
+        h = NEIGHBOURS_DISTANCE
+        if size_z < n_partitions * h:
+            raise ValueError(f"Cannot split {size_z} layers in {n_partitions} partitions of at least {h} layers.")
+        self.dims = (size_x, size_y, size_z)
+        self.spacing = (dx, dy, dz)
+        self.n_partitions = n_partitions
+        self.queue_type = queue_type.name
+        self.layer_size = size_x * size_y
+        # First layer owned by each partition, and the end of the last one
+        self.z_bounds = [size_z * i // n_partitions for i in range(n_partitions + 1)]
+
+        self.models = None
+        self.initial_apd = None
+        self.time = 0.0
+        self.lookahead = MAX_TIME
+        self.next_times = []
+        self.timers = {}
+        self.system_events = []
+        self.n_system_events = 0
+        self.connections = []
+        self.processes = []
+        self.barrier = None
+        self._finalizer = None
+
+    # Initialization -----
+    def InitModels(self, fileAP, fileCV):
+        self.models = (fileAP, fileCV)
+
+    def SetInitialAPD(self, initial_apd):
+        self.initial_apd = initial_apd
+
+    def InitPy(self, cell_types, parameters, fiber_orientation=[[0.0, 0.0, 0.0]]):
+        """ Split the tissue and start the processes of the subdomains. """
+        if self.models is None or self.initial_apd is None:
+            raise RuntimeError("InitModels and SetInitialAPD must be called before InitPy.")
+        h = NEIGHBOURS_DISTANCE
+        n_nodes = self.layer_size * self.dims[2]
+        ls = self.layer_size
+
+        specs = []
+        blocks = []
+        for i in range(self.n_partitions):
+            z0, z1 = self.z_bounds[i], self.z_bounds[i + 1]
+            # The subdomain adds a layer of ghosts and the VOID border of the tissue on each inner side
+            lo = z0 - 2 * h if i > 0 else 0
+            hi = z1 + 2 * h if i < self.n_partitions - 1 else self.dims[2]
+            boundary = (list(range(z0 - lo, z0 - lo + h)) if i > 0 else []) + \
+                       (list(range(z1 - h - lo, z1 - lo)) if i < self.n_partitions - 1 else [])
+            ghosts = (list(range(z0 - h - lo, z0 - lo)) if i > 0 else []) + \
+                     (list(range(z1 - lo, z1 + h - lo)) if i < self.n_partitions - 1 else [])
+            boundary_ids = [z * ls + j for z in boundary for j in range(ls)]
+            ghost_ids = [z * ls + j for z in ghosts for j in range(ls)]
+            # Owned nodes whose activations change the ghosts of a neighbour: its boundary nodes and
+            # the nodes that schedule their activations
+            edges = [range(z0 - lo, min(z0 - lo + 2 * h, z1 - lo)) if i > 0 else range(0),
+                     range(max(z1 - 2 * h, z0) - lo, z1 - lo) if i < self.n_partitions - 1 else range(0)]
+
+            layout, nbytes = _block_layout(len(boundary_ids), len(ghost_ids))
+            blocks.append(shared_memory.SharedMemory(create=True, size=nbytes))
+            specs.append({
+                "size": (self.dims[0], self.dims[1], hi - lo),
+                "spacing": self.spacing,
+                "queue_type": self.queue_type,
+                "models": self.models,
+                "initial_apd": self.initial_apd,
+                "cell_types": _slice_nodes(cell_types, n_nodes, lo * ls, hi * ls),
+                "parameters": {name: _slice_nodes(values, n_nodes, lo * ls, hi * ls) for name, values in parameters.items()},
+                "fiber_orientation": _slice_nodes(fiber_orientation, n_nodes, lo * ls, hi * ls),
+                "boundary_ids": boundary_ids,
+                "ghost_ids": ghost_ids,
+                "edge_ids": [np.arange(edge.start * ls, edge.stop * ls) for edge in edges],
+                "n_boundary_low": h * ls if i > 0 else 0,
+                "n_boundary_high": h * ls if i < self.n_partitions - 1 else 0,
+                "offset": lo * ls,
+                "owned": slice((z0 - lo) * ls, (z1 - lo) * ls),
+                "own": (blocks[i].name, layout),
+            })
+
+        # The control block is created last, so it is not the block of a subdomain
+        control_layout, nbytes = _control_layout(self.n_partitions)
+        blocks.append(shared_memory.SharedMemory(create=True, size=nbytes))
+        for i, spec in enumerate(specs):
+            spec["index"] = i
+            spec["control"] = (blocks[-1].name, control_layout)
+            for key, j in (("prev", i - 1), ("next", i + 1)):
+                neighbour = specs[j] if 0 <= j < self.n_partitions else None
+                spec[key] = neighbour["own"] if neighbour is not None else None
+                spec[key + "_offset"] = neighbour["offset"] if neighbour is not None else 0
+                spec[key + "_index"] = j if neighbour is not None else -1
+
+        context = multiprocessing.get_context("spawn")
+        self.barrier = _Barrier(context, self.n_partitions)
+        for spec in specs:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_run_subdomain, args=(child_conn, self.barrier, spec), daemon=True)
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        self._finalizer = weakref.finalize(self, _close_subdomains, self.connections, self.processes, self.barrier, blocks)
+        self.offsets = [spec["offset"] for spec in specs]
+
+        ready = [self._receive(i) for i in range(self.n_partitions)]
+        # Windows no longer than the travel time between neighbours keep the subdomains causal
+        self.lookahead = min(travel_time for travel_time, _ in ready)
+        self.next_times = [next_time for _, next_time in ready]
+        self._synchronize()
+
+    def close(self):
+        """ Stop the processes of the subdomains. """
+        if self._finalizer is not None:
+            self._finalizer()
+
+    # Simulation -----
+    def _receive(self, i):
+        """ Wait for the answer of subdomain i. """
+        conn = self.connections[i]
+        process = self.processes[i]
+        # The pipe is not closed if the process dies while starting, so wait also for the process
+        if conn in wait([conn, process.sentinel]) or conn.poll():
+            try:
+                return conn.recv()
+            except EOFError:
+                pass
+        process.join()
+        # The other subdomains may be waiting for it at the barrier
+        self.barrier.abort()
+        raise RuntimeError(f"The process of subdomain {i} has finished with exit code {process.exitcode}.")
+
+    def _broadcast(self, command, *args):
+        for conn in self.connections:
+            conn.send((command, args))
+        answers = {}
+        # A subdomain waiting at a barrier for one that has died only answers after the barrier is aborted
+        while len(answers) < len(self.connections):
+            pending = [i for i in range(len(self.connections)) if i not in answers]
+            wait([self.connections[i] for i in pending] + [self.processes[i].sentinel for i in pending])
+            for i in pending:
+                if self.connections[i].poll() or not self.processes[i].is_alive():
+                    answers[i] = self._receive(i)
+        return [answers[i] for i in range(len(self.connections))]
+
+    def _run_windows(self, t_system, priority, t_stop, debug=0):
+        """
+        Process the node events in all the subdomains, window after window, until the first system event
+        (at t_system, with its priority), t_stop or the end of the events. Returns the number of windows.
+        """
+        answers = self._broadcast("run", t_system, priority, t_stop, self.lookahead, self.time, min(self.next_times), debug)
+        self.time = max(self.time, answers[0][0])
+        self.next_times = [next_time for _, _, next_time in answers]
+        return answers[0][1]
+
+    def _synchronize(self):
+        """ Exchange the boundaries without processing any event. """
+        self.next_times = self._broadcast("synchronize")
+
+    def SetTimer(self, type, period, initial_time=0.0):
+        """ Set a timer for a system event. There can be one timer for each type of system event. """
+        if type not in self.timers:
+            self._push_system_event(type, initial_time, 1)
+        self.timers[type] = period
+
+    def SetSystemEvent(self, type, time):
+        self._push_system_event(type, time, 0 if type == arritmic3d.SystemEventType.EXT_ACTIVATION else 1)
+
+    def _push_system_event(self, type, time, priority):
+        # System events with priority 0 are processed before the node events at the same time
+        heapq.heappush(self.system_events, (float(time), self.n_system_events, priority, type))
+        self.n_system_events += 1
+
+    def RunUntil(self, t_stop, stop_on=[arritmic3d.SystemEventType.EXT_ACTIVATION, arritmic3d.SystemEventType.FILE_WRITE], debug=0):
+        """
+        Run the simulation until t_stop or until a system event in stop_on.
+        Returns the type of the last event, or NO_EVENT if there are no more events.
+        """
+        tick = arritmic3d.SystemEventType.NO_EVENT
+        while self.time < t_stop:
+            t_node = min(self.next_times)
+            if self.system_events:
+                t_system, _, priority, system_type = self.system_events[0]
+            elif t_node >= MAX_TIME:
+                return arritmic3d.SystemEventType.NO_EVENT
+            else:
+                # No system events: the window is only limited by t_stop
+                t_system, priority, system_type = MAX_TIME, 0, None
+
+            if t_system < t_node or (t_system == t_node and priority == 0):
+                heapq.heappop(self.system_events)
+                self.time = t_system
+                self._broadcast("call", "AdvanceTime", (t_system,))
+                period = self.timers.get(system_type, 0.0)
+                if period > 0.0:
+                    self._push_system_event(system_type, t_system + period,
+                                            0 if system_type == arritmic3d.SystemEventType.EXT_ACTIVATION else 1)
+                tick = system_type
+                if system_type in stop_on:
+                    break
+                continue
+
+            # Windows of node events, up to the next system event
+            if self._run_windows(t_system, priority, t_stop, debug) > 0:
+                tick = arritmic3d.SystemEventType.NODE_EVENT
+        return tick
+
+    def _owner(self, nodes):
+        """ Index of the subdomain that owns each node. """
+        return np.searchsorted(self.z_bounds, nodes // self.layer_size, side="right") - 1
+
+    def _send_activations(self, method, nodes, per_node, *args):
+        """
+        Call an activation method in the subdomains that own the nodes, with their local ids. The arrays
+        in per_node have one value per node, or a single one for all the nodes.
+        """
+        nodes = np.asarray(nodes, dtype=np.int64).reshape(-1)
+        per_node = [np.asarray(values).reshape(-1) for values in per_node]
+        owner = self._owner(nodes)
+        for i, conn in enumerate(self.connections):
+            mask = owner == i
+            if not mask.any():
+                continue
+            values = [v[mask] if v.size == nodes.size else v for v in per_node]
+            conn.send(("activation", (method, (nodes[mask] - self.offsets[i], *values, *args))))
+            self.next_times[i] = self._receive(i)
+
+    def ExternalActivation(self, nodes, time, beat):
+        """ External activation of a set of nodes, given by their global ids. time and beat can have one value per node. """
+        self._send_activations("ExternalActivation", nodes, [time, beat])
+        self._synchronize()
+
+    def AddStimulusTrain(self, nodes, first_times, bcl, n_stims, first_beat=1):
+        """ Add a train of stimuli, see CardiacTissue.AddStimulusTrain. Each subdomain applies the stimuli of its nodes. """
+        self._send_activations("AddStimulusTrain", nodes, [first_times], list(bcl), list(n_stims), first_beat)
+
+    def AddStimuli(self, nodes, times, beats):
+        """ Add single stimuli, see CardiacTissue.AddStimuli. Each subdomain applies the stimuli of its nodes. """
+        self._send_activations("AddStimuli", nodes, [times, beats])
+
+    def ClearStimuli(self):
+        self._broadcast("call", "ClearStimuli", ())
+        self.next_times = self._broadcast("call", "GetNextEventTime", ())
+
+    def GetNextStimulusTime(self):
+        return min(self._broadcast("call", "GetNextStimulusTime", ()))
+
+    def GetTime(self):
+        return self.time
+
+    def GetNumEvents(self):
+        return sum(self._broadcast("call", "GetNumEvents", ()))
+
+    def GetIndex(self, x, y, z):
+        return z * self.layer_size + y * self.dims[0] + x
+
+    def size(self):
+        return self.layer_size * self.dims[2]
+
+    def GetSizeX(self):
+        return self.dims[0]
+
+    def GetSizeY(self):
+        return self.dims[1]
+
+    def GetSizeZ(self):
+        return self.dims[2]
+
+    # State -----
+    def SaveState(self, filename, compress=False):
+        """
+        Save the state of the simulation. Each subdomain saves its tissue to <filename>.<i>, and
+        filename keeps the time and the system events of the coordinator.
+        """
+        for i, conn in enumerate(self.connections):
+            conn.send(("call", ("SaveState", (f"{filename}.{i}", compress))))
+        for i in range(len(self.connections)):
+            self._receive(i)
+        state = {
+            "n_partitions": self.n_partitions,
+            "time": self.time,
+            "timers": {type.name: period for type, period in self.timers.items()},
+            # The list is a heap, it is saved in the same order
+            "system_events": [[time, n, priority, type.name] for time, n, priority, type in self.system_events],
+            "n_system_events": self.n_system_events,
+        }
+        with open(filename, "w") as f:
+            json.dump(state, f)
+
+    def LoadState(self, filename):
+        """ Load the state of the simulation saved by SaveState with the same partitions. It must be called after InitPy. """
+        with open(filename) as f:
+            state = json.load(f)
+        if state["n_partitions"] != self.n_partitions:
+            raise ValueError(f"{filename} was saved with {state['n_partitions']} partitions, the tissue has {self.n_partitions}.")
+        for i, conn in enumerate(self.connections):
+            conn.send(("call", ("LoadState", (f"{filename}.{i}",))))
+        for i in range(len(self.connections)):
+            self._receive(i)
+        types = arritmic3d.SystemEventType.__members__
+        self.time = state["time"]
+        self.timers = {types[name]: period for name, period in state["timers"].items()}
+        self.system_events = [(time, n, priority, types[name]) for time, n, priority, name in state["system_events"]]
+        self.n_system_events = state["n_system_events"]
+        self._synchronize()
+
+    # Data extraction -----
+    def GetFields(self, names, out=None, nodes=None):
+        """
+        Get several node fields of the whole tissue, or of the given nodes. Returns a dictionary
+        of numpy arrays. Arrays already in out are filled in place.
+        """
+        if nodes is None:
+            parts = self._broadcast("fields", names, None)
+        else:
+            nodes = np.asarray(nodes, dtype=np.int64)
+            owner = self._owner(nodes)
+            order = np.argsort(owner, kind="stable")
+            for i, conn in enumerate(self.connections):
+                conn.send(("fields", (names, nodes[owner == i] - self.offsets[i])))
+            parts = [self._receive(i) for i in range(len(self.connections))]
+        fields = {} if out is None else out
+        for name in names:
+            values = np.concatenate([part[name] for part in parts])
+            if nodes is not None:
+                # The parts follow the order of the owners, back to the order of nodes
+                values[order] = values.copy()
+            if name in fields and fields[name].shape == values.shape:
+                fields[name][:] = values
+            else:
+                fields[name] = values
+        return fields
+
+    def GetStates(self):
+        return self.GetFields(["State"])["State"]
+
+    def GetAPD(self):
+        return self.GetFields(["APD"])["APD"]
+
+    def GetCV(self):
+        return self.GetFields(["CV"])["CV"]
+
+    def GetLAT(self):
+        return self.GetFields(["LAT"])["LAT"]
+
+    def SetChangeTracking(self, enabled):
+        """ Enable or disable the tracking of the nodes that change. """
+        self._broadcast("call", "SetChangeTracking", (enabled,))
+
+    def GetChangeTracking(self):
+        """ Check if the nodes that change are tracked. """
+        self.connections[0].send(("call", ("GetChangeTracking", ())))
+        return self._receive(0)
+
+    def GetChangedNodes(self):
+        """ Get the global ids of the nodes changed since the last call. """
+        return np.concatenate(self._broadcast("changed_nodes"))
+
+    def SetBeatRecorder(self, enabled, first_beat=0, last_beat=-1):
+        """ Enable or disable the recording of the activation maps of the beats in [first_beat, last_beat]. """
+        self._broadcast("call", "SetBeatRecorder", (enabled, first_beat, last_beat))
+
+    def GetRecordedBeats(self):
+        """ Get the beats with recorded activations in any subdomain. """
+        return sorted(set().union(*self._broadcast("call", "GetRecordedBeats", ())))
+
+    def GetBeatMaps(self, beat):
+        """ Get the LAT, APD, DI and CV maps of a beat, with global node ids. """
+        parts = self._broadcast("beat_maps", beat)
+        if all(part is None for part in parts):
+            raise KeyError(f"No activations recorded for beat {beat}")
+        maps = {}
+        for name in ("LAT", "APD", "DI", "CV"):
+            maps[name] = np.concatenate([
+                part[name] if part is not None else np.full((z1 - z0) * self.layer_size, np.nan, dtype=np.float32)
+                for part, z0, z1 in zip(parts, self.z_bounds[:-1], self.z_bounds[1:])])
+        return maps
+
+    def EraseBeatMaps(self, beat):
+        """ Discard the maps of a beat. """
+        self._broadcast("call", "EraseBeatMaps", (beat,))
+
+    def SetElectrogram(self, nodes, weights, period, start_time=None):
+        """ Compute a pseudo-ECG while the simulation runs. Each subdomain sums the weights of its nodes. """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float32)
+        owner = self._owner(nodes)
+        start_time = self.time if start_time is None else start_time
+        for i, conn in enumerate(self.connections):
+            mine = owner == i
+            conn.send(("call", ("SetElectrogram", ((nodes[mine] - self.offsets[i]).tolist(), weights[mine], period, start_time))))
+        for i in range(len(self.connections)):
+            self._receive(i)
+
+    def GetNumLeads(self):
+        """ Get the number of leads of the pseudo-ECG, 0 if it is not computed. """
+        self.connections[0].send(("call", ("GetNumLeads", ())))
+        return self._receive(0)
+
+    def GetElectrogram(self):
+        """ Get the times and the samples of the pseudo-ECG, added over the subdomains. """
+        parts = self._broadcast("call", "GetElectrogram", ())
+        # Subdomains with no events left may not have reached the last samples of the others
+        n_samples = min(len(times) for times, _ in parts)
+        return parts[0][0][:n_samples], sum(signals[:n_samples] for _, signals in parts)
+
+    def GetSensorInfo(self):
+        """ Get sensor data collected during the simulation, with global node ids. """
+        sensor_data = {}
+        for part in self._broadcast("sensors", "info"):
+            sensor_data.update(part)
+        return dict(sorted(sensor_data.items()))
+
+    def GetSensorArray(self):
+        """ Get sensor data collected during the simulation as a structured array, with global node ids. """
+        return self._gather_sensor_records("array")
+
+    def DrainSensorData(self):
+        """ Get the sensor data collected since the last call, with global node ids, and remove it from the subdomains. """
+        return self._gather_sensor_records("drain")
+
+    def _gather_sensor_records(self, command):
+        # Records of all the subdomains, in time order
+        records = np.concatenate(self._broadcast("sensors", command))
+        return records[np.argsort(records["Time"], kind="stable")]
+
+    def GetSensorDataNames(self):
+        self.connections[0].send(("call", ("GetSensorDataNames", ())))
+        return self._receive(0)
@@ -0,0 +1,357 @@
+"""
+Search of the S2 coupling intervals that block, propagate or induce reentry.
+
+The S1 beats of the PROTOCOL are paced once, up to the shortest S2 coupling interval of the
+search, and the state of the tissue is saved. Each worker of a process pool loads it and
+evaluates candidate intervals on clones of the loaded tissue: it applies the extrastimuli
+(S2, or S2, S3, ... with the same coupling interval) at the S2 region, runs the observation
+time and counts the activations of each node. The candidates are refined around the intervals
+where the outcome changes, with one point per worker in each round (a bisection with one
+worker), until the brackets are shorter than the tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .arr3D_activations import parse_protocol_entry, resolve_activation_region, schedule_activation
+from .arr3D_config import load_case_config, load_config_file, make_default_config, resolve_models_in_parameters
+
+# Default search settings, overridden by S2_SEARCH in the configuration
+DEFAULT_SEARCH = {
+    "ACTIVATION_REGION": None,      # Nodes of the S2. Default: the region of the first PROTOCOL entry
+    "CI_RANGE": [150.0, 500.0],     # Shortest and longest coupling interval searched (ms)
+    "N_STIMS": 1,                   # Extrastimuli (S2, S3, ...), each one a coupling interval after the previous one
+    "TOLERANCE": 1.0,               # Width of the brackets of the thresholds (ms)
+    "OBSERVATION_TIME": 1000.0,     # Time simulated after the last extrastimulus (ms)
+    "BLOCK_FRACTION": 0.05,         # The extrastimuli block if all of them reach less than this fraction of the tissue
+    "PROPAGATION_FRACTION": 0.95,   # The extrastimuli propagate if all of them reach at least this fraction of the tissue
+    "N_WORKERS": None,              # Processes of the pool. Default: the number of CPUs
+}
+
+# Period of the samples of the LAT used to count the activations. It must be shorter than
+# the refractory period, so a node cannot be activated twice between two samples.
+SAMPLE_PERIOD = 10.0
+
+REPORT_FILE = "s2_search.json"
+
+# Branch point of the worker: the S1 tissue and the settings of the search
+_branch = None
+
+
+def pacing_offsets(bcl, n_stims):
+    """ Time of each stimulus of a pacing protocol from the first one (see CardiacTissue.AddStimulusTrain). """
+    offsets = []
+    t = 0.0
+    for b, (cl, n) in enumerate(zip(bcl, n_stims)):
+        for s in range(int(n)):
+            offsets.append(t)
+            t += bcl[b + 1] if b + 1 < len(bcl) and s + 1 >= n else cl
+    return np.array(offsets)
+
+
+def last_s1_stimulus(cfg, grid):
+    """
+    Time and beat of the last stimulus of the PROTOCOL, taken from its earliest node. The S2
+    coupling interval is measured from this time, and the extrastimuli have the next beat numbers.
+    """
+    if not cfg.get("PROTOCOL"):
+        raise ValueError("The S2 search needs a PROTOCOL with the S1 beats.")
+    t_s1, beat = -np.inf, 0
+    for protocol in cfg["PROTOCOL"]:
+        _, first_times, bcl, n_stims = parse_protocol_entry(protocol, grid)
+        offsets = pacing_offsets(bcl, n_stims)
+        if offsets.size:
+            t_s1 = max(t_s1, first_times.min() + offsets[-1])
+            beat = max(beat, protocol.get("FIRST_BEAT_NUM", 1) + offsets.size - 1)
+    return float(t_s1), int(beat)
+
+
+def _set_branch(tissue, settings):
+    """ Set the branch point of this process. """
+    global _branch
+    _branch = dict(settings, tissue=tissue)
+
+
+def _init_worker(vtk_file, cfg, state_file, settings):
+    """ Create the tissue of a worker and load the S1 state. """
+    from .arritmic3D import create_tissue, load_grid
+    with contextlib.redirect_stdout(io.StringIO()):
+        tissue = create_tissue(load_grid(vtk_file), cfg)
+    tissue.LoadState(state_file)
+    _set_branch(tissue, settings)
+
+
+def evaluate_s2(ci):
+    """
+    Apply the extrastimuli with coupling interval ci to a clone of the branch point and classify
+    their outcome.
+
+    Returns:
+        dict with the coupling interval "CI", the "OUTCOME" ("block", "partial" or "propagation"),
+        the fraction of the tissue out of the S2 region reached by all the extrastimuli ("ACTIVATED"),
+        the largest number of activations of a node ("MAX_ACTIVATIONS"), "REENTRY" (some node is
+        activated more times than the number of extrastimuli) and the wall time of the evaluation
+        in s ("TIME").
+    """
+    t0 = time.perf_counter()
+    tissue = _branch["tissue"].Clone()
+    nodes = _branch["s2_nodes"]
+    n_stims = _branch["n_stims"]
+    times = _branch["t_s1"] + ci * np.arange(1, n_stims + 1)
+    beats = _branch["s2_beat"] + np.arange(n_stims)
+    tissue.AddStimuli(np.tile(nodes, n_stims), np.repeat(times, nodes.size), np.repeat(beats, nodes.size))
+
+    # Activations of each node after the S2, from the changes of its LAT between samples. The
+    # last S1 wave may still be propagating at the branch point
+    lat = tissue.GetLAT()
+    n_activations = np.zeros(lat.size, dtype=np.int32)
+    t_end = times[-1] + _branch["observation_time"]
+    t = tissue.GetTime()
+    while t < t_end:
+        t = min(t + SAMPLE_PERIOD, t_end)
+        tissue.RunUntil(t, [])
+        new_lat = tissue.GetLAT()
+        n_activations += (new_lat != lat) & (new_lat >= np.float32(times[0]))
+        lat = new_lat
+
+    observed = _branch["observed"]
+    activated = float(np.count_nonzero(n_activations[observed] >= n_stims)) / max(np.count_nonzero(observed), 1)
+    if activated < _branch["block_fraction"]:
+        outcome = "block"
+    elif activated >= _branch["propagation_fraction"]:
+        outcome = "propagation"
+    else:
+        outcome = "partial"
+    return {
+        "CI": float(ci),
+        "OUTCOME": outcome,
+        "ACTIVATED": activated,
+        "MAX_ACTIVATIONS": int(n_activations.max()),
+        "REENTRY": bool(n_activations.max() > n_stims),
+        "TIME": time.perf_counter() - t0,
+    }
+
+
+def refine_candidates(results, tolerance, n_points):
+    """
+    Coupling intervals to evaluate in the next round: the brackets between consecutive
+    evaluated intervals with a different outcome or reentry, wider than tolerance, are split
+    with n_points points shared among them.
+    """
+    ordered = sorted(results, key=lambda r: r["CI"])
+    brackets = [(a["CI"], b["CI"]) for a, b in zip(ordered, ordered[1:])
+                if (a["OUTCOME"], a["REENTRY"]) != (b["OUTCOME"], b["REENTRY"]) and b["CI"] - a["CI"] > tolerance]
+    if not brackets:
+        return []
+    per_bracket = max(n_points // len(brackets), 1)
+    return [float(ci) for lo, hi in brackets for ci in np.linspace(lo, hi, per_bracket + 2)[1:-1]]
+
+
+def find_thresholds(results):
+    """
+    Thresholds of the S2 coupling interval, from the evaluated candidates.
+
+    Returns:
+        dict with
+        - "BLOCK": [longest interval that blocks, shortest interval that does not block]
+        - "PROPAGATION": [longest interval that does not propagate, shortest interval that propagates]
+        - "REENTRY": [shortest, longest] interval that induces reentry
+        Each bracket has None where no candidate is on that side, and is None if there is no bracket.
+    """
+    ordered = sorted(results, key=lambda r: r["CI"])
+
+    def bracket(passes):
+        first = next((r["CI"] for r in ordered if passes(r)), None)
+        if first is None:
+            return None
+        below = [r["CI"] for r in ordered if r["CI"] < first]
+        return [below[-1] if below else None, first]
+
+    reentry = [r["CI"] for r in ordered if r["REENTRY"]]
+    return {
+        "BLOCK": bracket(lambda r: r["OUTCOME"] != "block"),
+        "PROPAGATION": bracket(lambda r: r["OUTCOME"] == "propagation"),
+        "REENTRY": [reentry[0], reentry[-1]] if reentry else None,
+    }
+
+
+def search_s2(case_dir, config: dict = {}):
+    """
+    Search the S2 coupling intervals of a case that block, propagate or induce reentry.
+
+    Arguments:
+    - case_dir: Directory of the case, where the report s2_search.json is saved.
+    - config: Configuration dictionary, applied on top of the configuration file of case_dir
+      (or the defaults). The search is set in S2_SEARCH (see DEFAULT_SEARCH).
+
+    Returns the report: the thresholds, the evaluated candidates and the timing statistics.
+    """
+    from .arritmic3D import create_tissue, ensure_abs_paths, ensure_vtk_input, load_grid
+    import arritmic3d
+
+    t_start = time.perf_counter()
+    os.makedirs(case_dir, exist_ok=True)
+    case_config = load_case_config(case_dir)
+    cfg = (case_config or make_default_config()) | config
+    ensure_vtk_input(cfg)
+    resolve_models_in_parameters(cfg)
+    ensure_abs_paths(cfg)
+    search = DEFAULT_SEARCH | cfg.get("S2_SEARCH", {})
+    ci_min, ci_max = (float(ci) for ci in search["CI_RANGE"])
+    if not 0 < ci_min < ci_max:
+        raise ValueError(f"Invalid CI_RANGE {search['CI_RANGE']}.")
+    n_workers = int(search["N_WORKERS"] or os.cpu_count() or 1)
+    if int(cfg.get("N_PARTITIONS", 1)) > 1:
+        # The branches are cloned, and each worker is a process already
+        print("The S2 search runs each candidate in one process; N_PARTITIONS is ignored", flush=True)
+        cfg["N_PARTITIONS"] = 1
+
+    # Pace the S1 beats up to the shortest coupling interval
+    grid = load_grid(cfg["VTK_INPUT_FILE"])
+    tissue = create_tissue(grid, cfg)
+    schedule_activation(cfg, grid, tissue)
+    t_s1, s1_beat = last_s1_stimulus(cfg, grid)
+    t_branch = t_s1 + ci_min
+    tissue.SetSystemEvent(arritmic3d.SystemEventType.OTHER, t_branch)
+    tissue.RunUntil(t_branch, [arritmic3d.SystemEventType.OTHER])
+    s2_region = search["ACTIVATION_REGION"]
+    s2_nodes = resolve_activation_region(cfg["PROTOCOL"][0]["ACTIVATION_REGION"] if s2_region is None else s2_region, grid)
+    observed = np.asarray(grid.point_data["restitution_model"]) > 0
+    observed[s2_nodes] = False
+    settings = {
+        "t_s1": t_s1,
+        "s2_nodes": s2_nodes,
+        "s2_beat": s1_beat + 1,
+        "n_stims": int(search["N_STIMS"]),
+        "observed": observed,
+        "observation_time": float(search["OBSERVATION_TIME"]),
+        "block_fraction": float(search["BLOCK_FRACTION"]),
+        "propagation_fraction": float(search["PROPAGATION_FRACTION"]),
+    }
+    t_paced = time.perf_counter()
+    print(f"S1 paced up to {t_branch:g} ms (last S1 at {t_s1:g} ms) in {t_paced - t_start:.2f} s", flush=True)
+
+    # Each round evaluates one candidate per worker, the first one on a uniform grid of the range
+    candidates = np.linspace(ci_min, ci_max, max(n_workers, 2)).tolist()
+    results = []
+    n_rounds = 0
+    with tempfile.TemporaryDirectory(dir=case_dir) as tmp_dir:
+        pool = None
+        if n_workers > 1:
+            state_file = os.path.join(tmp_dir, "s1_state.bin")
+            tissue.SaveState(state_file)
+            context = multiprocessing.get_context("spawn")
+            pool = context.Pool(n_workers, initializer=_init_worker,
+                                initargs=(cfg["VTK_INPUT_FILE"], cfg, state_file, settings))
+        else:
+            _set_branch(tissue, settings)
+        try:
+            while candidates:
+                n_rounds += 1
+                round_results = pool.map(evaluate_s2, candidates) if pool else [evaluate_s2(ci) for ci in candidates]
+                for r in round_results:
+                    print(f"  S2 {r['CI']:8.2f} ms: {r['OUTCOME']:<11} activated {r['ACTIVATED']:6.1%}"
+                          f"{'  reentry' if r['REENTRY'] else ''}", flush=True)
+                results += round_results
+                candidates = refine_candidates(results, float(search["TOLERANCE"]), n_workers)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+    t_end = time.perf_counter()
+
+    thresholds = find_thresholds(results)
+    candidate_times = np.array([r["TIME"] for r in results])
+    timing = {
+        "S1_TIME": t_paced - t_start,
+        "SEARCH_TIME": t_end - t_paced,
+        "TOTAL_TIME": t_end - t_start,
+        "N_CANDIDATES": len(results),
+        "N_ROUNDS": n_rounds,
+        "N_WORKERS": n_workers,
+        "CANDIDATE_TIME_MEAN": float(candidate_times.mean()),
+        "CANDIDATE_TIME_MIN": float(candidate_times.min()),
+        "CANDIDATE_TIME_MAX": float(candidate_times.max()),
+        # Time the candidates would have taken one after the other, over the time they took
+        "SPEEDUP": float(candidate_times.sum() / (t_end - t_paced)),
+    }
+    report = {
+        "S1_LAST_STIMULUS": t_s1,
+        "S2_BEAT": s1_beat + 1,
+        "N_STIMS": settings["n_stims"],
+        "THRESHOLDS": thresholds,
+        "CANDIDATES": sorted(results, key=lambda r: r["CI"]),
+        "TIMING": timing,
+    }
+    with open(os.path.join(case_dir, REPORT_FILE), "w") as f:
+        json.dump(report, f, indent=2)
+
+    def show(bracket):
+        return "not found" if bracket is None else " - ".join("none" if ci is None else f"{ci:g}" for ci in bracket) + " ms"
+    print(f"Block threshold (ERP):  {show(thresholds['BLOCK'])}", flush=True)
+    print(f"Propagation threshold:  {show(thresholds['PROPAGATION'])}", flush=True)
+    print(f"Reentry window:         {show(thresholds['REENTRY'])}", flush=True)
+    print(f"{len(results)} candidates in {n_rounds} rounds with {n_workers} worker(s): "
+          f"{timing['SEARCH_TIME']:.2f} s ({timing['CANDIDATE_TIME_MEAN']:.2f} s per candidate, "
+          f"speedup {timing['SPEEDUP']:.1f}x), total {timing['TOTAL_TIME']:.2f} s", flush=True)
+    print(f"Report saved to {os.path.join(case_dir, REPORT_FILE)}", flush=True)
+    return report
+
+
+def get_arg_parser():
+    """
+    Configures and returns the argument parser of arritmic3d search-s2.
+    """
+    parser = argparse.ArgumentParser(
+        prog="arritmic3d search-s2",
+        description="Search the S2 coupling intervals that block, propagate or induce reentry after the S1 beats of the PROTOCOL.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Search between 250 and 400 ms with a resolution of 1 ms in 8 processes
+  arritmic3d search-s2 /path/to/case_dir --ci-range 250 400 --tolerance 1 --workers 8
+        """
+    )
+    parser.add_argument("case_dir", help="Directory of the case, where the report s2_search.json is saved.")
+    parser.add_argument("--config-file", "-c", dest="config_file", metavar="FILE", default=None,
+                        help="Path to configuration JSON file. If omitted, searches for arr3D_config.json in case_dir.")
+    parser.add_argument("--config-param", "-p", action="append", dest="config_params", metavar="KEY=VALUE", default=None,
+                        help="Override a single configuration parameter (KEY=VALUE format). Can be used multiple times.")
+    parser.add_argument("--input-file", "-i", dest="input_file", metavar="FILE", default=None,
+                        help="Path to input tissue file (VTK format). If omitted, VTK_INPUT_FILE is taken from the configuration.")
+    parser.add_argument("--ci-range", dest="ci_range", nargs=2, type=float, metavar=("MIN", "MAX"), default=None,
+                        help="Shortest and longest S2 coupling interval (ms). Overrides S2_SEARCH.CI_RANGE.")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, metavar="MS", default=None,
+                        help="Resolution of the thresholds (ms). Overrides S2_SEARCH.TOLERANCE.")
+    parser.add_argument("--n-stims", dest="n_stims", type=int, metavar="N", default=None,
+                        help="Number of extrastimuli (S2, S3, ...) at the coupling interval. Overrides S2_SEARCH.N_STIMS.")
+    parser.add_argument("--observation-time", dest="observation_time", type=float, metavar="MS", default=None,
+                        help="Time simulated after the last extrastimulus (ms). Overrides S2_SEARCH.OBSERVATION_TIME.")
+    parser.add_argument("--workers", "-j", dest="workers", type=int, metavar="N", default=None,
+                        help="Number of processes evaluating candidates. Overrides S2_SEARCH.N_WORKERS.")
+    return parser
+
+
+def main(argv=None):
+    from .arritmic3D import apply_config_overrides, get_config_file_path
+
+    args = get_arg_parser().parse_args(argv)
+    config_file = get_config_file_path(args)
+    if not config_file:
+        raise FileNotFoundError("No configuration file found. Provide --config-file or ensure arr3D_config.json exists in case_dir.")
+    cfg = apply_config_overrides(load_config_file(config_file), args)
+    search = dict(cfg.get("S2_SEARCH", {}))
+    for key, value in (("CI_RANGE", args.ci_range), ("TOLERANCE", args.tolerance), ("N_STIMS", args.n_stims),
+                       ("OBSERVATION_TIME", args.observation_time), ("N_WORKERS", args.workers)):
+        if value is not None:
+            search[key] = value
+    cfg["S2_SEARCH"] = search
+    search_s2(args.case_dir, cfg)
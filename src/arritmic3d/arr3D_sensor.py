@@ -1,6 +1,8 @@
 
 import os
 
+import numpy as np
+
 
 def ShowAllSensorData(sensor_data, sensor_names):
     """
@@ -36,7 +38,57 @@ def WriteAllSensorData(dir_name, sensor_data, sensor_names):
 
 
 def WriteSensorData(file, sensor_data_vector):
-    for value in sensor_data_vector:
-        for v in value[0:-1]:
-            file.write(f"{v}, ")
-        file.write(f"{value[-1]}\n")
+    file.writelines(", ".join(map(str, value)) + "\n" for value in sensor_data_vector)
+
+
+class SensorLog:
+    """
+        Append-only log of the sensor data, with one CSV file per sensor in a directory.
+        Each call to append adds the new records of each sensor at the end of its file, so the
+        records already saved are not written again.
+    """
+
+    def __init__(self, dir_name, sensor_names):
+        """
+        Args:
+            dir_name (str): The name of the directory where the CSV files will be saved.
+            sensor_names (list): A list of sensor data names corresponding to the values in the sensor data vectors.
+        """
+        self.dir_name = dir_name
+        self.sensor_names = sensor_names
+        self.sensors = set()
+
+    def append(self, records):
+        """
+            Appends the new records of each sensor to its CSV file. The file of a sensor is
+            created, with the header, the first time it has records.
+        Args:
+            records (numpy.ndarray): New sensor records, as given by DrainSensorData: a structured
+                array with a node_id field and a field for each sensor data name.
+        """
+        if len(records) == 0:
+            return
+        # Group the records by sensor, keeping their order
+        records = records[np.argsort(records["node_id"], kind="stable")]
+        # Values are written as the Python floats of the float32 values, as WriteSensorData does
+        table = np.column_stack([records[name].astype(np.float64 if records.dtype[name].kind == "f" else records.dtype[name]).astype(str)
+                                 for name in self.sensor_names])
+        keys, begins = np.unique(records["node_id"], return_index=True)
+        ends = np.append(begins[1:], len(records))
+        for key, begin, end in zip(keys.tolist(), begins, ends):
+            filename = os.path.join(self.dir_name, f"sensor_{key}.csv")
+            header = "" if key in self.sensors else ",".join(self.sensor_names)
+            with open(filename, "a" if key in self.sensors else "w") as f:
+                np.savetxt(f, table[begin:end], fmt="%s", delimiter=", ", header=header, comments="")
+            self.sensors.add(key)
+
+    def get_state(self):
+        """ Size of the file of each sensor, to resume the log with restore() from a checkpoint. """
+        return {str(key): os.path.getsize(os.path.join(self.dir_name, f"sensor_{key}.csv")) for key in sorted(self.sensors)}
+
+    def restore(self, state):
+        """ Resume the log from a state given by get_state(). The records appended after it are removed. """
+        for key, size in state.items():
+            with open(os.path.join(self.dir_name, f"sensor_{key}.csv"), "r+b") as f:
+                f.truncate(size)
+        self.sensors = {int(key) for key in state}
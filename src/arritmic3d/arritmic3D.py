@@ -12,8 +12,15 @@ import arritmic3d
 from . import arr3D_build_slab
 
 from .arr3D_config import check_directory, get_vectorial_parameters, load_config_file, load_case_config, make_default_config, resolve_models_in_parameters
-from .arr3D_activations import schedule_activation
-from .arr3D_sensor import WriteAllSensorData
+from .arr3D_activations import schedule_activation, resolve_activation_region
+from .arr3D_sensor import SensorLog
+from .arr3D_partition import PartitionedTissue
+from .arr3D_output import SnapshotWriter, save_beat_maps
+from .arr3D_ecg import lead_field, save_electrogram
+from .arr3D_checkpoint import list_checkpoints, load_checkpoint, remove_checkpoints, save_checkpoint
+
+# Fields that can be saved in the VTK output files, as VTK name -> tissue field name
+VTK_FIELD_NAMES = {'State': 'State', 'APD': 'APD', 'DI': 'LastDI', 'CV': 'CV', 'AP': 'AP', 'LAT': 'LAT', 'Beat': 'Beat'}
 
 
 def load_grid(vtk_file):
@@ -30,6 +37,33 @@ def load_grid(vtk_file):
 
     return grid
 
+def resolve_output_region(roi, grid):
+    """
+    Resolve VTK_OUTPUT_ROI to a boolean mask of the nodes of the grid.
+    - roi: dict with "BOX" key, [[i0, j0, k0], [i1, j1, k1]] with the first and last node indices along x, y and z,
+      or any value of ACTIVATION_REGION (group ID of 'activation_region', list of node IDs or dict with "file" key)
+    """
+    mask = np.zeros(grid.n_points, dtype=bool)
+    if isinstance(roi, dict) and "BOX" in roi:
+        (i0, j0, k0), (i1, j1, k1) = roi["BOX"]
+        mask.reshape(grid.dimensions[::-1])[k0:k1 + 1, j0:j1 + 1, i0:i1 + 1] = True
+    else:
+        mask[resolve_activation_region(roi, grid)] = True
+    return mask
+
+
+def set_electrogram(tissue, grid, params):
+    """ Compute during the simulation the pseudo-ECG at the electrodes ECG_ELECTRODES, given in the coordinates of the grid. """
+    dims = grid.dimensions
+    spacing = [np.unique(grid.points[:, i])[1] - grid.points[0, i] for i in range(3)]
+    live = (np.asarray(grid.point_data['restitution_model']) > 0).reshape(dims[::-1])
+    # lead_field takes the positions relative to the first node
+    electrodes = np.asarray(params['ECG_ELECTRODES'], dtype=np.float64) - grid.points[0]
+    nodes, weights = lead_field(live, spacing, electrodes, params.get('ECG_CUTOFF'))
+    tissue.SetElectrogram(nodes, weights, params.get('ECG_SAMPLING_PERIOD', 1.0))
+    print(f"Pseudo-ECG at {len(electrodes)} electrode(s) with {len(nodes)} nodes", flush=True)
+
+
 def create_tissue(grid, params):
     """ Create a tissue object from the grid.
     The grid is expected to have the following point data:
@@ -61,7 +95,13 @@ def create_tissue(grid, params):
     ncells_y = dims[1]
     ncells_z = dims[2]
 
-    tissue = arritmic3d.CardiacTissue(ncells_x, ncells_y, ncells_z, x_spacing, y_spacing, z_spacing)
+    queue_type = getattr(arritmic3d.EventQueueType, params.get('EVENT_QUEUE', 'HEAP').upper())
+    n_partitions = int(params.get('N_PARTITIONS', 1))
+    if n_partitions > 1:
+        # Split in slabs along z, each one simulated in its own process
+        tissue = PartitionedTissue(ncells_x, ncells_y, ncells_z, x_spacing, y_spacing, z_spacing, n_partitions, queue_type)
+    else:
+        tissue = arritmic3d.CardiacTissue(ncells_x, ncells_y, ncells_z, x_spacing, y_spacing, z_spacing, queue_type)
 
     vparams = get_vectorial_parameters(tissue, dims, params)
     print("Parameters:", params, flush=True)
@@ -98,7 +138,11 @@ def create_tissue(grid, params):
     return tissue
 
 
-def run_simulation(case_dir, cfg, debug_level=0):
+def run_simulation(case_dir, cfg, debug_level=0, resume=False):
+    """
+    Run the simulation of a case. With CHECKPOINT_PERIOD, a checkpoint is saved periodically to
+    <case_dir>/checkpoints. With resume, the simulation continues from the last checkpoint, if any.
+    """
 
     # Sensors output directory
     sensors_dir = os.path.join(case_dir, "sensors")
@@ -115,62 +159,133 @@ def run_simulation(case_dir, cfg, debug_level=0):
     # Create the tissue from the grid, passing the loaded configuration dict
     tissue = create_tissue(grid, cfg)
 
-    # Set the timer for saving the VTK files (times in ms)
-    tissue.SetTimer(
-        arritmic3d.SystemEventType.FILE_WRITE,
-        cfg['VTK_OUTPUT_PERIOD'],
-        initial_time=cfg['VTK_OUTPUT_INITIAL_TIME'])
-
-    # Schedule the activation protocol
-    activations = schedule_activation(cfg, grid, tissue)
-
+    # Record the activation maps of each beat. The maps of the finished beats are saved, and discarded
+    # from the tissue, on each FILE_WRITE and OTHER event, and the rest at the end of the simulation
+    beat_maps = bool(cfg.get('BEAT_MAPS_SAVE', False))
+    if beat_maps:
+        tissue.SetBeatRecorder(True, *cfg.get('BEAT_MAPS_RANGE', [0, -1]))
+    beat_maps_name = os.path.join(case_dir, out_file_name)
+
+    if cfg.get('ECG_ELECTRODES'):
+        set_electrogram(tissue, grid, cfg)
+
+    # Set the timer for saving the VTK files (times in ms). Without VTK output there are no FILE_WRITE events,
+    # unless they are needed to save the beat maps
+    vtk_output = cfg.get('VTK_OUTPUT_SAVE', True)
+    if vtk_output or beat_maps:
+        tissue.SetTimer(
+            arritmic3d.SystemEventType.FILE_WRITE,
+            cfg['VTK_OUTPUT_PERIOD'],
+            initial_time=cfg['VTK_OUTPUT_INITIAL_TIME'])
+
+    # Schedule the activation protocol. The stimuli are applied by the tissue
+    schedule_activation(cfg, grid, tissue)
+
+    # Node events and stimuli are processed natively; control only returns here for system events
+    stop_on = [arritmic3d.SystemEventType.FILE_WRITE]
+    duration = cfg['SIMULATION_DURATION']
+
+    # Checkpoints are taken on the OTHER system events
+    checkpoint_period = cfg.get('CHECKPOINT_PERIOD') or 0.0
+    if checkpoint_period > 0:
+        tissue.SetTimer(arritmic3d.SystemEventType.OTHER, checkpoint_period, initial_time=checkpoint_period)
+        stop_on.append(arritmic3d.SystemEventType.OTHER)
+    checkpoints = list_checkpoints(case_dir) if resume else []
+    if resume and not checkpoints:
+        print(f"No checkpoints found in {case_dir}, starting from the beginning", flush=True)
+    elif not resume and checkpoint_period > 0:
+        # Checkpoints of a previous run
+        remove_checkpoints(case_dir)
+
+    # Output fields, as VTK name -> tissue field name
+    output_fields = {name: VTK_FIELD_NAMES[name] for name in VTK_FIELD_NAMES if name in cfg['VTK_OUTPUT_FIELDS']}
+    # The VTK files are saved in a background thread while the simulation goes on
+    # With the xdmf and delta formats, all the snapshots go to a single time series
+    keyframe_period = int(cfg.get('VTK_OUTPUT_KEYFRAME_PERIOD', 100)) if out_ext == 'delta' else 0
+    # The snapshots cover the tissue, decimated by VTK_OUTPUT_STRIDE, and/or the region VTK_OUTPUT_ROI
+    # at full resolution, saved with the suffix _roi. Each one is a writer, as suffix -> (mask, stride)
+    roi = cfg.get('VTK_OUTPUT_ROI')
+    stride = cfg.get('VTK_OUTPUT_STRIDE', 1)
+    views = {}
+    if roi is None or np.any(np.asarray(stride) > 1):
+        views[''] = (None, stride)
+    if roi is not None:
+        views['_roi'] = (resolve_output_region(roi, grid), 1)
+    if out_ext == 'delta' and len(views) > 1:
+        raise ValueError("The delta format can only save one of VTK_OUTPUT_ROI and VTK_OUTPUT_STRIDE.")
+    writers = {}
+    for suffix, (mask, view_stride) in views.items():
+        series_name = os.path.join(case_dir, out_file_name + suffix) if out_ext in ('xdmf', 'delta') else None
+        writers[suffix] = SnapshotWriter(grid, output_fields, int(cfg.get('VTK_OUTPUT_BUFFERS', 2)), series_name,
+                                         keyframe_period, mask, view_stride)
+    sensor_log = SensorLog(sensors_dir, tissue.GetSensorDataNames())
+
+    if checkpoints:
+        # The timers, the system events and the pending stimuli are part of the state of the tissue
+        checkpoint_time, checkpoint_path = checkpoints[-1]
+        driver_state = load_checkpoint(checkpoint_path, tissue)
+        if set(driver_state["writers"]) != set(writers):
+            raise ValueError(f"The outputs of {checkpoint_path} do not match the configuration.")
+        for suffix, writer in writers.items():
+            writer.restore(driver_state["writers"][suffix])
+        sensor_log.restore(driver_state["sensors"])
+        print(f"Resuming from {checkpoint_path} at time {tissue.GetTime()}", flush=True)
     time = tissue.GetTime()
 
-    while time < cfg['SIMULATION_DURATION']:
-        tick = tissue.update(debug_level)
-        time = tissue.GetTime()
-
-        if tick == arritmic3d.SystemEventType.EXT_ACTIVATION:
-            if time in activations:
-                initial_nodes = activations[time][0]
-                beat = activations[time][1]
-                tissue.ExternalActivation(initial_nodes, time, beat)
-                print("Beat at time:", time, flush=True)
-
-        elif tick == arritmic3d.SystemEventType.FILE_WRITE:
-            fields = cfg['VTK_OUTPUT_FIELDS']
-            if 'State' in fields:
-                grid.point_data['State'] = tissue.GetStates()
-            if 'APD' in fields:
-                grid.point_data['APD'] = tissue.GetAPD()
-            if 'DI' in fields:
-                grid.point_data['DI'] = tissue.GetLastDI()
-            if 'CV' in fields:
-                grid.point_data['CV'] = tissue.GetCV()
-            if 'AP' in fields:
-                grid.point_data['AP'] = tissue.GetAP()
-            if 'LAT' in fields:
-                grid.point_data['LAT'] = tissue.GetLAT()
-            if 'Beat' in fields:
-                grid.point_data['Beat'] = tissue.GetBeat()
-            grid.field_data['Time'] = time
-
-            clean_grid = grid.threshold(0.5, scalars="restitution_model", all_scalars=True)
-            clean_grid.save(f"{os.path.join(case_dir, out_file_name)}_{int(time):05d}.{out_ext}")
-
-            # Incremental sensor data saving
-            sensor_data = tissue.GetSensorInfo()
-            if sensor_data:
-                sensor_names = tissue.GetSensorDataNames()
-                WriteAllSensorData(sensors_dir, sensor_data, sensor_names)
-
-    # Save sensor data to CSV files in <case_dir>/sensors/
-    sensor_data = tissue.GetSensorInfo()
-    if sensor_data:
-        sensor_names = tissue.GetSensorDataNames()
-        WriteAllSensorData(sensors_dir, sensor_data, sensor_names)
+    try:
+        while time < duration:
+            tick = tissue.RunUntil(duration, stop_on, debug_level)
+            time = tissue.GetTime()
+
+            if tick == arritmic3d.SystemEventType.NO_EVENT:
+                break
+
+            if tick == arritmic3d.SystemEventType.FILE_WRITE:
+                if vtk_output:
+                    for suffix, writer in writers.items():
+                        writer.write(tissue, time, f"{os.path.join(case_dir, out_file_name)}{suffix}_{int(time):05d}.{out_ext}")
+
+                # Incremental sensor data saving: only the records since the previous output are appended
+                sensor_log.append(tissue.DrainSensorData())
+                if beat_maps:
+                    save_beat_maps(tissue, grid, beat_maps_name, finished_only=True)
+
+            elif tick == arritmic3d.SystemEventType.OTHER:
+                # The outputs are saved up to this time, so the checkpoint has the size of each file
+                sensor_log.append(tissue.DrainSensorData())
+                if beat_maps:
+                    save_beat_maps(tissue, grid, beat_maps_name, finished_only=True)
+                for writer in writers.values():
+                    writer.flush()
+                driver_state = {
+                    "writers": {suffix: writer.get_state() for suffix, writer in writers.items()},
+                    "sensors": sensor_log.get_state(),
+                }
+                checkpoint_path = save_checkpoint(case_dir, tissue, driver_state, int(cfg.get('CHECKPOINT_KEEP', 2)),
+                                                  bool(cfg.get('CHECKPOINT_COMPRESS', False)))
+                print(f"Checkpoint saved to {checkpoint_path}", flush=True)
+    finally:
+        # Wait for the pending VTK files
+        for writer in writers.values():
+            writer.close()
+
+    # Save the remaining sensor data to CSV files in <case_dir>/sensors/
+    sensor_log.append(tissue.DrainSensorData())
+    if sensor_log.sensors:
         print(f"Sensor data saved to {sensors_dir}", flush=True)
 
+    if beat_maps:
+        save_beat_maps(tissue, grid, beat_maps_name)
+        print(f"Activation maps of the beats saved to {case_dir}", flush=True)
+
+    if cfg.get('ECG_ELECTRODES'):
+        ecg_file = os.path.join(case_dir, "ecg.csv")
+        save_electrogram(ecg_file, *tissue.GetElectrogram())
+        print(f"Pseudo-ECG saved to {ecg_file}", flush=True)
+
+    if isinstance(tissue, PartitionedTissue):
+        tissue.close()
+
 
 def get_arg_parser():
     """
@@ -195,6 +310,13 @@ Examples:
     --input-file /path/to/tissue.vtk \\
     --config-file /path/to/config.json
 
+  # Save a checkpoint every 500 ms, and continue an interrupted run from the last one
+  python arritmic3D.py /path/to/case_dir --checkpoint-every 500
+  python arritmic3D.py /path/to/case_dir --checkpoint-every 500 --resume
+
+  # Search the S2 coupling intervals that block, propagate or induce reentry (see search-s2 --help)
+  python arritmic3D.py search-s2 /path/to/case_dir --ci-range 250 400 --workers 8
+
   # Override specific configuration parameters
   python arritmic3D.py /path/to/case_dir \\
     --input-file /path/to/tissue.vtk \\
@@ -266,6 +388,24 @@ Examples:
         help="Override a single configuration parameter (KEY=VALUE format). Can be used multiple times. "
              "Example: --config-param SIMULATION_DURATION=8000 --config-param VTK_OUTPUT_PERIOD=50"
     )
+
+    # Checkpoint group
+    checkpoint_group = parser.add_argument_group("Checkpoints", "Save the simulation periodically and resume it.")
+    checkpoint_group.add_argument(
+        "--checkpoint-every",
+        dest="checkpoint_every",
+        metavar="MS",
+        type=float,
+        default=None,
+        help="Save a checkpoint every MS ms of simulated time to case_dir/checkpoints. Overrides CHECKPOINT_PERIOD."
+    )
+    checkpoint_group.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="Continue the simulation from the last checkpoint in case_dir/checkpoints. "
+             "If there is none, the simulation starts from the beginning."
+    )
     parser.add_argument(
         "--test",
         action="store_true",
@@ -450,7 +590,7 @@ def generate_slab_to_output(case_dir, slab_args):
     return slab_path
 
 
-def run_arritmic3D(case_dir, config : dict = {}, save_run_config=True, debug_level = 0):
+def run_arritmic3D(case_dir, config : dict = {}, save_run_config=True, debug_level = 0, resume=False):
     """
     Run the Arritmic3D simulation in the given case directory with the provided configuration dict
 
@@ -458,6 +598,7 @@ def run_arritmic3D(case_dir, config : dict = {}, save_run_config=True, debug_lev
     - case_dir: Output directory where results will be saved.
     - config: Configuration dictionary with simulation parameters (see documentation). Fields provided here override those in any configuration file found in case_dir. If no configuration file is found, this config is applied on top of defaults.
     - save_run_config: If True (default), saves the actual run configuration to case_dir/arr3D_config_run.json.
+    - resume: If True, continue the simulation from the last checkpoint in case_dir/checkpoints.
     """
 
     # Read configuration from case directory
@@ -491,7 +632,7 @@ def run_arritmic3D(case_dir, config : dict = {}, save_run_config=True, debug_lev
     os.makedirs(sensors_dir, exist_ok=True)
 
     # Run simulation with runtime config (absolute paths)
-    run_simulation(case_dir, config, debug_level)
+    run_simulation(case_dir, config, debug_level, resume)
     print("Simulation finished", flush=True)
 
 def run_test_case(output_dir):
@@ -539,6 +680,12 @@ def run_test_case(output_dir):
 
 def main():
 
+    # arritmic3d search-s2 <case_dir> ... searches the S2 coupling intervals instead of running the case
+    if len(sys.argv) > 1 and sys.argv[1] == "search-s2":
+        from .arr3D_search import main as search_s2_main
+        search_s2_main(sys.argv[2:])
+        return
+
     parser = get_arg_parser()
     # Parse known args for arritmic3D; remainder belongs to build_slab if --slab is set
     args, remainder = parser.parse_known_args()
@@ -569,8 +716,11 @@ def main():
         slab_vtk = generate_slab_to_output(args.case_dir, remainder)
         cfg["VTK_INPUT_FILE"] = slab_vtk
 
+    if args.checkpoint_every is not None:
+        cfg["CHECKPOINT_PERIOD"] = args.checkpoint_every
+
     # Execute the simulation with the prepared configuration
-    run_arritmic3D(args.case_dir, config = cfg, save_run_config = args.output_run_config)
+    run_arritmic3D(args.case_dir, config = cfg, save_run_config = args.output_run_config, resume = args.resume)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -9,7 +9,10 @@
 
 #include <vector>
 #include <array>
+#include <algorithm>
 #include <map>
+#include <memory>
+#include <stdexcept>
 #include <iostream>
 #include <fstream>
 #include <cassert>
@@ -30,6 +33,15 @@ using std::vector;
  * the functions to perform the simulation using the fast reaction
  * diffusion model.
  *
+ * Only live (not VOID) nodes are stored. Node ids are indices in the full
+ * rectilinear grid, and live_index maps them to positions in tissue_nodes.
+ * The neighbours of each live node are precomputed in a table. Getters
+ * return values for the full grid, using a VOID node for the missing ones.
+ *
+ * The tables that do not change while the simulation runs (live_index, neighbour_index,
+ * anisotropy_factor, parameters_pool and the restitution models) are shared with the
+ * copies made by CardiacTissue::Clone. They are replaced, never modified, when they change.
+ *
  * If no fiber orientation is given, isotropic tissue is assumed.
  */
 template <typename APM, typename CVM>
@@ -38,13 +50,21 @@ class BasicTissue
 public:
 
     enum class FiberOrientation {ISOTROPIC, HOMOGENEOUS, HETEROGENEOUS};
-    constexpr static int SAVE_VERSION = 1;  ///< Version of the BasicTissue class for state saving/loading.
+    /// Per-node fields that can be extracted in bulk. STATE and BEAT are int, the rest are float.
+    enum class NodeField {STATE, APD, AP, CV, DI, LAST_DI, LAT, LIFE, BEAT, APD_VARIATION, SIZE};
+    /// Output buffer for a field. It must hold size() elements of the type of the field.
+    struct FieldBuffer { NodeField field; void * data; };
+    constexpr static int SAVE_VERSION = 5;  ///< Version of the BasicTissue class for state saving/loading.
     using Node = NodeT<APM,CVM>;
+    using SensorColumns = typename SensorDict<typename Node::NodeData>::Columns;
     friend class NodeT<APM,CVM>;
 
-    BasicTissue(int size_x_, int size_y_, int size_z_, float dx_, float dy_, float dz_) :
+    BasicTissue(int size_x_, int size_y_, int size_z_, float dx_, float dy_, float dz_, EventQueueType queue_type_ = EventQueueType::HEAP) :
         tissue_geometry(size_x_, size_y_, size_z_, dx_, dy_, dz_),
-        tissue_nodes(size_x_ * size_y_ * size_z_),
+        live_index(std::make_shared<const vector<int>>(size_t(size_x_) * size_y_ * size_z_, -1)),
+        neighbour_index(std::make_shared<const vector<int>>()),
+        event_queue(queue_type_),
+        parameters_pool(std::make_shared<ParametersPool>()),
         sensor_dict(Node::GetDataNames())
     {
         tissue_time = 0.0;
@@ -52,10 +72,24 @@ public:
         timer.fill(0.0f);
     }
 
+    /**
+     * @brief Load the APD and CV restitution models of this tissue.
+     *
+     * Tissues loading the same configuration files share the model tables.
+     * If the tissue is already initialized, the nodes are linked to the new models.
+     * @param fileAP Configuration file of the APD restitution models.
+     * @param fileCV Configuration file of the CV restitution models.
+     */
     void InitModels(const std::string &fileAP, const std::string &fileCV)
     {
-        APM::InitModel(fileAP);
-        CVM::InitModel(fileCV);
+        apd_models = APM::LoadModel(fileAP);
+        cv_models = CVM::LoadModel(fileCV);
+
+        for(auto & node : tissue_nodes)
+        {
+            node.apd_model.SetRestitutionModel(*apd_models, node.type);
+            node.cv_model.SetRestitutionModel(*cv_models, node.type);
+        }
     }
 
     void Init(const vector<CellType> & cell_types_, vector<NodeParameters> & parameters_, const vector<Eigen::Vector3f> & fiber_orientation_ = {Eigen::Vector3f::Zero()});
@@ -72,13 +106,26 @@ public:
     vector<float> GetLife() const;
     vector<int> GetBeat() const;
     vector<float> GetAPDVariation() const;
+    void FillFields(const vector<FieldBuffer> & buffers, const vector<size_t> * ids = nullptr) const;
+    /** Check if a field is stored as int */
+    static bool IsIntField(NodeField field) { return field == NodeField::STATE || field == NodeField::BEAT; }
+    /**
+     * @brief Get the names of the fields, in the order of NodeField.
+     */
+    static const vector<std::string> & GetFieldNames()
+    {
+        static const vector<std::string> names = {"State", "APD", "AP", "CV", "DI", "LastDI", "LAT", "Life", "Beat", "APDVariation"};
+        return names;
+    }
+    /** Get the type of the event queue, set when the tissue is created */
+    EventQueueType GetEventQueueType() const { return event_queue.GetType(); }
     /** Get the current time of the tissue */
     float GetTime() const { return tissue_time; }
     void SetBorder(vector<CellType> & cell_types_, CellType border_type);
     /** Get the id (index) of node with coordinates (x, y, z) */
     size_t GetIndex(int x, int y, int z) const  { return tissue_geometry.GetIndex(x, y, z);}
-    /** Get the number of nodes in the tissue */
-    size_t size() const { return tissue_nodes.size(); }
+    /** Get the number of nodes in the tissue grid, including VOID nodes */
+    size_t size() const { return live_index->size(); }
     /** Get the number of live nodes (not CORE) in the tissue */
     int GetNumLiveNodes() const { return n_live_nodes; }
 
@@ -95,7 +142,7 @@ public:
     void SetSystemEvent(SystemEventType type, float t);
 
     void SaveVTK(const std::string & filename) const;
-    void SaveState(const std::string & filename) const;
+    void SaveState(const std::string & filename, bool compress = false) const;
     void LoadState(const std::string & filename);
 
     void ShowSensorData(std::ostream& os = std::cout) const
@@ -112,6 +159,23 @@ public:
         return sensor_dict.GetSensorInfo();
     }
 
+    /**
+     * @brief Get the records of all sensors, by columns.
+     */
+    const SensorColumns & GetSensorColumns() const
+    {
+        return sensor_dict.GetColumns();
+    }
+
+    /**
+     * @brief Get the sensor data stored since the last call, and remove it from the tissue.
+     * @return The new records, by columns.
+     */
+    SensorColumns DrainSensorData()
+    {
+        return sensor_dict.Drain();
+    }
+
     /**
      * @brief Get the names of the data stored in the sensors.
      * @return A vector of strings containing the names of the data.
@@ -132,6 +196,19 @@ public:
         return n.GetParameters();
     }
 
+    /**
+     * @brief Enable or disable the table of anisotropy factors.
+     * The table stores, for each live node, the anisotropy factor of the conduction
+     * velocity towards each neighbour, so it is not computed on every activation.
+     * Disabling it saves memory in large anisotropic tissues. Results are the same.
+     * @param enabled Use the table. It is enabled by default.
+     */
+    void SetAnisotropyTable(bool enabled)
+    {
+        use_anisotropy_table = enabled;
+        BuildAnisotropyTable();
+    }
+
     /**
      * @brief Set the initial APD for all nodes.
      * It should be called before Init.
@@ -144,15 +221,32 @@ public:
 
 protected:
 
+    /**
+     * @brief Copy a tissue, for CardiacTissue::Clone. The pointers of the nodes and
+     * the events of the copy refer to the original until RebasePointers is called.
+     */
+    BasicTissue(const BasicTissue &) = default;
+    BasicTissue & operator=(const BasicTissue &) = delete;
+    void RebasePointers(const BasicTissue & source);
+    void SaveBlocks(StateWriter & state_file) const;
+    void LoadBlocks(StateReader & state_file);
+
     // Geometry
     FiberOrientation    tissue_fiber_orientation;
     Geometry      tissue_geometry;
-    vector<Node>        tissue_nodes;
+    vector<Node>        tissue_nodes;     ///< Live nodes only
+    std::shared_ptr<const vector<int>>  live_index;       ///< Position in tissue_nodes of each grid node, -1 if VOID
+    std::shared_ptr<const vector<int>>  neighbour_index;  ///< Position in tissue_nodes of the neighbours of each live node, -1 if VOID
+    Node                void_node;        ///< Node returned by the getters for VOID grid nodes
+    std::shared_ptr<const vector<float>> anisotropy_factor;  ///< Anisotropy factor of each live node towards each neighbour direction. nullptr if not used.
+    bool                use_anisotropy_table = true;
     CellEventQueue<Node>  event_queue;
     int           n_live_nodes = 0;   ///< Number of nodes that are not CORE
 
     // Parameters
-    ParametersPool      parameters_pool;
+    std::shared_ptr<ParametersPool> parameters_pool;    ///< Parameters of the nodes, shared with the clones
+    std::shared_ptr<const typename APM::ModelTable> apd_models; ///< APD restitution models, shared with other tissues
+    std::shared_ptr<const typename CVM::ModelTable> cv_models;  ///< CV restitution models, shared with other tissues
 
     // Simulation
     float           tissue_time;
@@ -163,16 +257,133 @@ protected:
     SensorDict<typename Node::NodeData> sensor_dict;  ///< Dictionary to store sensor data
 
     /**
-     * @brief Get the position of a node in the tissue_nodes vector
-     * Now corresponds with the id, but it may change in the future
+     * @brief Get a pointer to a node from its id (index in the grid).
+     * @return Pointer to the node, or nullptr if it is a VOID node.
      */
     Node* GetNodePtr(size_t id)
     {
-        assert(id >= 0 && id < tissue_nodes.size());
-        return &tissue_nodes[id];
+        assert(id < live_index->size());
+        int k = (*live_index)[id];
+        return k < 0 ? nullptr : &tissue_nodes[k];
+    }
+
+    const Node* GetNodePtr(size_t id) const
+    {
+        assert(id < live_index->size());
+        int k = (*live_index)[id];
+        return k < 0 ? nullptr : &tissue_nodes[k];
+    }
+
+    /**
+     * @brief Get the neighbours of a live node.
+     * @return Geometry::num_neighbours positions in tissue_nodes, in the order of Geometry::displacement. -1 for VOID neighbours.
+     */
+    const int * GetNeighbours(const Node * node) const
+    {
+        return &(*neighbour_index)[(node - tissue_nodes.data()) * Geometry::num_neighbours];
     }
+
+    /**
+     * @brief Get the conduction velocity of a live node towards one of its neighbours.
+     * @param node Live node.
+     * @param neigh Position of the neighbour in Geometry::displacement.
+     */
+    float GetDirectionalConductionVelocity(Node * node, size_t neigh) const
+    {
+        if(!anisotropy_factor)
+            return node->ComputeDirectionalConductionVelocity(- tissue_geometry.relative_position[neigh]);
+        // Opposite neighbours have the same factor. Only one direction of each pair is stored.
+        size_t dir = std::min(neigh, Geometry::num_neighbours - 1 - neigh);
+        return node->conduction_vel/(*anisotropy_factor)[(node - tissue_nodes.data()) * num_directions + dir];
+    }
+
+    void BuildLiveNodes(const vector<int> & live_ids);
+    void BuildAnisotropyTable();
+
+    static constexpr size_t num_directions = Geometry::num_neighbours / 2;  ///< Neighbour directions, up to the sign
 };
 
+/**
+ * Build the live node vector and the neighbour table.
+ * Nodes are default constructed, only their id is set.
+ * @param live_ids Ids of the live nodes, in increasing order.
+ */
+template <typename APM,typename CVM>
+void BasicTissue<APM,CVM>::BuildLiveNodes(const vector<int> & live_ids)
+{
+    const int n_grid = tissue_geometry.size_x * tissue_geometry.size_y * tissue_geometry.size_z;
+    n_live_nodes = int(live_ids.size());
+
+    auto index = std::make_shared<vector<int>>(n_grid, -1);
+    tissue_nodes.assign(n_live_nodes, Node());
+    for(int k = 0; k < n_live_nodes; k++)
+    {
+        (*index)[live_ids[k]] = k;
+        tissue_nodes[k].id = live_ids[k];
+    }
+
+    auto neighbours = std::make_shared<vector<int>>(size_t(n_live_nodes) * Geometry::num_neighbours);
+    for(int k = 0; k < n_live_nodes; k++)
+    {
+        for(size_t j = 0; j < Geometry::num_neighbours; j++)
+        {
+            // Borders are VOID, so neighbours of live nodes are inside the grid
+            int neigh_id = live_ids[k] + tissue_geometry.displacement[j];
+            (*neighbours)[k * Geometry::num_neighbours + j] = (neigh_id >= 0 && neigh_id < n_grid) ? (*index)[neigh_id] : -1;
+        }
+    }
+    live_index = std::move(index);
+    neighbour_index = std::move(neighbours);
+
+    // Values of a VOID node after Node::Init
+    void_node = Node();
+    void_node.type = CELL_TYPE_VOID;
+    void_node.local_activation_time = void_node.apd_model.getActivationTime();
+    void_node.conduction_vel = void_node.cv_model.getConductionVelocity();
+}
+
+/**
+ * Move the pointers of a copy of a tissue from the nodes and events of the original to its own.
+ * The node parameters and the restitution models are shared, so their pointers do not change.
+ * @param source Tissue that was copied.
+ */
+template <typename APM,typename CVM>
+void BasicTissue<APM,CVM>::RebasePointers(const BasicTissue & source)
+{
+    const Node * source_nodes = source.tissue_nodes.data();
+    event_queue.Rebase(source.event_queue, source_nodes, tissue_nodes.data());
+    for(Node & node : tissue_nodes)
+    {
+        if(node.next_activation_event != nullptr)
+            node.next_activation_event = event_queue.GetEventPtr(source.event_queue.GetIndex(node.next_activation_event));
+        if(node.next_deactivation_event != nullptr)
+            node.next_deactivation_event = event_queue.GetEventPtr(source.event_queue.GetIndex(node.next_deactivation_event));
+        if(node.activation_parent != nullptr)
+            node.activation_parent = tissue_nodes.data() + (node.activation_parent - source_nodes);
+    }
+}
+
+/**
+ * Build the table of anisotropy factors of the live nodes.
+ * It must be rebuilt when the fiber orientation or the node parameters change.
+ * Isotropic tissues do not need the table.
+ */
+template <typename APM,typename CVM>
+void BasicTissue<APM,CVM>::BuildAnisotropyTable()
+{
+    anisotropy_factor.reset();
+    bool anisotropic = std::any_of(tissue_nodes.begin(), tissue_nodes.end(),
+                                   [](const Node & node) { return !node.parameters->isotropic_diffusion; });
+    if(!use_anisotropy_table || !anisotropic)
+        return;
+
+    auto factors = std::make_shared<vector<float>>(tissue_nodes.size() * num_directions);
+    for(size_t k = 0; k < tissue_nodes.size(); k++)
+        for(size_t dir = 0; dir < num_directions; dir++)
+            (*factors)[k * num_directions + dir] = tissue_nodes[k].ComputeAnisotropyFactor(- tissue_geometry.relative_position[dir]);
+    anisotropy_factor = std::move(factors);
+}
+
 /**
  * Initialize the tissue.
  * @param cell_types_ Vector of cell types.
@@ -184,12 +395,13 @@ template <typename APM,typename CVM>
 void BasicTissue<APM,CVM>::Init(const vector<CellType> & cell_types_, vector<NodeParameters> & parameters_, const vector<Eigen::Vector3f> & fiber_orientation_)
 {
     // First, check if data vectors are consistent
-    size_t n_nodes = tissue_nodes.size();
+    size_t n_nodes = size();
     LOG::Error(cell_types_.size() != n_nodes, "Number of cell types (", cell_types_.size(), ") does not match number of nodes (", n_nodes, ").");
     assert(cell_types_.size() == n_nodes);
+    if(!apd_models || !cv_models)
+        throw std::runtime_error("BasicTissue::Init: restitution models not loaded. Call InitModels first.");
 
     // Reset basic variables
-    n_live_nodes = 0;
     tissue_time = 0.0;
 
     sensor_dict.Init();
@@ -210,27 +422,27 @@ void BasicTissue<APM,CVM>::Init(const vector<CellType> & cell_types_, vector<Nod
         else
             this->tissue_fiber_orientation = FiberOrientation::ISOTROPIC;
 
-    // Initialize nodes
+    // Initialize nodes. Only live nodes are stored.
     assert(parameters_.size() == n_nodes || parameters_.size() == 1);
+    vector<int> live_ids;
     for(size_t i = 0; i < n_nodes; i++)
-    {
-        tissue_nodes[i] = Node();  // Totally reset the node
+        if(cell_types2[i] != CELL_TYPE_VOID)
+            live_ids.push_back(i);
+    BuildLiveNodes(live_ids);
 
-        tissue_nodes[i].id = i;
-        tissue_nodes[i].type = cell_types2[i];
+    for(auto & node : tissue_nodes)
+    {
+        node.type = cell_types2[node.id];
         // Set the fiber orientation, default is isotropic
         if(this->tissue_fiber_orientation == FiberOrientation::HOMOGENEOUS)
         {
-            tissue_nodes[i].orientation = fiber_orientation_.at(0);
+            node.orientation = fiber_orientation_.at(0);
         }
         else if(this->tissue_fiber_orientation == FiberOrientation::HETEROGENEOUS)
         {
             // @todo If fiber_orientation is locally 0, it is not set to isotropic. Check if it can be done in ChangeParameters()
-            tissue_nodes[i].orientation = fiber_orientation_.at(i);
+            node.orientation = fiber_orientation_.at(node.id);
         }
-
-        if(tissue_nodes[i].type != CELL_TYPE_VOID)
-            n_live_nodes++;
     }
 
     LOG::Warning(n_live_nodes == 0, "Tissue has no live cells (all cells are VOID).");
@@ -242,13 +454,13 @@ void BasicTissue<APM,CVM>::Init(const vector<CellType> & cell_types_, vector<Nod
     event_queue.Init(tissue_nodes, n_live_nodes);
 
     // Link each node with its events.
-    for(size_t i = 0; i < n_nodes; i++)
+    for(size_t i = 0; i < tissue_nodes.size(); i++)
     {
         tissue_nodes[i].next_activation_event = event_queue.GetEvent(i,CellEventType::ACTIVATION);
         tissue_nodes[i].next_deactivation_event = event_queue.GetEvent(i,CellEventType::DEACTIVATION);
 
         // Init should only be called after the Node parameters are set.
-        tissue_nodes[i].Init(tissue_time, initial_apd);
+        tissue_nodes[i].Init(tissue_time, initial_apd, *this);
     }
 }
 
@@ -260,7 +472,7 @@ void BasicTissue<APM,CVM>::Init(const vector<CellType> & cell_types_, vector<Nod
 template <typename APM,typename CVM>
 void BasicTissue<APM,CVM>::ChangeParameters(vector<NodeParameters> & parameters_)
 {
-    size_t n_nodes = tissue_nodes.size();
+    size_t n_nodes = size();
     assert(parameters_.size() == n_nodes || parameters_.size() == 1);
 
     // Set isotropic diffusion, default is true
@@ -273,23 +485,26 @@ void BasicTissue<APM,CVM>::ChangeParameters(vector<NodeParameters> & parameters_
         parameters_[i].isotropic_diffusion = isotropic;
     }
 
-    parameters_pool.Init(parameters_);
-    LOG::Info(debug_level > 0, parameters_pool.Info());
+    // A new pool, so the clones of the tissue keep theirs
+    parameters_pool = std::make_shared<ParametersPool>();
+    parameters_pool->Init(parameters_);
+    LOG::Info(debug_level > 0, parameters_pool->Info());
 
-    for(size_t i = 0; i < n_nodes; i++)
+    for(auto & node : tissue_nodes)
     {
         if(parameters_.size() == 1)
-            tissue_nodes[i].parameters = parameters_pool.Find(parameters_[0]);
+            node.parameters = parameters_pool->Find(parameters_[0]);
         else
-            tissue_nodes[i].parameters = parameters_pool.Find(parameters_[i]);
+            node.parameters = parameters_pool->Find(parameters_[node.id]);
 
-        if(tissue_nodes[i].type != CELL_TYPE_VOID)
-            tissue_nodes[i].ReApplyParam(tissue_time);
+        node.ReApplyParam(tissue_time, *this);
     }
 
+    BuildAnisotropyTable();
+
 
     // Clear the finder map in the parameters pool to save memory
-    parameters_pool.FinderClear();
+    parameters_pool->FinderClear();
 }
 
 /**
@@ -325,7 +540,7 @@ void BasicTissue<APM,CVM>::Reset()
 template <typename APM,typename CVM>
 void BasicTissue<APM,CVM>::InitPy(const vector<CellType> & cell_types_, std::map<std::string, std::vector<float> > & parameters_, const std::vector<vector<float> > & fiber_orientation_)
 {
-    vector<NodeParameters> parameters(tissue_nodes.size() );
+    vector<NodeParameters> parameters(size());
 
     for(size_t param = 0; param < NodeParameters::names.size(); param++)
     {
@@ -338,22 +553,22 @@ void BasicTissue<APM,CVM>::InitPy(const vector<CellType> & cell_types_, std::map
     }
 
     // Set the fiber orientation
-    vector<Eigen::Vector3f> fiber_orientation(tissue_nodes.size(), Eigen::Vector3f::Zero());
+    vector<Eigen::Vector3f> fiber_orientation(size(), Eigen::Vector3f::Zero());
     if(fiber_orientation_.size() == 1)
     {
         // If only one fiber orientation is given, use it for all nodes
-        for(size_t i = 0; i < tissue_nodes.size(); i++)
+        for(size_t i = 0; i < size(); i++)
             fiber_orientation[i] = Eigen::Vector3f(fiber_orientation_[0].data());
     }
-    else if(fiber_orientation_.size() == tissue_nodes.size())
+    else if(fiber_orientation_.size() == size())
     {
         // If fiber orientation is given for each node, use it
-        for(size_t i = 0; i < tissue_nodes.size(); i++)
+        for(size_t i = 0; i < size(); i++)
             fiber_orientation[i] = Eigen::Vector3f(fiber_orientation_[i].data());
     }
     else
     {
-        LOG::Error(true, " Number of fiber orientations (", fiber_orientation_.size(), ") does not match number of nodes (", tissue_nodes.size(), " or 1).");
+        LOG::Error(true, " Number of fiber orientations (", fiber_orientation_.size(), ") does not match number of nodes (", size(), " or 1).");
         return;
     }
 
@@ -368,9 +583,8 @@ void BasicTissue<APM,CVM>::InitPy(const vector<CellType> & cell_types_, std::map
 template <typename APM,typename CVM>
 vector<int> BasicTissue<APM,CVM>::GetStates() const
 {
-    vector<int> state(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        state[i] = int(tissue_nodes[i].GetState(tissue_time));
+    vector<int> state(size());
+    FillFields({{NodeField::STATE, state.data()}});
     return state;
 }
 
@@ -381,9 +595,8 @@ vector<int> BasicTissue<APM,CVM>::GetStates() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetAPD() const
 {
-    vector<float> apd(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        apd[i] = tissue_nodes[i].apd_model.getAPD();
+    vector<float> apd(size());
+    FillFields({{NodeField::APD, apd.data()}});
     return apd;
 }
 
@@ -394,9 +607,8 @@ vector<float> BasicTissue<APM,CVM>::GetAPD() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetAP() const
 {
-    vector<float> ap(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        ap[i] = tissue_nodes[i].apd_model.getActionPotential(GetTime());
+    vector<float> ap(size());
+    FillFields({{NodeField::AP, ap.data()}});
     return ap;
 }
 
@@ -407,9 +619,8 @@ vector<float> BasicTissue<APM,CVM>::GetAP() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetCV() const
 {
-    vector<float> cv(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        cv[i] = tissue_nodes[i].conduction_vel;
+    vector<float> cv(size());
+    FillFields({{NodeField::CV, cv.data()}});
     return cv;
 }
 
@@ -420,9 +631,8 @@ vector<float> BasicTissue<APM,CVM>::GetCV() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetDI() const
 {
-    vector<float> di(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        di[i] = tissue_nodes[i].apd_model.getDI(GetTime());
+    vector<float> di(size());
+    FillFields({{NodeField::DI, di.data()}});
     return di;
 }
 
@@ -433,9 +643,8 @@ vector<float> BasicTissue<APM,CVM>::GetDI() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetLastDI() const
 {
-    vector<float> last_di(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        last_di[i] = tissue_nodes[i].apd_model.getLastDI();
+    vector<float> last_di(size());
+    FillFields({{NodeField::LAST_DI, last_di.data()}});
     return last_di;
 }
 
@@ -446,9 +655,8 @@ vector<float> BasicTissue<APM,CVM>::GetLastDI() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetLAT() const
 {
-    vector<float> lat(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        lat[i] = tissue_nodes[i].apd_model.getActivationTime();
+    vector<float> lat(size());
+    FillFields({{NodeField::LAT, lat.data()}});
     return lat;
 }
 
@@ -462,9 +670,8 @@ vector<float> BasicTissue<APM,CVM>::GetLAT() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetLife() const
 {
-    vector<float> lt(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        lt[i] = tissue_nodes[i].apd_model.getLife(GetTime());
+    vector<float> lt(size());
+    FillFields({{NodeField::LIFE, lt.data()}});
     return lt;
 }
 
@@ -475,9 +682,8 @@ vector<float> BasicTissue<APM,CVM>::GetLife() const
 template <typename APM,typename CVM>
 vector<int> BasicTissue<APM,CVM>::GetBeat() const
 {
-    vector<int> beat(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        beat[i] = tissue_nodes[i].GetBeat();
+    vector<int> beat(size());
+    FillFields({{NodeField::BEAT, beat.data()}});
     return beat;
 }
 
@@ -488,12 +694,48 @@ vector<int> BasicTissue<APM,CVM>::GetBeat() const
 template <typename APM,typename CVM>
 vector<float> BasicTissue<APM,CVM>::GetAPDVariation() const
 {
-    vector<float> delta_apd(tissue_nodes.size());
-    for(size_t i = 0; i < tissue_nodes.size(); i++)
-        delta_apd[i] = tissue_nodes[i].apd_model.getDeltaAPD();
+    vector<float> delta_apd(size());
+    FillFields({{NodeField::APD_VARIATION, delta_apd.data()}});
     return delta_apd;
 }
 
+/**
+ * Fill several per-node fields in a single pass over the grid nodes.
+ * Each buffer must hold size() elements, or one per id if ids is given, int for STATE and BEAT,
+ * float for the rest. VOID nodes get the values of void_node.
+ * @param buffers Fields to extract and their output buffers.
+ * @param ids Ids of the nodes to extract, or nullptr for all the grid nodes.
+ */
+template <typename APM,typename CVM>
+void BasicTissue<APM,CVM>::FillFields(const vector<FieldBuffer> & buffers, const vector<size_t> * ids) const
+{
+    const float t = GetTime();
+    const vector<int> & index = *live_index;
+    const size_t n = ids == nullptr ? index.size() : ids->size();
+    for(size_t i = 0; i < n; i++)
+    {
+        const size_t id = ids == nullptr ? i : (*ids)[i];
+        const Node & node = index[id] < 0 ? void_node : tissue_nodes[index[id]];
+        for(const auto & b : buffers)
+        {
+            switch(b.field)
+            {
+                case NodeField::STATE:          static_cast<int *>(b.data)[i] = int(node.GetState(t)); break;
+                case NodeField::APD:            static_cast<float *>(b.data)[i] = node.apd_model.getAPD(); break;
+                case NodeField::AP:             static_cast<float *>(b.data)[i] = node.apd_model.getActionPotential(t); break;
+                case NodeField::CV:             static_cast<float *>(b.data)[i] = node.conduction_vel; break;
+                case NodeField::DI:             static_cast<float *>(b.data)[i] = node.apd_model.getDI(t); break;
+                case NodeField::LAST_DI:        static_cast<float *>(b.data)[i] = node.apd_model.getLastDI(); break;
+                case NodeField::LAT:            static_cast<float *>(b.data)[i] = node.apd_model.getActivationTime(); break;
+                case NodeField::LIFE:           static_cast<float *>(b.data)[i] = node.apd_model.getLife(t); break;
+                case NodeField::BEAT:           static_cast<int *>(b.data)[i] = node.GetBeat(); break;
+                case NodeField::APD_VARIATION:  static_cast<float *>(b.data)[i] = node.apd_model.getDeltaAPD(); break;
+                default: break;
+            }
+        }
+    }
+}
+
 /**
  * Set a timer for the simulation. There can be one timer for each type of system event.
  * @param period Period (time between events) in milliseconds.
@@ -580,84 +822,108 @@ void BasicTissue<APM,CVM>::SetBorder(vector<CellType> & cell_types_, CellType bo
             }
 }
 
+/**
+ * Save the state of the simulation to a file.
+ * Each field is saved as a contiguous block (see StateWriter), so the file is written with a few
+ * large writes and can be memory-mapped when it is loaded.
+ * @param filename Name of the file.
+ * @param compress Compress the blocks with zlib, if the module was built with it.
+ */
 template <typename APM,typename CVM>
-void BasicTissue<APM,CVM>::SaveState(const std::string & filename) const
+void BasicTissue<APM,CVM>::SaveState(const std::string & filename, bool compress) const
 {
-    std::ofstream state_file;
-    state_file.open(filename, std::ios::binary);
-    if(!state_file)
-    {
-        LOG::Error(true, "Could not open file " + filename + " for writing.");
-        return;
-    }
+    StateWriter state_file(SAVE_VERSION, compress);
+    SaveBlocks(state_file);
+    state_file.Write(filename);
+}
 
-    // Save version
-    state_file.write( (const char*) (&SAVE_VERSION), sizeof(SAVE_VERSION) );
+/**
+ * Add the blocks of the state of the tissue to a state file.
+ * @param state_file Output file.
+ */
+template <typename APM,typename CVM>
+void BasicTissue<APM,CVM>::SaveBlocks(StateWriter & state_file) const
+{
     // Save tissue time
-    state_file.write( (const char*) (&tissue_time), sizeof(tissue_time) );
+    state_file.Add("time", vector<float>{tissue_time});
     // Save timer
-    state_file.write( (const char*) (timer.data()), sizeof(float) * int(SystemEventType::SIZE) );
-    // Save number of live nodes
-    state_file.write( (const char*) (&n_live_nodes), sizeof(n_live_nodes) );
+    state_file.Add("timer", vector<float>(timer.begin(), timer.end()));
 
     // Save geometry
     tissue_geometry.SaveState(state_file);
+    // Save the ids of the live nodes
+    vector<int> live_ids(tissue_nodes.size());
+    for(size_t i = 0; i < tissue_nodes.size(); i++)
+        live_ids[i] = tissue_nodes[i].id;
+    state_file.Add("live_ids", std::move(live_ids));
     // Save parameters pool
-    parameters_pool.SaveState(state_file);
+    parameters_pool->SaveState(state_file);
     // Save event queue
     event_queue.SaveState(state_file, tissue_nodes);
-
-    // Save each node
-    for(const auto & node : tissue_nodes)
-    {
-        node.SaveState(state_file, parameters_pool, event_queue);
-    }
-
-    state_file.close();
+    // Save the nodes
+    Node::SaveState(state_file, tissue_nodes, *parameters_pool, event_queue);
+    // Save the table of anisotropy factors, so it is not computed again on load. It may be empty
+    state_file.Add("anisotropy_factor", anisotropy_factor ? *anisotropy_factor : vector<float>());
 }
 
+/**
+ * Load the state of the simulation from a file saved with SaveState.
+ * The tissue must have the same size and spacing, and InitModels must have been called.
+ * @param filename Name of the file.
+ */
 template <typename APM,typename CVM>
 void BasicTissue<APM,CVM>::LoadState(const std::string & filename)
 {
-    std::ifstream state_file;
-    state_file.open(filename, std::ios::binary);
-    if(!state_file)
-    {
-        LOG::Error(true, "Could not open file " + filename + " for reading.");
-        return;
-    }
+    StateReader state_file(filename);
+    LoadBlocks(state_file);
+}
 
-    // Load version
-    int version;
-    state_file.read( (char*) (&version), sizeof(version) );
-    if(version != SAVE_VERSION)
-    {
-        LOG::Error(true, "Save version (", version, ") does not match current version (", SAVE_VERSION, ").");
-        return;
-    }
+/**
+ * Load the state of the tissue from the blocks of a state file.
+ * @param state_file Input file.
+ * @throw std::runtime_error if the file has another version. The tissue is not changed.
+ */
+template <typename APM,typename CVM>
+void BasicTissue<APM,CVM>::LoadBlocks(StateReader & state_file)
+{
+    if(!apd_models || !cv_models)
+        throw std::runtime_error("BasicTissue::LoadState: restitution models not loaded. Call InitModels first.");
+
+    // Check version
+    if(state_file.GetVersion() != SAVE_VERSION)
+        throw std::runtime_error("BasicTissue::LoadState: Save version (" + std::to_string(state_file.GetVersion()) +
+                                 ") does not match current version (" + std::to_string(SAVE_VERSION) + ").");
 
     // Load tissue time
-    state_file.read( (char*) (&tissue_time), sizeof(tissue_time) );
+    tissue_time = *state_file.Get<float>("time", 1);
     // Load timer
-    state_file.read( (char*) (timer.data()), sizeof(float) * int(SystemEventType::SIZE) );
-    // Load number of live nodes
-    state_file.read( (char*) (&n_live_nodes), sizeof(n_live_nodes) );
+    const float * timer_data = state_file.Get<float>("timer", timer.size());
+    std::copy(timer_data, timer_data + timer.size(), timer.begin());
 
     // Load geometry
     tissue_geometry.LoadState(state_file);
+    // Load the ids of the live nodes and rebuild the neighbour table
+    const size_t n_live = state_file.GetSize("live_ids");
+    const int * ids = state_file.Get<int>("live_ids", n_live);
+    vector<int> live_ids(ids, ids + n_live);
+    BuildLiveNodes(live_ids);
     // Load parameters pool
-    parameters_pool.LoadState(state_file);
-    LOG::Info(debug_level > 0, parameters_pool.Info());
+    parameters_pool = std::make_shared<ParametersPool>();
+    parameters_pool->LoadState(state_file);
+    LOG::Info(debug_level > 0, parameters_pool->Info());
     // Load event queue
     event_queue.LoadState(state_file, tissue_nodes);
-
-    // Load each node
-    for(auto & node : tissue_nodes)
+    // Load the nodes
+    Node::LoadState(state_file, tissue_nodes, *parameters_pool, event_queue, *this);
+    // Load the table of anisotropy factors, or build it if it was saved with other settings
+    const size_t n_factors = state_file.GetSize("anisotropy_factor");
+    if(use_anisotropy_table && n_factors == tissue_nodes.size() * num_directions)
     {
-        node.LoadState(state_file, parameters_pool, event_queue, *this);
+        const float * factors = state_file.Get<float>("anisotropy_factor", n_factors);
+        anisotropy_factor = std::make_shared<const vector<float>>(factors, factors + n_factors);
     }
-
-    state_file.close();
+    else
+        BuildAnisotropyTable();
 }
 
 template <typename APM,typename CVM>
@@ -705,9 +971,10 @@ void BasicTissue<APM,CVM>::SaveVTK(const std::string & filename) const
     vtk_file << "\nPOINT_DATA " << tissue_geometry.size_x * tissue_geometry.size_y * tissue_geometry.size_z << std::endl;
     vtk_file << "SCALARS Type int 1\n";
     vtk_file << "LOOKUP_TABLE default" << std::endl;
-    for(int i = 0; i < int(tissue_nodes.size()); i++)
+    for(int i = 0; i < int(size()); i++)
     {
-        vtk_file << int(tissue_nodes[i].type) << " ";
+        const int k = (*live_index)[i];
+        vtk_file << int(k < 0 ? void_node.type : tissue_nodes[k].type) << " ";
         if((i+1) % 10 == 0)
             vtk_file << "\n";
     }
@@ -715,9 +982,10 @@ void BasicTissue<APM,CVM>::SaveVTK(const std::string & filename) const
 
     vtk_file << "SCALARS State int 1\n";
     vtk_file << "LOOKUP_TABLE default" << std::endl;
-    for(int i = 0; i < int(tissue_nodes.size()); i++)
+    vector<int> states = GetStates();
+    for(int i = 0; i < int(states.size()); i++)
     {
-        vtk_file << int(tissue_nodes[i].GetState(tissue_time) ) << " ";
+        vtk_file << states[i] << " ";
         if((i+1) % 10 == 0)
             vtk_file << "\n";
     }
@@ -0,0 +1,149 @@
+/**
+ * @file beat_recorder.h
+ * Per-beat activation maps of the cardiac tissue simulation.
+ *
+ */
+
+#ifndef BEAT_RECORDER_H
+#define BEAT_RECORDER_H
+#include <array>
+#include <limits>
+#include <map>
+#include <vector>
+
+#include "state_file.h"
+
+/**
+ * @brief Records, for each beat, the LAT, APD, DI and CV of the activation of each node.
+ *
+ * The maps are indexed by the position of the node in the live nodes of the tissue. Nodes not
+ * activated in a beat have NaN. If a node is activated more than once in the same beat, the last
+ * activation is kept.
+ */
+class BeatRecorder
+{
+public:
+    /// Fields stored for each activation.
+    enum class BeatField {LAT, APD, DI, CV, SIZE};
+    using BeatMaps = std::array<std::vector<float>, int(BeatField::SIZE)>;
+
+    /**
+     * @brief Start recording the beats in [first_beat, last_beat]. Previous maps are discarded.
+     * @param n_nodes_ Number of live nodes.
+     * @param first_beat_ First beat recorded.
+     * @param last_beat_ Last beat recorded. If negative, there is no limit.
+     */
+    void Init(size_t n_nodes_, int first_beat_ = 0, int last_beat_ = -1)
+    {
+        enabled = true;
+        n_nodes = n_nodes_;
+        first_beat = first_beat_;
+        last_beat = last_beat_;
+        beat_maps.clear();
+    }
+
+    /** Stop recording and discard the maps */
+    void Disable()
+    {
+        enabled = false;
+        beat_maps.clear();
+    }
+
+    bool IsEnabled() const { return enabled; }
+
+    /**
+     * @brief Record an activation, if its beat is in the range.
+     * @param node Position of the node in the live nodes.
+     */
+    void Record(size_t node, int beat, float lat, float apd, float di, float cv)
+    {
+        if(!enabled || beat < first_beat || (last_beat >= 0 && beat > last_beat))
+            return;
+        auto it = beat_maps.find(beat);
+        if(it == beat_maps.end())
+        {
+            it = beat_maps.emplace(beat, BeatMaps()).first;
+            for(auto & map : it->second)
+                map.assign(n_nodes, std::numeric_limits<float>::quiet_NaN());
+        }
+        BeatMaps & maps = it->second;
+        maps[int(BeatField::LAT)][node] = lat;
+        maps[int(BeatField::APD)][node] = apd;
+        maps[int(BeatField::DI)][node] = di;
+        maps[int(BeatField::CV)][node] = cv;
+    }
+
+    /** Get the beats with recorded activations, in increasing order */
+    std::vector<int> GetBeats() const
+    {
+        std::vector<int> beats;
+        for(const auto & pair : beat_maps)
+            beats.push_back(pair.first);
+        return beats;
+    }
+
+    /**
+     * @brief Get the maps of a beat.
+     * @return Pointer to the maps, or nullptr if the beat has no recorded activations.
+     */
+    const BeatMaps * GetMaps(int beat) const
+    {
+        auto it = beat_maps.find(beat);
+        return it == beat_maps.end() ? nullptr : &it->second;
+    }
+
+    /** Discard the maps of a beat, once they have been saved */
+    void Erase(int beat)
+    {
+        beat_maps.erase(beat);
+    }
+
+    /**
+     * Save the settings and the maps to a state file.
+     * @param f Output file.
+     */
+    void SaveState(StateWriter & f) const
+    {
+        std::vector<float> maps;
+        maps.reserve(beat_maps.size() * int(BeatField::SIZE) * n_nodes);
+        for(const auto & pair : beat_maps)
+            for(const auto & map : pair.second)
+                maps.insert(maps.end(), map.begin(), map.end());
+        f.Add("beat_recorder", std::vector<int>{enabled, first_beat, last_beat});
+        f.Add("beat_numbers", GetBeats());
+        f.Add("beat_maps", std::move(maps));
+    }
+
+    /**
+     * Load the settings and the maps from a state file.
+     * @param f Input file.
+     * @param n_nodes_ Number of live nodes.
+     */
+    void LoadState(StateReader & f, size_t n_nodes_)
+    {
+        const int * settings = f.Get<int>("beat_recorder", 3);
+        enabled = settings[0];
+        first_beat = settings[1];
+        last_beat = settings[2];
+        n_nodes = n_nodes_;
+        const size_t n_beats = f.GetSize("beat_numbers");
+        const int * beats = f.Get<int>("beat_numbers", n_beats);
+        const float * maps = f.Get<float>("beat_maps", n_beats * int(BeatField::SIZE) * n_nodes);
+        beat_maps.clear();
+        for(size_t i = 0; i < n_beats; i++)
+            for(auto & map : beat_maps[beats[i]])
+            {
+                map.assign(maps, maps + n_nodes);
+                maps += n_nodes;
+            }
+    }
+
+private:
+    bool enabled = false;
+    size_t n_nodes = 0;
+    int first_beat = 0;
+    int last_beat = -1;
+    std::map<int, BeatMaps> beat_maps;
+};
+
+#endif // BEAT_RECORDER_H
@@ -1,5 +1,8 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
+#include <algorithm>
+#include <cstring>
 //#include <pybind11/eigen.h>
 #include "../src/cell_event_queue.h"
 #include "../src/tissue.h"
@@ -12,10 +15,178 @@
 
 namespace py = pybind11;
 
+/**
+ * @brief Get a numpy array to store a field of the tissue.
+ * If out is None, a new array is created. Otherwise, out must be a writeable C-contiguous
+ * array with one element per node and the dtype of the field. It is filled in place.
+ */
+template <typename T>
+py::array_t<T> FieldArray(size_t n_nodes, const std::string & name, const py::object & out)
+{
+    if(out.is_none())
+        return py::array_t<T>(n_nodes);
+
+    if(!py::isinstance<py::array_t<T, py::array::c_style>>(out))
+        throw py::type_error("Output array for " + name + " must be a C-contiguous array of " + std::string(py::str(py::dtype::of<T>())));
+    auto array = out.cast<py::array_t<T, py::array::c_style>>();
+    if(size_t(array.size()) != n_nodes)
+        throw py::value_error("Output array for " + name + " has " + std::to_string(array.size()) + " elements, expected " + std::to_string(n_nodes));
+    if(!array.writeable())
+        throw py::value_error("Output array for " + name + " is read-only");
+    return array;
+}
+
+/**
+ * @brief Copy a 1D sequence (numpy array, list or scalar) to a vector of T.
+ * Numpy arrays are copied in bulk instead of element by element.
+ */
+template <typename T>
+std::vector<T> ArrayVector(const py::object & in, const std::string & name)
+{
+    auto array = py::array_t<T, py::array::c_style | py::array::forcecast>::ensure(in);
+    if(!array || array.ndim() > 1)
+        throw py::type_error(name + " must be a 1D sequence convertible to " + std::string(py::str(py::dtype::of<T>())));
+    return std::vector<T>(array.data(), array.data() + array.size());
+}
+
+/**
+ * @brief Copy a 1D sequence of node ids to a vector, checking that they are in the tissue.
+ */
+template <typename Tissue>
+std::vector<size_t> NodeIds(const Tissue & tissue, const py::object & nodes)
+{
+    std::vector<size_t> ids = ArrayVector<size_t>(nodes, "nodes");
+    for(size_t id : ids)
+        if(id >= tissue.size())
+            throw py::index_error("Node id " + std::to_string(id) + " out of range");
+    return ids;
+}
+
+/**
+ * @brief Fill several fields of the tissue in a single pass and return them as numpy arrays.
+ * @param tissue Tissue.
+ * @param names Names of the fields.
+ * @param out Dictionary with arrays to be filled in place. Missing arrays are created and added to it.
+ * @param nodes Ids of the nodes to extract. If None, all the nodes.
+ */
+template <typename Tissue>
+py::dict GetFields(const Tissue & tissue, const std::vector<std::string> & names, py::object out, py::object nodes)
+{
+    py::dict fields = out.is_none() ? py::dict() : out.cast<py::dict>();
+    const auto & field_names = Tissue::GetFieldNames();
+    std::vector<typename Tissue::FieldBuffer> buffers;
+
+    std::vector<size_t> ids;
+    if(!nodes.is_none())
+        ids = NodeIds(tissue, nodes);
+    const size_t n = nodes.is_none() ? tissue.size() : ids.size();
+
+    for(const auto & name : names)
+    {
+        auto it = std::find(field_names.begin(), field_names.end(), name);
+        if(it == field_names.end())
+            throw py::key_error("Unknown field: " + name);
+        auto field = static_cast<typename Tissue::NodeField>(it - field_names.begin());
+
+        py::object array_out = fields.contains(name) ? py::object(fields[name.c_str()]) : py::object(py::none());
+        void * data;
+        if(Tissue::IsIntField(field))
+        {
+            auto array = FieldArray<int>(n, name, array_out);
+            data = array.mutable_data();
+            fields[name.c_str()] = array;
+        }
+        else
+        {
+            auto array = FieldArray<float>(n, name, array_out);
+            data = array.mutable_data();
+            fields[name.c_str()] = array;
+        }
+        buffers.push_back({field, data});
+    }
+
+    {
+        py::gil_scoped_release release;
+        tissue.FillFields(buffers, nodes.is_none() ? nullptr : &ids);
+    }
+    return fields;
+}
+
+/**
+ * @brief Fill a single field of the tissue and return it as a numpy array.
+ */
+template <typename Tissue, typename T>
+py::array_t<T> GetField(const Tissue & tissue, typename Tissue::NodeField field, const py::object & out)
+{
+    const std::string & name = Tissue::GetFieldNames().at(int(field));
+    auto array = FieldArray<T>(tissue.size(), name, out);
+    T * data = array.mutable_data();
+    {
+        py::gil_scoped_release release;
+        tissue.FillFields({{field, data}});
+    }
+    return array;
+}
+
+/**
+ * @brief Copy the sensor records into a numpy structured array, with a node_id field and
+ * a field for each element of the sensor data.
+ * @param columns Sensor records, by columns.
+ * @param names Names of the elements of the sensor data.
+ */
+template <typename Columns>
+py::array SensorArray(const Columns & columns, const std::vector<std::string> & names)
+{
+    py::list descr;
+    descr.append(py::make_tuple("node_id", py::dtype::of<int>()));
+    std::apply([&](const auto &... column) {
+        size_t i = 0;
+        (descr.append(py::make_tuple(names.at(i++), py::dtype::of<typename std::decay_t<decltype(column)>::value_type>())), ...);
+    }, columns.columns);
+    py::dtype dtype = py::dtype::from_args(descr);
+    py::array array(dtype, std::vector<py::ssize_t>{py::ssize_t(columns.size())});
+
+    // Offsets of the fields in a record
+    py::dict fields = dtype.attr("fields");
+    std::vector<size_t> offsets;
+    offsets.push_back(fields["node_id"].cast<py::tuple>()[1].cast<size_t>());
+    for(const auto & name : names)
+        offsets.push_back(fields[name.c_str()].cast<py::tuple>()[1].cast<size_t>());
+
+    char * data = static_cast<char *>(array.mutable_data());
+    const size_t itemsize = dtype.itemsize();
+    auto copy_column = [&](const auto & column, size_t offset) {
+        for(size_t i = 0; i < column.size(); i++)
+            std::memcpy(data + i * itemsize + offset, &column[i], sizeof(column[i]));
+    };
+    copy_column(columns.node_ids, offsets[0]);
+    std::apply([&](const auto &... column) {
+        size_t i = 1;
+        (copy_column(column, offsets[i++]), ...);
+    }, columns.columns);
+    return array;
+}
+
+/**
+ * @brief Get a numpy array with the data sent by another subdomain.
+ * It is converted to a C-contiguous array of T if needed, and must have n elements.
+ */
+template <typename T>
+py::array_t<T> ExchangeArray(size_t n, const std::string & name, const py::object & in)
+{
+    auto array = py::array_t<T, py::array::c_style | py::array::forcecast>::ensure(in);
+    if(!array)
+        throw py::type_error(name + " must be convertible to an array of " + std::string(py::str(py::dtype::of<T>())));
+    if(size_t(array.size()) != n)
+        throw py::value_error(name + " has " + std::to_string(array.size()) + " elements, expected " + std::to_string(n));
+    return array;
+}
+
 PYBIND11_MODULE(MODULE_NAME, m) {
     // Define aliases for the template parameters
     using T_AP = ActionPotentialRestSurface;
     using T_CV = ConductionVelocity;
+    using Tissue = CardiacTissue<T_AP, T_CV>;
 
     // Expose the SystemEventType enum
     py::enum_<SystemEventType>(m, "SystemEventType")
@@ -26,31 +197,106 @@ PYBIND11_MODULE(MODULE_NAME, m) {
         .value("NO_EVENT", SystemEventType::NO_EVENT)
         .export_values();
 
+    // Expose the EventQueueType enum
+    py::enum_<EventQueueType>(m, "EventQueueType")
+        .value("HEAP", EventQueueType::HEAP)
+        .value("CALENDAR", EventQueueType::CALENDAR);
+
     py::class_<CardiacTissue<T_AP, T_CV>>(m, "CardiacTissue")
-        .def(py::init<int, int, int, double, double, double>())
+        .def(py::init<int, int, int, double, double, double, EventQueueType>(),
+             py::arg("size_x"), py::arg("size_y"), py::arg("size_z"), py::arg("dx"), py::arg("dy"), py::arg("dz"),
+             py::arg("queue_type") = EventQueueType::HEAP)
+        .def("GetEventQueueType", &CardiacTissue<T_AP, T_CV>::GetEventQueueType)
         .def("InitModels", &CardiacTissue<T_AP, T_CV>::InitModels,
              py::arg("fileAP"), py::arg("fileCV"))
         .def("InitPy", &CardiacTissue<T_AP, T_CV>::InitPy,
-             py::arg("cell_types"), py::arg("parameters"), py::arg("fiber_orientation") = std::vector<std::vector<float>>({{0.0, 0.0, 0.0}}))
+             py::arg("cell_types"), py::arg("parameters"), py::arg("fiber_orientation") = std::vector<std::vector<float>>({{0.0, 0.0, 0.0}}),
+             py::call_guard<py::gil_scoped_release>())
         .def("ChangeParameters", &CardiacTissue<T_AP, T_CV>::ChangeParameters)
         //.def("Reset", &CardiacTissue<T_AP, T_CV>::Reset)
-        .def("GetStates", &CardiacTissue<T_AP, T_CV>::GetStates)
-        .def("GetAPD", &CardiacTissue<T_AP, T_CV>::GetAPD)
-        .def("GetAP", &CardiacTissue<T_AP, T_CV>::GetAP)
-        .def("GetCV", &CardiacTissue<T_AP, T_CV>::GetCV)
-        .def("GetDI", &CardiacTissue<T_AP, T_CV>::GetDI)
-        .def("GetLastDI", &CardiacTissue<T_AP, T_CV>::GetLastDI)
-        .def("GetLAT", &CardiacTissue<T_AP, T_CV>::GetLAT)
-        .def("GetLife", &CardiacTissue<T_AP, T_CV>::GetLife)
-        .def("GetBeat", &CardiacTissue<T_AP, T_CV>::GetBeat)
-        .def("GetAPDVariation", &CardiacTissue<T_AP, T_CV>::GetAPDVariation)
+        .def("GetStates", [](const Tissue & t, py::object out) { return GetField<Tissue, int>(t, Tissue::NodeField::STATE, out); },
+             py::arg("out") = py::none())
+        .def("GetAPD", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::APD, out); },
+             py::arg("out") = py::none())
+        .def("GetAP", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::AP, out); },
+             py::arg("out") = py::none())
+        .def("GetCV", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::CV, out); },
+             py::arg("out") = py::none())
+        .def("GetDI", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::DI, out); },
+             py::arg("out") = py::none())
+        .def("GetLastDI", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::LAST_DI, out); },
+             py::arg("out") = py::none())
+        .def("GetLAT", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::LAT, out); },
+             py::arg("out") = py::none())
+        .def("GetLife", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::LIFE, out); },
+             py::arg("out") = py::none())
+        .def("GetBeat", [](const Tissue & t, py::object out) { return GetField<Tissue, int>(t, Tissue::NodeField::BEAT, out); },
+             py::arg("out") = py::none())
+        .def("GetAPDVariation", [](const Tissue & t, py::object out) { return GetField<Tissue, float>(t, Tissue::NodeField::APD_VARIATION, out); },
+             py::arg("out") = py::none())
+        .def("GetFields", &GetFields<Tissue>,
+             py::arg("names"), py::arg("out") = py::none(), py::arg("nodes") = py::none(),
+             "Get several node fields in a single pass. Returns a dictionary of numpy arrays. Arrays already in out are filled in place. "
+             "If nodes is given, only the values of those nodes are extracted.")
         .def("GetIndex", &CardiacTissue<T_AP, T_CV>::GetIndex)
-        .def("ExternalActivation", &CardiacTissue<T_AP, T_CV>::ExternalActivation)
-        .def("SaveVTK", &CardiacTissue<T_AP, T_CV>::SaveVTK)
+        .def("ExternalActivation", [](Tissue & t, py::object nodes, float activation_time, int beat_n) {
+                t.ExternalActivation(NodeIds(t, nodes), activation_time, beat_n);
+             },
+             py::arg("nodes"), py::arg("activation_time"), py::arg("beat_n"),
+             "Schedule the external activation of the nodes at activation_time, with the beat beat_n")
+        .def("ExternalActivation", [](Tissue & t, py::object nodes, py::object activation_times, py::object beats) {
+                std::vector<size_t> ids = NodeIds(t, nodes);
+                std::vector<float> times = ArrayVector<float>(activation_times, "activation_times");
+                std::vector<int> beat_numbers = ArrayVector<int>(beats, "beats");
+                if((times.size() != ids.size() && times.size() != 1) || (beat_numbers.size() != ids.size() && beat_numbers.size() != 1))
+                    throw py::value_error("activation_times and beats must have one value per node, or a single one");
+                t.ExternalActivation(ids, times, beat_numbers);
+             },
+             py::arg("nodes"), py::arg("activation_times"), py::arg("beats"),
+             "Schedule the external activation of each node at its own time and with its own beat. "
+             "The arguments are numpy arrays, copied in bulk; activation_times and beats can also have a single value for all the nodes")
+        .def("AddStimulusTrain", [](Tissue & t, py::object nodes, py::object first_times, const std::vector<float> & bcl,
+                                    const std::vector<int> & n_stims, int first_beat) {
+                std::vector<size_t> ids = NodeIds(t, nodes);
+                std::vector<float> times = ArrayVector<float>(first_times, "first_times");
+                if(times.size() != ids.size() && times.size() != 1)
+                    throw py::value_error("first_times must have one time per node, or a single one");
+                if(bcl.size() != n_stims.size())
+                    throw py::value_error("bcl and n_stims must have the same length");
+                t.AddStimulusTrain(ids, times, bcl, n_stims, first_beat);
+             },
+             py::arg("nodes"), py::arg("first_times"), py::arg("bcl"), py::arg("n_stims"), py::arg("first_beat") = 1,
+             "Add a train of stimuli, applied by the tissue while it runs. Each node is stimulated first at its first time "
+             "(first_times has one time per node, or a single one), and then n_stims[b] times every bcl[b] for each block b. "
+             "The beats are numbered from first_beat.")
+        .def("AddStimuli", [](Tissue & t, py::object nodes, py::object times, py::object beats) {
+                std::vector<size_t> ids = NodeIds(t, nodes);
+                std::vector<float> stimulus_times = ArrayVector<float>(times, "times");
+                std::vector<int> beat_numbers = ArrayVector<int>(beats, "beats");
+                if(stimulus_times.size() != ids.size() || beat_numbers.size() != ids.size())
+                    throw py::value_error("times and beats must have one value per node");
+                t.AddStimuli(ids, stimulus_times, beat_numbers);
+             },
+             py::arg("nodes"), py::arg("times"), py::arg("beats"),
+             "Add single stimuli, applied by the tissue while it runs: nodes[i] is stimulated at times[i] with the beat beats[i].")
+        .def("ClearStimuli", &CardiacTissue<T_AP, T_CV>::ClearStimuli,
+             "Remove the stimuli that have not been applied yet")
+        .def("GetNextStimulusTime", &CardiacTissue<T_AP, T_CV>::GetNextStimulusTime,
+             "Get the time of the next stimulus, or the largest float if there are no more stimuli")
+        .def("SaveVTK", &CardiacTissue<T_AP, T_CV>::SaveVTK, py::call_guard<py::gil_scoped_release>())
         .def("GetTime", &CardiacTissue<T_AP, T_CV>::GetTime)
+        .def("GetNumEvents", &CardiacTissue<T_AP, T_CV>::GetNumEvents,
+             "Get the number of node events processed since the tissue was created")
         .def("update", &CardiacTissue<T_AP, T_CV>::update,
              py::arg("debug") = 0,
+             py::call_guard<py::gil_scoped_release>(),
              "Update the tissue state by processing the next event in the queue. Returns the type of event that was processed.")
+        .def("RunUntil", &CardiacTissue<T_AP, T_CV>::RunUntil,
+             py::arg("t_stop"),
+             py::arg("stop_on") = std::vector<SystemEventType>({SystemEventType::EXT_ACTIVATION, SystemEventType::FILE_WRITE}),
+             py::arg("debug") = 0,
+             py::call_guard<py::gil_scoped_release>(),
+             "Process events until a system event in stop_on is processed or the time reaches t_stop. Returns the type of the last event processed.")
         .def("SetTimer", &CardiacTissue<T_AP, T_CV>::SetTimer,
              py::arg("type"), py::arg("period"), py::arg("initial_time") = 0.0f,
              "Set a timer for a system event. There can be one timer for each type of system event.")
@@ -61,7 +307,21 @@ PYBIND11_MODULE(MODULE_NAME, m) {
         .def("GetSizeY", &CardiacTissue<T_AP, T_CV>::GetSizeY)
         .def("GetSizeZ", &CardiacTissue<T_AP, T_CV>::GetSizeZ)
         .def("GetSensorInfo", &CardiacTissue<T_AP, T_CV>::GetSensorInfo,
+             py::call_guard<py::gil_scoped_release>(),
              "Get sensor data collected during the simulation")
+        .def("GetSensorArray", [](const CardiacTissue<T_AP, T_CV> & self) {
+                return SensorArray(self.GetSensorColumns(), self.GetSensorDataNames());
+             },
+             "Get the sensor data collected during the simulation as a numpy structured array, with one record per row")
+        .def("DrainSensorData", [](CardiacTissue<T_AP, T_CV> & self) {
+                typename CardiacTissue<T_AP, T_CV>::SensorColumns columns;
+                {
+                    py::gil_scoped_release release;
+                    columns = self.DrainSensorData();
+                }
+                return SensorArray(columns, self.GetSensorDataNames());
+             },
+             "Get the sensor data collected since the last call as a numpy structured array, and remove it from the tissue")
         .def("GetSensorDataNames", &CardiacTissue<T_AP, T_CV>::GetSensorDataNames,
              "Get the names of the sensor data collected during the simulation")
         .def("GetDefaultParameters", &CardiacTissue<T_AP, T_CV>::GetDefaultParameters,
@@ -71,10 +331,154 @@ PYBIND11_MODULE(MODULE_NAME, m) {
         .def("ResetVariations", &CardiacTissue<T_AP, T_CV>::ResetVariations,
              "Reset the accumulated APD and CV variations to zero")
         .def("SaveState", &CardiacTissue<T_AP, T_CV>::SaveState,
-             "Save the current state of the tissue to a binary file")
+             py::arg("filename"), py::arg("compress") = false,
+             py::call_guard<py::gil_scoped_release>(),
+             "Save the current state of the tissue, with its beat maps, pseudo-ECG and stimuli, to a binary file. With compress=True the blocks are compressed with zlib, if available")
         .def("LoadState", &CardiacTissue<T_AP, T_CV>::LoadState,
+             py::call_guard<py::gil_scoped_release>(),
              "Load the state of the tissue from a binary file")
-        .def("SetInitialAPD", &CardiacTissue<T_AP, T_CV>::SetInitialAPD);
+        .def("Clone", &Tissue::Clone,
+             py::call_guard<py::gil_scoped_release>(),
+             "Copy the tissue in memory. The copy continues the simulation from the same state")
+        .def("__deepcopy__", [](const Tissue & t, const py::dict &) {
+                py::gil_scoped_release release;
+                return t.Clone();
+             }, py::arg("memo"))
+        .def("SetInitialAPD", &CardiacTissue<T_AP, T_CV>::SetInitialAPD)
+        .def("SetAnisotropyTable", &CardiacTissue<T_AP, T_CV>::SetAnisotropyTable,
+             py::arg("enabled"),
+             "Enable or disable the precomputed table of anisotropy factors. Disabling it saves memory, results are the same.")
+        // Domain decomposition
+        .def("GetMinTravelTime", &CardiacTissue<T_AP, T_CV>::GetMinTravelTime,
+             "Get a lower bound of the travel time between two neighbours, valid for the rest of the simulation")
+        .def("GetNextEventTime", &CardiacTissue<T_AP, T_CV>::GetNextEventTime,
+             "Get the time of the next event in the queue or the next stimulus, or the largest float if there are none")
+        .def("GetNextActivationTime", [](const Tissue & t, py::object nodes) {
+                std::vector<size_t> ids = NodeIds(t, nodes);
+                py::gil_scoped_release release;
+                return t.GetNextActivationTime(ids);
+             },
+             py::arg("nodes"),
+             "Get the earliest activation scheduled for the given nodes, or the largest float if there are none")
+        .def("RunWindow", &CardiacTissue<T_AP, T_CV>::RunWindow,
+             py::arg("t_end"), py::arg("debug") = 0,
+             py::call_guard<py::gil_scoped_release>(),
+             "Process the events earlier than t_end")
+        .def("AdvanceTime", &CardiacTissue<T_AP, T_CV>::AdvanceTime,
+             py::arg("t"),
+             "Advance the time of the tissue without processing events. It must not be later than the next event")
+        .def("SetExchangeNodes", &CardiacTissue<T_AP, T_CV>::SetExchangeNodes,
+             py::arg("boundary_ids"), py::arg("ghost_ids"),
+             "Set the nodes whose state is sent to the neighbour subdomains, and the nodes owned by them")
+        .def("GetBoundaryStates", [](const Tissue & t, py::object out) {
+                auto array = FieldArray<float>(t.GetNumBoundaryNodes() * Tissue::num_state_fields, "boundary states", out);
+                float * data = array.mutable_data();
+                {
+                    py::gil_scoped_release release;
+                    t.GetBoundaryStates(data);
+                }
+                return array;
+             },
+             py::arg("out") = py::none(),
+             "Get the state of the boundary nodes, as an array of (boundary nodes x 6) float32 values")
+        .def("SetGhostStates", [](Tissue & t, py::object states) {
+                auto array = ExchangeArray<float>(t.GetNumGhostNodes() * Tissue::num_state_fields, "Ghost states", states);
+                py::gil_scoped_release release;
+                t.SetGhostStates(array.data());
+             },
+             py::arg("states"),
+             "Set the state of the ghost nodes from the boundary states of their owners")
+        .def("ExportGhostActivations", [](Tissue & t, py::object times, py::object parents, py::object potentials) {
+                size_t n = t.GetNumGhostNodes();
+                auto a_times = FieldArray<float>(n, "times", times);
+                auto a_parents = FieldArray<int>(n, "parents", parents);
+                auto a_potentials = FieldArray<float>(n, "potentials", potentials);
+                float * p_times = a_times.mutable_data();
+                int * p_parents = a_parents.mutable_data();
+                float * p_potentials = a_potentials.mutable_data();
+                {
+                    py::gil_scoped_release release;
+                    t.ExportGhostActivations(p_times, p_parents, p_potentials);
+                }
+                return py::make_tuple(a_times, a_parents, a_potentials);
+             },
+             py::arg("times") = py::none(), py::arg("parents") = py::none(), py::arg("potentials") = py::none(),
+             "Extract the activations scheduled for ghost nodes. Returns the arrays (times, parents, potentials); parent is -1 for nodes without activation")
+        .def("ImportActivations", [](Tissue & t, py::object times, py::object parents, py::object potentials) {
+                size_t n = t.GetNumBoundaryNodes();
+                auto a_times = ExchangeArray<float>(n, "times", times);
+                auto a_parents = ExchangeArray<int>(n, "parents", parents);
+                auto a_potentials = ExchangeArray<float>(n, "potentials", potentials);
+                py::gil_scoped_release release;
+                t.ImportActivations(a_times.data(), a_parents.data(), a_potentials.data());
+             },
+             py::arg("times"), py::arg("parents"), py::arg("potentials"),
+             "Schedule the activations of boundary nodes sent by the neighbour subdomains")
+        // Changed nodes
+        .def("SetChangeTracking", &CardiacTissue<T_AP, T_CV>::SetChangeTracking,
+             py::arg("enabled"),
+             "Enable or disable the tracking of the nodes that change (events and scheduled activations)")
+        .def("GetChangeTracking", &CardiacTissue<T_AP, T_CV>::GetChangeTracking,
+             "Check if the nodes that change are tracked")
+        .def("GetChangedNodes", [](Tissue & t) {
+                auto nodes = t.GetChangedNodes();
+                return py::array_t<size_t>(nodes.size(), nodes.data());
+             },
+             "Get the ids of the nodes changed since the last call, as a numpy array, and start a new list")
+        .def("SetBeatRecorder", &CardiacTissue<T_AP, T_CV>::SetBeatRecorder,
+             py::arg("enabled"), py::arg("first_beat") = 0, py::arg("last_beat") = -1,
+             "Enable or disable the recording of the LAT, APD, DI and CV maps of the beats in [first_beat, last_beat]")
+        .def("GetBeatRecorder", &CardiacTissue<T_AP, T_CV>::GetBeatRecorder,
+             "Check if the beat maps are recorded")
+        .def("GetRecordedBeats", &CardiacTissue<T_AP, T_CV>::GetRecordedBeats,
+             "Get the beats with recorded activations")
+        .def("GetBeatMaps", [](const Tissue & t, int beat) {
+                py::dict maps;
+                const char * names[] = {"LAT", "APD", "DI", "CV"};
+                for(int i = 0; i < int(BeatRecorder::BeatField::SIZE); i++)
+                {
+                    py::array_t<float> array(t.size());
+                    if(!t.GetBeatMap(beat, BeatRecorder::BeatField(i), array.mutable_data()))
+                        throw py::key_error("No activations recorded for beat " + std::to_string(beat));
+                    maps[names[i]] = array;
+                }
+                return maps;
+             },
+             py::arg("beat"),
+             "Get the LAT, APD, DI and CV maps of a beat, as a dictionary of numpy arrays. Nodes not activated in the beat have NaN")
+        .def("EraseBeatMaps", &CardiacTissue<T_AP, T_CV>::EraseBeatMaps,
+             "Discard the maps of a beat")
+        .def("SetElectrogram", [](Tissue & t, const std::vector<size_t> & nodes, py::object weights, float period, py::object start_time) {
+                auto w = py::array_t<float, py::array::c_style | py::array::forcecast>::ensure(weights);
+                if(!w || w.ndim() != 2 || size_t(w.shape(0)) != nodes.size())
+                    throw py::value_error("weights must be a 2D array with one row per node and one column per lead");
+                for(size_t id : nodes)
+                    if(id >= t.size())
+                        throw py::index_error("Node id " + std::to_string(id) + " out of range");
+                if(period <= 0.0)
+                    throw py::value_error("The sampling period must be positive");
+                const float start = start_time.is_none() ? t.GetTime() : start_time.cast<float>();
+                if(start < t.GetTime())
+                    throw py::value_error("start_time is earlier than the current time of the tissue");
+                std::vector<float> values(w.data(), w.data() + w.size());
+                t.SetElectrogram(nodes, values, w.shape(1), period, start);
+             },
+             py::arg("nodes"), py::arg("weights"), py::arg("period"), py::arg("start_time") = py::none(),
+             "Compute a pseudo-ECG while the simulation runs, sampled every period. weights has one row per node and one column per lead")
+        .def("GetNumLeads", &CardiacTissue<T_AP, T_CV>::GetNumLeads,
+             "Get the number of leads of the pseudo-ECG, 0 if it is not computed")
+        .def("GetElectrogram", [](Tissue & t) {
+                std::vector<float> times, signals;
+                t.GetElectrogram(times, signals);
+                const py::ssize_t n_leads = t.GetNumLeads();
+                py::array_t<float> signal_array(std::vector<py::ssize_t>{py::ssize_t(times.size()), n_leads});
+                std::copy(signals.begin(), signals.end(), signal_array.mutable_data());
+                return py::make_tuple(py::array_t<float>(times.size(), times.data()), signal_array);
+             },
+             "Get the times and the samples of the pseudo-ECG taken up to the current time. The samples have one column per lead");
+
+    m.attr("NEIGHBOURS_DISTANCE") = int(Geometry::distance);
+    m.attr("STATE_COMPRESSION") = StateFile::CompressionAvailable();
 
 }
 
@@ -11,8 +11,11 @@
 #include <iostream>
 #include <fstream>
 #include <queue>
+#include <algorithm>
+#include <cmath>
 #include <cassert>
 #include "definitions.h"
+#include "state_file.h"
 
 
 enum class CellEventType : unsigned char
@@ -47,17 +50,22 @@ struct Event
     /**
     * @brief Comparison operator
     *
-    * @param other_ev Reference to the other event
-    * @return bool Returns true if this->time is less than other
+    * Events with the same time are ordered by their position in the vector of events
+    * of the queue: by the position of their node in the tissue, and the activation first.
+    *
+    * @param other_ev Reference to the other event, of the same queue
+    * @return bool Returns true if this event goes before the other
     */
     bool operator<(const Event & other_ev) const
     {
-        return this->event_time < other_ev.event_time;
+        return this->event_time < other_ev.event_time ||
+               (this->event_time == other_ev.event_time && this < &other_ev);
     }
 
     void Reset()
     {
         this->position_in_tree = -1;
+        this->bucket = -1;
         this->event_time = MAX_TIME;
     }
 
@@ -71,7 +79,8 @@ struct Event
     }
 
     Node * cell_node;                       ///< Pointer to the node to which it affects.
-    int position_in_tree;                   ///< Position of the event in the CellEventQueue tree
+    int position_in_tree;                   ///< Position of the event in the CellEventQueue tree, or in its bucket
+    int bucket;                             ///< Bucket of the calendar queue that holds the event. -1 if it is in the tree
     float event_time;                       ///< Event time
     CellEventType event_type;               ///< Event type
 
@@ -134,11 +143,26 @@ public:
     }
 };
 
+/**
+ * @brief Data structure used to order the cell events
+ */
+enum class EventQueueType : unsigned char
+{
+    HEAP = 0,   ///< Binary heap with all the events
+    CALENDAR    ///< Calendar queue. Only the events of the current bucket are kept in a heap
+};
+
 /**
  * @brief Priority queue of cell events
  *
  * Priority queue of cell events to store the events of the activation process.
  * The queue allows modification of the priority of a node.
+ *
+ * With EventQueueType::CALENDAR, events are distributed in buckets of calendar_bucket_width ms.
+ * Only the events of the current bucket are in the heap, so the heap stays small while
+ * the events far in the future (deactivations) are inserted and moved in O(1).
+ * Events are extracted in the same order with both types: by time and, at the same time,
+ * by the position of their node in the tissue, with the activation before the deactivation.
  */
 template<typename Node>
 class CellEventQueue
@@ -147,7 +171,13 @@ public:
 
     using CellEvent = Event<Node>;
 
-    CellEventQueue() = default;
+    static constexpr float calendar_bucket_width = 1.0f;    ///< Time width of a bucket of the calendar queue (ms)
+    static constexpr int calendar_n_buckets = 1024;         ///< Number of buckets. Power of 2. Later events go to an overflow bucket
+
+    CellEventQueue(EventQueueType type = EventQueueType::HEAP) : queue_type(type) {}
+
+    /** Get the type of the queue */
+    EventQueueType GetType() const { return queue_type; }
 
     /**
      * @brief Initializes the event queue with the nodes of the tissue
@@ -159,6 +189,7 @@ public:
         tree.clear();
         events.clear();
         system_events.clear();
+        ClearCalendar();
 
         tree.reserve(2 * n_live_nodes);
 
@@ -194,6 +225,25 @@ public:
         return &events[index];
     }
 
+    /**
+     * @brief Move the pointers of a copy of a queue to its own events and to a copy of the nodes.
+     *
+     * @param source Queue that was copied.
+     * @param source_nodes First node of the tissue of the source queue.
+     * @param nodes First node of the copy of the tissue.
+     */
+    void Rebase(const CellEventQueue & source, const Node * source_nodes, Node * nodes)
+    {
+        const CellEvent * source_events = source.events.data();
+        for(CellEvent & ev : events)
+            ev.cell_node = nodes + (ev.cell_node - source_nodes);
+        for(CellEvent *& ev : tree)
+            ev = events.data() + (ev - source_events);
+        for(auto & bucket : buckets)
+            for(CellEvent *& ev : bucket)
+                ev = events.data() + (ev - source_events);
+    }
+
     /**
      * @brief Update the priority of an event in the queue
      *
@@ -215,11 +265,23 @@ public:
     {
         size_t pos_in_tree = event->position_in_tree;
 
-        if(pos_in_tree >= this->tree.size() || event != this->tree[pos_in_tree])
+        if(event->bucket >= 0)
+        {
+            // Calendar queue. The event is in a bucket
+            RemoveFromBucket(event);
+            InsertInCalendar(event);
+        }
+        else if(pos_in_tree >= this->tree.size() || event != this->tree[pos_in_tree])
         {
             std::cerr << "QUEUE WARNING: the event is not where it was suposed to be. Insert." << std::endl;
             InsertCellEvent(event);
         }
+        else if(queue_type == EventQueueType::CALENDAR && GetDay(event->event_time) > current_day)
+        {
+            // The event leaves the current bucket
+            RemoveFromTree(pos_in_tree);
+            InsertInCalendar(event);
+        }
         else
         {
             BubbleUp(event->position_in_tree);
@@ -235,6 +297,7 @@ public:
      */
     bool IsEmpty() const
     {
+        // The calendar queue keeps the tree not empty while there are events in the buckets
         return tree.empty() && system_events.empty();
     }
 
@@ -248,17 +311,38 @@ public:
     {
         int pos = event->position_in_tree;
         // If the event is in the queue
-        if( pos >= 0 && pos < int(tree.size()) && event == tree[pos])
+        if( event->bucket >= 0 || (pos >= 0 && pos < int(tree.size()) && event == tree[pos]) )
             this->Update(event);
+        else if(queue_type == EventQueueType::CALENDAR)
+            InsertInCalendar(event);
         else
-        {
-            tree.push_back(event);
-            event->position_in_tree = tree.size() - 1;
-            BubbleUp(event->position_in_tree);
-        }
+            PushToTree(event);
 
     };
 
+    /**
+     * @brief Removes an event from the queue
+     *
+     * @param event The event to remove.
+     * @return true if the event was in the queue.
+     */
+    bool RemoveCellEvent(CellEvent * event)
+    {
+        int pos = event->position_in_tree;
+        if(event->bucket >= 0)
+            RemoveFromBucket(event);
+        else if(pos >= 0 && pos < int(tree.size()) && event == tree[pos])
+        {
+            RemoveFromTree(pos);
+            // The calendar queue keeps the tree not empty while there are events in the buckets
+            if(queue_type == EventQueueType::CALENDAR && tree.empty())
+                AdvanceCalendar();
+        }
+        else
+            return false;
+        return true;
+    }
+
     /**
      * @brief Inserts a system event in the queue
      *
@@ -285,19 +369,18 @@ public:
         }
 
         // If the system events queue is empty, return the first cell event
+        const float cell_time = GetFirstCell()->event_time;
         if(system_events.empty() )
         {
-            CellEvent ev = *GetFirstCell();
-            return std::make_tuple(ev.event_time, SystemEventType::NODE_EVENT);
+            return std::make_tuple(cell_time, SystemEventType::NODE_EVENT);
         }
 
         // Both queues have elements, compare the first element of each queue
         const SystemEvent& ev1 = system_events.top();
-        CellEvent ev2 = *GetFirstCell();
-        if (ev1.event_time < ev2.event_time || (ev1.event_time == ev2.event_time && ev1.priority == 0))
+        if (ev1.event_time < cell_time || (ev1.event_time == cell_time && ev1.priority == 0))
             return std::make_tuple(ev1.event_time, ev1.type);
         else
-            return std::make_tuple(ev2.event_time, SystemEventType::NODE_EVENT);
+            return std::make_tuple(cell_time, SystemEventType::NODE_EVENT);
     }
 
     /**
@@ -320,14 +403,19 @@ public:
     {
         assert(!IsEmpty() && "CellEventQueue::ExtractFirstCell: Queue is empty!");
 
-        // Node event out of the queue
-        tree[0]->position_in_tree = -1;
+        CellEvent * first = tree[0];
 
         // Remove the first element from the queue
         tree[0] = tree.back();
         tree[0]->position_in_tree = 0;
         tree.pop_back();
-        BubbleDown(0);
+
+        // Node event out of the queue. Set after the move, as it may be the last one.
+        first->position_in_tree = -1;
+        if(!tree.empty())
+            BubbleDown(0);
+        else if(queue_type == EventQueueType::CALENDAR)
+            AdvanceCalendar();
     }
 
     void ExtractFirstSystem()
@@ -338,18 +426,18 @@ public:
     }
 
     /**
-     * Save the state of the event queue in binary format.
-     * @param f Output file stream to save the state.
+     * Save the state of the event queue to a state file.
+     * @param f Output state file.
      * @param tissue_nodes Vector of nodes to which the events refer.
      */
-    void SaveState(std::ofstream & f, const std::vector<Node> & tissue_nodes) const;
+    void SaveState(StateWriter & f, const std::vector<Node> & tissue_nodes) const;
 
     /**
-     * Load the state of the event queue from binary format.
-     * @param f Input file stream to load the state.
+     * Load the state of the event queue from a state file.
+     * @param f Input state file.
      * @param tissue_nodes Vector of nodes to which the events refer.
      */
-    void LoadState(std::ifstream & f, const std::vector<Node> & tissue_nodes);
+    void LoadState(StateReader & f, const std::vector<Node> & tissue_nodes);
 
 private:
 
@@ -405,6 +493,52 @@ private:
     }
     */
 
+    /**
+     * @brief Adds an event to the heap.
+     */
+    void PushToTree(CellEvent * event)
+    {
+        tree.push_back(event);
+        event->position_in_tree = tree.size() - 1;
+        event->bucket = -1;
+        BubbleUp(event->position_in_tree);
+    }
+
+    /**
+     * @brief Removes the event at the given position of the heap.
+     */
+    void RemoveFromTree(size_t index)
+    {
+        tree[index]->position_in_tree = -1;
+        tree[index] = tree.back();
+        tree.pop_back();
+        if(index < tree.size())
+        {
+            CellEvent * moved = tree[index];
+            moved->position_in_tree = index;
+            BubbleUp(index);
+            BubbleDown(moved->position_in_tree);
+        }
+    }
+
+    // Calendar queue -------------------
+
+    /**
+     * @brief Bucket day of a time. Days beyond the representable range are clamped.
+     */
+    long long GetDay(float t) const
+    {
+        const double max_day = double(1LL << 60);
+        double day = std::floor(double(t) / calendar_bucket_width);
+        return day < max_day ? (long long)(day) : (1LL << 60);
+    }
+
+    void ClearCalendar();
+    void InsertInCalendar(CellEvent * event);
+    void PlaceInCalendar(CellEvent * event);
+    void RemoveFromBucket(CellEvent * event);
+    void AdvanceCalendar();
+
     /**
      * @brief Moves the element at the given index to its right position moving it up if necessary.
      *
@@ -420,9 +554,16 @@ private:
     void BubbleDown(size_t index);
 
     // Data -------------------
+    EventQueueType queue_type;     ///< Type of the queue
     std::vector<CellEvent *> tree; ///< Vector to store the tree for the heap
     std::vector<CellEvent> events; ///< Vector to store the events
 
+    // Calendar queue
+    std::vector<std::vector<CellEvent *>> buckets;  ///< Events of the next days. The last bucket is the overflow.
+    long long current_day = 0;          ///< Day of the events in the tree
+    long long overflow_min_day = 0;     ///< Minimum day of the events in the overflow bucket
+    size_t n_bucket_events = 0;         ///< Number of events in the buckets
+
     SystemQueue<SystemEvent> system_events; ///< Priority queue for system events
 };
 
@@ -478,89 +619,211 @@ void CellEventQueue<Node>::BubbleDown(size_t index)
 }
 
 template<typename Node>
-void CellEventQueue<Node>::SaveState(std::ofstream & f, const std::vector<Node> & tissue_nodes) const
+void CellEventQueue<Node>::ClearCalendar()
 {
-    const int version = 1;
-
-    f.write( (char *) &version, sizeof(int) );
-
-    // Save number of events in the events vector
-    size_t n_events = events.size();
-    f.write( (char *) &n_events, sizeof(size_t) );
-    // Save the events
-    for(const auto & ev : events)
-    {
-        // Save the index of the node
-        size_t node_index = ev.cell_node - &tissue_nodes[0];
-        f.write( (char *) &node_index, sizeof(size_t) );
-        // Save the rest of the event data
-        f.write( (char *) &ev.position_in_tree, sizeof(int) );
-        f.write( (char *) &ev.event_time, sizeof(float) );
-        unsigned char ev_type = static_cast<unsigned char>(ev.event_type);
-        f.write( (char *) &ev_type, sizeof(unsigned char) );
-    }
-
-    // Save number of events in the tree
-    size_t n_tree = tree.size();
-    f.write( (char *) &n_tree, sizeof(size_t) );
-    // Save the pointers in the tree
-    for(const auto ev_ptr : tree)
-    {
-        size_t ev_index = ev_ptr - &events[0];
-        f.write( (char *) &ev_index, sizeof(size_t) );
-    }
-
-    // Save number of system events
-    size_t n_system_events = system_events.size();
-    f.write( (char *) &n_system_events, sizeof(size_t) );
-    // Save the system events
-    auto system_events_data = system_events.Data();
-    f.write( (char *) system_events_data, n_system_events * sizeof(SystemEvent) );
+    buckets.clear();
+    if(queue_type == EventQueueType::CALENDAR)
+        buckets.resize(calendar_n_buckets + 1);
+    current_day = 0;
+    overflow_min_day = 0;
+    n_bucket_events = 0;
 }
 
+/**
+ * @brief Inserts an event that is not in the queue in the calendar queue.
+ * If the tree is empty, the calendar advances to the bucket of the next event.
+ */
+template<typename Node>
+void CellEventQueue<Node>::InsertInCalendar(CellEvent * event)
+{
+    // If the queue is empty, the calendar starts at the day of the event
+    if(tree.empty() && n_bucket_events == 0)
+        current_day = GetDay(event->event_time);
+
+    PlaceInCalendar(event);
+
+    if(tree.empty())
+        AdvanceCalendar();
+}
+
+/**
+ * @brief Puts an event in the tree if it belongs to the current day, or in its bucket otherwise.
+ */
 template<typename Node>
-void CellEventQueue<Node>::LoadState(std::ifstream & f, const std::vector<Node> & tissue_nodes)
+void CellEventQueue<Node>::PlaceInCalendar(CellEvent * event)
 {
-    const int version = 1;
+    long long day = GetDay(event->event_time);
+    if(day <= current_day)
+    {
+        PushToTree(event);
+        return;
+    }
 
-    int file_version;
-    f.read( (char *) &file_version, sizeof(int) );
-    if(file_version != version)
-        throw std::runtime_error("CellEventQueue::LoadState: Wrong file version.");
+    int b = calendar_n_buckets;   // Overflow
+    if(day < current_day + calendar_n_buckets)
+        b = int(day & (calendar_n_buckets - 1));
+    else if(buckets[b].empty() || day < overflow_min_day)
+        overflow_min_day = day;
+
+    event->bucket = b;
+    event->position_in_tree = buckets[b].size();
+    buckets[b].push_back(event);
+    n_bucket_events++;
+}
 
+/**
+ * @brief Removes an event from its bucket.
+ */
+template<typename Node>
+void CellEventQueue<Node>::RemoveFromBucket(CellEvent * event)
+{
+    auto & bucket = buckets[event->bucket];
+    size_t pos = event->position_in_tree;
+    bucket[pos] = bucket.back();
+    bucket[pos]->position_in_tree = pos;
+    bucket.pop_back();
+    n_bucket_events--;
+
+    event->position_in_tree = -1;
+    event->bucket = -1;
+}
+
+/**
+ * @brief Moves the events of the next non empty day to the tree.
+ * @pre The tree is empty.
+ */
+template<typename Node>
+void CellEventQueue<Node>::AdvanceCalendar()
+{
+    const long long mask = calendar_n_buckets - 1;
+    auto & overflow = buckets[calendar_n_buckets];
+
+    while(tree.empty() && n_bucket_events > 0)
+    {
+        // Next non empty bucket. If all of them are empty, the events are in the overflow
+        long long day = current_day + 1;
+        while(day < current_day + calendar_n_buckets && buckets[day & mask].empty())
+            day++;
+        if(day == current_day + calendar_n_buckets)
+            day = overflow_min_day;
+        current_day = day;
+
+        // Heap with the events of the day
+        auto & bucket = buckets[day & mask];
+        for(CellEvent * ev : bucket)
+        {
+            ev->bucket = -1;
+            ev->position_in_tree = tree.size();
+            tree.push_back(ev);
+        }
+        n_bucket_events -= bucket.size();
+        bucket.clear();
+        for(size_t i = tree.size() / 2; i-- > 0; )
+            BubbleDown(i);
+
+        // Events of the overflow that are now in range. overflow_min_day may be lower than
+        // the actual minimum if events were removed, then the loop continues.
+        if(!overflow.empty() && overflow_min_day < current_day + calendar_n_buckets)
+        {
+            std::vector<CellEvent *> pending;
+            pending.swap(overflow);
+            n_bucket_events -= pending.size();
+            for(CellEvent * ev : pending)
+                PlaceInCalendar(ev);
+        }
+    }
+}
+
+template<typename Node>
+void CellEventQueue<Node>::SaveState(StateWriter & f, const std::vector<Node> & tissue_nodes) const
+{
+    // The calendar queue is saved as a heap, so both types of queue can load it.
+    // The tree is followed by the events in the buckets sorted by time, which are later.
+    std::vector<CellEvent *> heap(tree.begin(), tree.end());
+    for(const auto & bucket : buckets)
+        heap.insert(heap.end(), bucket.begin(), bucket.end());
+    std::sort(heap.begin() + tree.size(), heap.end(), [](const CellEvent * a, const CellEvent * b) { return *a < *b; });
+
+    // One block per field of the events
+    const size_t n_events = events.size();
+    std::vector<uint32_t> node_index(n_events);
+    std::vector<int> position(n_events, -1);
+    std::vector<float> event_time(n_events);
+    std::vector<unsigned char> event_type(n_events);
+    for(size_t i = 0; i < n_events; ++i)
+    {
+        const auto & ev = events[i];
+        node_index[i] = ev.cell_node - &tissue_nodes[0];
+        event_time[i] = ev.event_time;
+        event_type[i] = static_cast<unsigned char>(ev.event_type);
+    }
+    std::vector<uint32_t> heap_index(heap.size());
+    for(size_t i = 0; i < heap.size(); ++i)
+    {
+        heap_index[i] = heap[i] - &events[0];
+        position[heap_index[i]] = i;
+    }
+
+    f.Add("event_node", std::move(node_index));
+    f.Add("event_position", std::move(position));
+    f.Add("event_time", std::move(event_time));
+    f.Add("event_type", std::move(event_type));
+    f.Add("event_heap", std::move(heap_index));
+    f.Add("system_events", std::vector<SystemEvent>(system_events.Data(), system_events.Data() + system_events.size()));
+}
+
+template<typename Node>
+void CellEventQueue<Node>::LoadState(StateReader & f, const std::vector<Node> & tissue_nodes)
+{
     // Load events
-    size_t n_events;
-    f.read( (char *) &n_events, sizeof(size_t) );
+    const size_t n_events = f.GetSize("event_node");
+    const uint32_t * node_index = f.Get<uint32_t>("event_node", n_events);
+    const int * position = f.Get<int>("event_position", n_events);
+    const float * event_time = f.Get<float>("event_time", n_events);
+    const unsigned char * event_type = f.Get<unsigned char>("event_type", n_events);
     events.resize(n_events);
     for(size_t i = 0; i < n_events; ++i)
     {
-        size_t node_index;
-        f.read( (char *) &node_index, sizeof(size_t) );
-        events[i].cell_node = const_cast<Node *>(&tissue_nodes[node_index]);
-        f.read( (char *) &events[i].position_in_tree, sizeof(int) );
-        f.read( (char *) &events[i].event_time, sizeof(float) );
-        unsigned char ev_type;
-        f.read( (char *) &ev_type, sizeof(unsigned char) );
-        events[i].event_type = static_cast<CellEventType>(ev_type);
+        if(node_index[i] >= tissue_nodes.size())
+            throw std::runtime_error("CellEventQueue::LoadState: Wrong node of event.");
+        events[i].cell_node = const_cast<Node *>(&tissue_nodes[node_index[i]]);
+        events[i].position_in_tree = position[i];
+        events[i].bucket = -1;
+        events[i].event_time = event_time[i];
+        events[i].event_type = static_cast<CellEventType>(event_type[i]);
     }
 
     // Load events in the tree
-    size_t n_tree;
-    f.read( (char *) &n_tree, sizeof(size_t) );
+    const size_t n_tree = f.GetSize("event_heap");
+    const uint32_t * heap_index = f.Get<uint32_t>("event_heap", n_tree);
     tree.resize(n_tree);
     for(size_t i = 0; i < n_tree; ++i)
     {
-        size_t ev_index;
-        f.read( (char *) &ev_index, sizeof(size_t) );
-        tree[i] = &events[ev_index];
+        if(heap_index[i] >= n_events)
+            throw std::runtime_error("CellEventQueue::LoadState: Wrong event in the tree.");
+        tree[i] = &events[heap_index[i]];
+    }
+    // The order of the events with the same time may differ in files saved by older versions
+    for(size_t i = n_tree / 2; i-- > 0; )
+        BubbleDown(i);
+
+    // The calendar queue distributes the events of the heap in its buckets
+    ClearCalendar();
+    if(queue_type == EventQueueType::CALENDAR)
+    {
+        std::vector<CellEvent *> heap;
+        heap.swap(tree);
+        for(CellEvent * ev : heap)
+            ev->position_in_tree = -1;
+        for(CellEvent * ev : heap)
+            InsertCellEvent(ev);
     }
 
     // Load system events
-    size_t n_system_events;
-    f.read( (char *) &n_system_events, sizeof(size_t) );
+    const size_t n_system_events = f.GetSize("system_events");
+    const SystemEvent * system_events_data = f.Get<SystemEvent>("system_events", n_system_events);
     system_events.Resize(n_system_events);
-    auto system_events_data = system_events.Data();
-    f.read( (char *) system_events_data, n_system_events * sizeof(SystemEvent) );
+    std::copy(system_events_data, system_events_data + n_system_events, system_events.Data());
 }
 
 #endif // CELLEVENT_H
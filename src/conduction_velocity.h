@@ -15,6 +15,7 @@
 #ifndef CONDUCTION_VELOCITY_H
 #define CONDUCTION_VELOCITY_H
 
+#include <algorithm>
 #include "spline2D.h"
 #include "node.h"
 #include "node_parameters.h"
@@ -34,33 +35,44 @@ public:
     ConductionVelocity()
     {
         this->parameters = nullptr;
+        this->restitution_model = nullptr;
         this->cv = INITIAL_CV;
     };
 
 
-    static void InitModel(const std::string &path)
+    using ModelTable = SplineContainer2D; ///< Table of restitution models, one per cell type.
+
+    /**
+     * @brief Load the table of CV restitution models.
+     *
+     * Tables loaded from the same configuration file are shared.
+     * @param path Configuration file with the list of restitution models.
+     * @return Shared pointer to the table.
+     */
+    static std::shared_ptr<const ModelTable> LoadModel(const std::string &path)
     {
-        splines.Init(path);
+        return ModelTable::Load(path);
     }
 
     /**
      * @brief Initialize the conduction velocity.
      *
      * @param parameters Pointer to the node parameters.
+     * @param models Table of restitution models.
      * @param type Cell type.
      * @param cv_ Initial conduction velocity.
      */
-    void Init(NodeParameters* parameters, CellType type, float cv_ = INITIAL_CV)
+    void Init(NodeParameters* parameters, const ModelTable & models, CellType type, float cv_ = INITIAL_CV)
     {
         this->parameters = parameters;
-        SetRestitutionModel(type);
+        SetRestitutionModel(models, type);
         this->cv = cv_;
     };
 
-    void InitWithAPD(NodeParameters* parameters, CellType type, float di_, float apd_)
+    void InitWithAPD(NodeParameters* parameters, const ModelTable & models, CellType type, float di_, float apd_)
     {
         this->parameters = parameters;
-        SetRestitutionModel(type);
+        SetRestitutionModel(models, type);
         if(di_ < 0.0 || apd_ < 0.0 || type == CELL_TYPE_VOID)
             this->cv = INITIAL_CV;
         else
@@ -70,11 +82,12 @@ public:
     /**
      * @brief Set the restitution model.
      *
+     * @param models Table of restitution models.
      * @param type Cell type.
      */
-    void SetRestitutionModel(CellType type)
+    void SetRestitutionModel(const ModelTable & models, CellType type)
     {
-        this->restitution_model = splines.getSpline(type);
+        this->restitution_model = models.getSpline(type);
         if(this->restitution_model == nullptr && type != CELL_TYPE_VOID)
             throw std::runtime_error("conduction_velocity.h: no CV restitution model found for cell type " + std::to_string(static_cast<int>(type)));
     };
@@ -118,24 +131,40 @@ public:
         return this->cv;
     };
 
+    /// Number of values of the state of the model
+    static constexpr int STATE_SIZE = 1;
+
     /**
-     * Save the state of the model to a file.
+     * Save the state of the model to STATE_SIZE values.
      * The correct restitution model will be set when loading according to the cell type.
      */
-    void SaveState(std::ofstream & f) const
+    void SaveState(float * state) const
     {
-        f.write( (char *) &cv, sizeof(float) );
+        state[0] = cv;
     }
 
     /**
-     * Load the state of the model from a file.
+     * @brief Get an upper bound of the conduction velocity in the next activations.
+     *
+     * @return The largest of the current conduction velocity and the largest value of the restitution model.
+     */
+    float getMaxConductionVelocity() const
+    {
+        if(this->restitution_model == nullptr)
+            return this->cv;
+        return std::max(this->cv, this->restitution_model->getMaxValue()*this->parameters->correction_factor_cv);
+    };
+
+    /**
+     * Load the state of the model from STATE_SIZE values.
      * The correct restitution model will be set according to the cell type.
      */
-    void LoadState(std::ifstream & f, CellType type)
+    void LoadState(const float * state, NodeParameters* params, const ModelTable & models, CellType type)
     {
-        f.read( (char *) &cv, sizeof(float) );
+        this->parameters = params;
+        cv = state[0];
 
-        SetRestitutionModel(type);
+        SetRestitutionModel(models, type);
     }
 
 private:
@@ -144,8 +173,7 @@ private:
     float cv; ///< Conduction velocity.
     static constexpr float INITIAL_CV = 1.0; ///< Initial conduction velocity.
 
-    Spline2D * restitution_model; ///< APD restitution model.
-    static SplineContainer2D splines; ///< Container of APD restitution models.
+    const Spline2D * restitution_model; ///< APD restitution model.
 
     static std::string config_file; /**< Configuration file for the model. */
 
@@ -153,6 +181,4 @@ private:
 
 std::string ConductionVelocity::config_file = "";
 
-SplineContainer2D ConductionVelocity::splines;
-
 #endif // CONDUCTION_VELOCITY_H
\ No newline at end of file
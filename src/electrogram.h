@@ -0,0 +1,207 @@
+/**
+ * @file electrogram.h
+ * Pseudo-ECG of the cardiac tissue simulation, computed while the simulation runs.
+ *
+ */
+
+#ifndef ELECTROGRAM_H
+#define ELECTROGRAM_H
+#include <cstdint>
+#include <stdexcept>
+#include <vector>
+
+#include "state_file.h"
+
+/**
+ * @brief Pseudo-ECG at a set of leads, sampled at a fixed period.
+ *
+ * The signal of a lead is the sum over the nodes of weight * (AP - resting potential), equal
+ * to the sum of weight * AP when the weights of the lead add up to zero. The weights of each
+ * node (its lead field) are given for all the leads and stored in one contiguous row per node.
+ * Nodes without weights, and inactive nodes, do not contribute: each sample only visits the
+ * nodes that have been activated and are still active.
+ *
+ * @tparam Node Node of the tissue.
+ */
+template <typename Node>
+class Electrogram
+{
+public:
+    /**
+     * @brief Set the weights of the nodes and start sampling. Previous samples are discarded.
+     * @param n_nodes Number of live nodes.
+     * @param nodes Positions in the live nodes of the nodes with weights.
+     * @param weights_ Weights, one row of n_leads_ values per node in nodes.
+     * @param n_leads_ Number of leads.
+     * @param period_ Sampling period.
+     * @param start_time_ Time of the first sample.
+     * @param resting_potential_ Action potential of the inactive nodes.
+     */
+    void Init(size_t n_nodes, const std::vector<size_t> & nodes, const std::vector<float> & weights_, size_t n_leads_,
+              float period_, float start_time_, float resting_potential_)
+    {
+        n_leads = n_leads_;
+        resting_potential = resting_potential_;
+        period = period_;
+        start_time = start_time_;
+        weights = weights_;
+        weight_row.assign(n_nodes, -1);
+        for(size_t i = 0; i < nodes.size(); i++)
+            weight_row[nodes[i]] = int(i);
+        active.clear();
+        is_active.assign(n_nodes, false);
+        times.clear();
+        signals.clear();
+    }
+
+    bool IsEnabled() const { return n_leads > 0; }
+
+    /** Get the number of leads */
+    size_t GetNumLeads() const { return n_leads; }
+
+    /**
+     * @brief Add a node that has just been activated to the nodes that contribute to the samples.
+     * @param node Node.
+     * @param position Position of the node in the live nodes.
+     */
+    void AddActivation(const Node * node, size_t position)
+    {
+        if(weight_row[position] < 0 || is_active[position])
+            return;
+        is_active[position] = true;
+        active.push_back({node, position});
+    }
+
+    /**
+     * @brief Take the samples earlier than t. All the events earlier than t must have been processed.
+     */
+    void SampleUntil(float t)
+    {
+        while(NextSampleTime() < t)
+            Sample(NextSampleTime());
+    }
+
+    /**
+     * @brief Move the active nodes to a copy of the nodes of the tissue.
+     * @param nodes First live node of the copy.
+     */
+    void Rebase(const Node * nodes)
+    {
+        for(ActiveNode & a : active)
+            a.node = nodes + a.position;
+    }
+
+    /**
+     * Save the weights, the active nodes and the samples to a state file.
+     * @param f Output file.
+     */
+    void SaveState(StateWriter & f) const
+    {
+        // The active nodes keep their order, so the samples add up in the same order after loading
+        std::vector<uint64_t> positions(active.size());
+        for(size_t i = 0; i < active.size(); i++)
+            positions[i] = active[i].position;
+        f.Add("ecg_leads", std::vector<uint64_t>{n_leads});
+        f.Add("ecg_settings", std::vector<float>{period, start_time, resting_potential});
+        f.Add("ecg_weights", weights);
+        f.Add("ecg_weight_row", weight_row);
+        f.Add("ecg_active", std::move(positions));
+        f.Add("ecg_times", times);
+        f.Add("ecg_signals", signals);
+    }
+
+    /**
+     * Load the weights, the active nodes and the samples from a state file.
+     * @param f Input file.
+     * @param nodes First live node of the tissue.
+     * @param n_nodes Number of live nodes.
+     */
+    void LoadState(StateReader & f, const Node * nodes, size_t n_nodes)
+    {
+        n_leads = *f.Get<uint64_t>("ecg_leads", 1);
+        const float * settings = f.Get<float>("ecg_settings", 3);
+        period = settings[0];
+        start_time = settings[1];
+        resting_potential = settings[2];
+        const size_t n_weights = f.GetSize("ecg_weights");
+        const float * w = f.Get<float>("ecg_weights", n_weights);
+        weights.assign(w, w + n_weights);
+        const size_t n_rows = n_leads > 0 ? n_nodes : 0;
+        const int * rows = f.Get<int>("ecg_weight_row", n_rows);
+        weight_row.assign(rows, rows + n_rows);
+
+        const size_t n_active = f.GetSize("ecg_active");
+        const uint64_t * positions = f.Get<uint64_t>("ecg_active", n_active);
+        active.clear();
+        is_active.assign(n_rows, false);
+        for(size_t i = 0; i < n_active; i++)
+        {
+            if(positions[i] >= n_rows)
+                throw std::runtime_error("Electrogram::LoadState: Wrong active node.");
+            is_active[positions[i]] = true;
+            active.push_back({nodes + positions[i], size_t(positions[i])});
+        }
+
+        const size_t n_samples = f.GetSize("ecg_times");
+        const float * t = f.Get<float>("ecg_times", n_samples);
+        times.assign(t, t + n_samples);
+        const float * s = f.Get<float>("ecg_signals", n_samples * n_leads);
+        signals.assign(s, s + n_samples * n_leads);
+    }
+
+    /** Get the times of the samples */
+    const std::vector<float> & GetTimes() const { return times; }
+
+    /** Get the samples, with one row of GetNumLeads() values per sample */
+    const std::vector<float> & GetSignals() const { return signals; }
+
+private:
+    struct ActiveNode { const Node * node; size_t position; };
+
+    float NextSampleTime() const
+    {
+        return start_time + times.size() * period;
+    }
+
+    /**
+     * @brief Add the contribution of the active nodes at time t. The nodes whose action potential
+     * has finished are removed from the active nodes.
+     */
+    void Sample(float t)
+    {
+        size_t n_samples = times.size();
+        times.push_back(t);
+        signals.resize(signals.size() + n_leads, 0.0f);
+        float * sample = &signals[n_samples * n_leads];
+
+        for(size_t i = 0; i < active.size(); )
+        {
+            const ActiveNode & a = active[i];
+            if(a.node->GetLife(t) >= 1.0)
+            {
+                is_active[a.position] = false;
+                active[i] = active.back();
+                active.pop_back();
+                continue;
+            }
+            const float v = a.node->GetActionPotential(t) - resting_potential;
+            const float * row = &weights[size_t(weight_row[a.position]) * n_leads];
+            for(size_t lead = 0; lead < n_leads; lead++)
+                sample[lead] += row[lead] * v;
+            i++;
+        }
+    }
+
+    size_t n_leads = 0;
+    float period = 1.0;
+    float start_time = 0.0;
+    float resting_potential = 0.0;
+    std::vector<float> weights;         ///< Weights of the nodes, one row of n_leads per node
+    std::vector<int> weight_row;        ///< Row in weights of each live node, or -1
+    std::vector<ActiveNode> active;     ///< Activated nodes with weights, until their action potential finishes
+    std::vector<char> is_active;        ///< Whether each live node is in active
+    std::vector<float> times;           ///< Times of the samples
+    std::vector<float> signals;         ///< Samples, one row of n_leads per sample
+};
+
+#endif // ELECTROGRAM_H
@@ -5,6 +5,7 @@
 #include <array>
 #include <Eigen/Dense>
 #include "error.h"
+#include "state_file.h"
 
 // Define the maximum distance to consider neighbours. Can be set during compilation with -DNEIGHBOURS_DISTANCE=X
 #ifndef NEIGHBOURS_DISTANCE
@@ -191,35 +192,26 @@ public:
         return origin + Vector3(0.5*dx, 0.5*dy, 0.5*dz) + Vector3(coords[0]*dx, coords[1]*dy, coords[2]*dz);
     }
 
-    void SaveState(std::ofstream & f) const
+    void SaveState(StateWriter & f) const
     {
-        f.write( (const char*) (&size_x), sizeof(size_x) );
-        f.write( (const char*) (&size_y), sizeof(size_y) );
-        f.write( (const char*) (&size_z), sizeof(size_z) );
-        f.write( (const char*) (&dx), sizeof(dx) );
-        f.write( (const char*) (&dy), sizeof(dy) );
-        f.write( (const char*) (&dz), sizeof(dz) );
-        f.write( (const char*) (origin.data()), sizeof(float)*3 );
+        f.Add("geometry_size", std::vector<int>{size_x, size_y, size_z});
+        f.Add("geometry_spacing", std::vector<float>{dx, dy, dz});
+        f.Add("geometry_origin", std::vector<float>(origin.data(), origin.data() + 3));
     }
 
-    void LoadState(std::ifstream & f)
+    void LoadState(StateReader & f)
     {
         // Just check sizes
-        int size;
-        f.read( (char*) (&size), sizeof(size) );
-        LOG::Error(size != size_x, "Geometry::LoadState: Wrong size_x in file.");
-        f.read( (char*) (&size), sizeof(size) );
-        LOG::Error(size != size_y, "Geometry::LoadState: Wrong size_y in file.");
-        f.read( (char*) (&size), sizeof(size) );
-        LOG::Error(size != size_z, "Geometry::LoadState: Wrong size_z in file.");
-        float d;
-        f.read( (char*) (&d), sizeof(d) );
-        LOG::Error(d != dx, "Geometry::LoadState: Wrong dx in file.");
-        f.read( (char*) (&d), sizeof(d) );
-        LOG::Error(d != dy, "Geometry::LoadState: Wrong dy in file.");
-        f.read( (char*) (&d), sizeof(d) );
-        LOG::Error(d != dz, "Geometry::LoadState: Wrong dz in file.");
-        f.read( (char*) (origin.data()), sizeof(float)*3 );
+        const int * size = f.Get<int>("geometry_size", 3);
+        LOG::Error(size[0] != size_x, "Geometry::LoadState: Wrong size_x in file.");
+        LOG::Error(size[1] != size_y, "Geometry::LoadState: Wrong size_y in file.");
+        LOG::Error(size[2] != size_z, "Geometry::LoadState: Wrong size_z in file.");
+        const float * d = f.Get<float>("geometry_spacing", 3);
+        LOG::Error(d[0] != dx, "Geometry::LoadState: Wrong dx in file.");
+        LOG::Error(d[1] != dy, "Geometry::LoadState: Wrong dy in file.");
+        LOG::Error(d[2] != dz, "Geometry::LoadState: Wrong dz in file.");
+        const float * o = f.Get<float>("geometry_origin", 3);
+        origin = Vector3(o[0], o[1], o[2]);
     }
 
 };
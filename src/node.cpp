@@ -21,6 +21,16 @@ using std::endl;
 template <typename APD, typename CVM>
 NodeT<APD, CVM>::NodeT() :
     parameters(nullptr),
+    id(0),
+    external_activation(false),
+    blocked(false),
+    beat(-1),
+    conduction_vel(0.0),
+    local_activation_time(0.0),
+    kapd_v(0.0),
+    received_potential(0.0),
+    next_activation_time(MAX_TIME),
+    next_deactivation_time(MAX_TIME),
     next_activation_event(nullptr),
     next_deactivation_event(nullptr),
     activation_parent(nullptr)
@@ -56,17 +66,17 @@ typename NodeT<APD, CVM>::CellActivationState NodeT<APD, CVM>::GetState(float te
  * From Node.pde: reset
  */
 template <typename APD, typename CVM>
-void NodeT<APD, CVM>::Init(float current_time_, float initial_apd_)
+void NodeT<APD, CVM>::Init(float current_time_, float initial_apd_, const BasicTissue<APD, CVM> & tissue)
 {
     this->beat = -1;
 
     // Activation data
-    this->apd_model.Init(this->parameters, this->type,
+    this->apd_model.Init(this->parameters, *tissue.apd_models, this->type,
         initial_apd_,
         current_time_,
         0.0
     );
-    this->cv_model.InitWithAPD(this->parameters, this->type, this->apd_model.getLastDI(), this->apd_model.getAPD() );
+    this->cv_model.InitWithAPD(this->parameters, *tissue.cv_models, this->type, this->apd_model.getLastDI(), this->apd_model.getAPD() );
     this->local_activation_time = this->apd_model.getActivationTime();
     this->next_activation_time = MAX_TIME;
     this->next_deactivation_time = MAX_TIME;
@@ -83,15 +93,15 @@ void NodeT<APD, CVM>::Init(float current_time_, float initial_apd_)
 
 
 template <typename APD, typename CVM>
-void NodeT<APD, CVM>::ReApplyParam(float current_time_)
+void NodeT<APD, CVM>::ReApplyParam(float current_time_, const BasicTissue<APD, CVM> & tissue)
 {
     // @todo Fix: This is changing the state, not only the parameters.
-    this->apd_model.Init(this->parameters, this->type,
+    this->apd_model.Init(this->parameters, *tissue.apd_models, this->type,
         this->apd_model.getAPD(),
         current_time_,
         this->apd_model.getLastDI()
     );
-    this->cv_model.Init(this->parameters, this->type);
+    this->cv_model.Init(this->parameters, *tissue.cv_models, this->type);
 }
 
 /**
@@ -99,7 +109,7 @@ void NodeT<APD, CVM>::ReApplyParam(float current_time_)
  * From Node.pde: calcularActivacion
 */
 template <typename APD, typename CVM>
-bool NodeT<APD, CVM>::ComputeActivation(float current_time_, const Geometry &geometry)
+bool NodeT<APD, CVM>::ComputeActivation(float current_time_, const BasicTissue<APD, CVM> & tissue)
 {
     // Conduction velocity. Has to be activated with the previous DI. Otherwise, DI will be 0
     // Thus, we activate before updating the APD.
@@ -116,10 +126,13 @@ bool NodeT<APD, CVM>::ComputeActivation(float current_time_, const Geometry &geo
     {
         float avg_apd = 0;
         unsigned int active_neighs = 0;
-        for(int disp: geometry.displacement)    //(Node * neigh : this->neighbours)
+        const int * neighbours = tissue.GetNeighbours(this);
+        for(size_t i = 0; i < Geometry::num_neighbours; i++)
         {
-            // Danger! May go out of the array of Node
-            NodeT * neigh = this + disp;
+            // VOID neighbours are never active
+            if (neighbours[i] < 0)
+                continue;
+            const NodeT * neigh = &tissue.tissue_nodes[neighbours[i]];
             if (neigh->GetState(current_time_) == CellActivationState::ACTIVE)
             {
                 avg_apd += neigh->apd_model.getAPD();
@@ -153,13 +166,13 @@ bool NodeT<APD, CVM>::ComputeActivation(float current_time_, const Geometry &geo
  * From Node.pde: activar
 */
 template <typename APD, typename CVM>
-bool NodeT<APD, CVM>::Activate(float current_time_, const Geometry &geometry)
+bool NodeT<APD, CVM>::Activate(float current_time_, const BasicTissue<APD, CVM> & tissue)
 {
     bool activated = false;
 
     if (this->GetState(current_time_) <= CellActivationState::WAITING_FOR_ACTIVATION)
     {
-        if( ! this->ComputeActivation(current_time_, geometry))
+        if( ! this->ComputeActivation(current_time_, tissue))
             activated = false;
         else
         {
@@ -248,162 +261,158 @@ typename NodeT<APD, CVM>::CellEvent* NodeT<APD, CVM>::ScheduleExternalActivation
 template <typename APD, typename CVM>
 float NodeT<APD, CVM>::ComputeDirectionalConductionVelocity(const NodeT::Vector3 &direction_)
 {
-    float cond_vel;
+    // VOID -> no conduction at all.
+    if(this->type == CELL_TYPE_VOID)
+        return 0.0;
 
+    return this->conduction_vel/ComputeAnisotropyFactor(direction_);
+}
+
+/**
+ * Compute the factor that divides the conduction velocity of the node in a direction.
+ * It only depends on the fiber orientation and the parameters of the node.
+ * @param direction_ Direction of the conduction.
+ * @return The anisotropy factor. 1 if the conduction is isotropic.
+ */
+template <typename APD, typename CVM>
+float NodeT<APD, CVM>::ComputeAnisotropyFactor(const NodeT::Vector3 &direction_) const
+{
     // If isotropic, orientation==0 or direction==0
     if(this->parameters->isotropic_diffusion ||
         this->orientation.norm() < ALMOST_ZERO ||
         direction_.norm() < ALMOST_ZERO)
     {
         // Isotropic conduction
-        cond_vel = this->conduction_vel;
-    }
-    else if(this->type != CELL_TYPE_VOID)
-    {
-        // Anisotropic conduction
-        float cond_vel_long = abs(this->orientation.dot(direction_))/direction_.norm();
-        float cond_vel_transv = sqrt(1.0 - cond_vel_long*cond_vel_long);
-
-        // We scale the relative position in space, according to fiber orientation.
-        // Being slower in the transversal direction, space expands in that
-        // direction and points are further away.
-        Vector2 p;
-        p[0] = cond_vel_long;
-        p[1] = cond_vel_transv/this->parameters->cond_veloc_transversal_reduction;
-
-        cond_vel = this->conduction_vel/p.norm();
-    }
-    else
-    {
-        // otherwise, VOID -> no conduction at all.
-        cond_vel = 0.0;
+        return 1.0;
     }
 
-    return cond_vel;
+    // Anisotropic conduction
+    float cond_vel_long = abs(this->orientation.dot(direction_))/direction_.norm();
+    float cond_vel_transv = sqrt(1.0 - cond_vel_long*cond_vel_long);
+
+    // We scale the relative position in space, according to fiber orientation.
+    // Being slower in the transversal direction, space expands in that
+    // direction and points are further away.
+    Vector2 p;
+    p[0] = cond_vel_long;
+    p[1] = cond_vel_transv/this->parameters->cond_veloc_transversal_reduction;
+
+    return p.norm();
 }
 
+/**
+ * Save the state of the nodes to a state file, with one block per field.
+ * Pointers are saved as indices: parameters in the pool, events in the event queue and
+ * activation parents in nodes.
+ */
 template <typename APD, typename CVM>
-void NodeT<APD, CVM>::SaveState(std::ofstream & f, const class ParametersPool & parameters_pool, const CellEventQueue<NodeT> & event_queue) const
+void NodeT<APD, CVM>::SaveState(StateWriter & f, const vector<NodeT> & nodes, const ParametersPool & parameters_pool, const CellEventQueue<NodeT> & event_queue)
 {
-    f.write( (char *) &SAVE_VERSION, sizeof(int) );
-
-    // Save parameters index in the pool
-    size_t param_index = std::numeric_limits<size_t>::max();
-    if(parameters != nullptr)
+    constexpr uint32_t NONE = std::numeric_limits<uint32_t>::max();
+    const size_t n = nodes.size();
+    vector<uint32_t> param_index(n), id(n), next_act_index(n), next_deact_index(n), act_parent_index(n);
+    vector<CellType> type(n);
+    vector<unsigned char> external_activation(n), blocked(n);
+    vector<int> beat(n);
+    vector<float> conduction_vel(n), orientation(3 * n), local_activation_time(n), kapd_v(n), received_potential(n);
+    vector<float> next_activation_time(n), next_deactivation_time(n);
+    vector<float> apd_state(n * APD::STATE_SIZE), cv_state(n * CVM::STATE_SIZE);
+
+    for(size_t i = 0; i < n; i++)
     {
-        param_index = parameters_pool.GetIndex(parameters);
+        const NodeT & node = nodes[i];
+        param_index[i] = node.parameters != nullptr ? parameters_pool.GetIndex(node.parameters) : NONE;
+        id[i] = node.id;
+        type[i] = node.type;
+        external_activation[i] = node.external_activation;
+        blocked[i] = node.blocked;
+        beat[i] = node.beat;
+        conduction_vel[i] = node.conduction_vel;
+        std::copy(node.orientation.data(), node.orientation.data() + 3, &orientation[3 * i]);
+        local_activation_time[i] = node.local_activation_time;
+        kapd_v[i] = node.kapd_v;
+        received_potential[i] = node.received_potential;
+        next_activation_time[i] = node.next_activation_time;
+        next_deactivation_time[i] = node.next_deactivation_time;
+        node.apd_model.SaveState(&apd_state[i * APD::STATE_SIZE]);
+        node.cv_model.SaveState(&cv_state[i * CVM::STATE_SIZE]);
+        next_act_index[i] = node.next_activation_event != nullptr ? event_queue.GetIndex(node.next_activation_event) : NONE;
+        next_deact_index[i] = node.next_deactivation_event != nullptr ? event_queue.GetIndex(node.next_deactivation_event) : NONE;
+        act_parent_index[i] = node.activation_parent != nullptr ? node.activation_parent - nodes.data() : NONE;
     }
-    f.write( (char *) &param_index, sizeof(size_t) );
-
-    // Save id
-    f.write( (char *) &id, sizeof(id) );
-    // Save type
-    f.write( (char *) &type, sizeof(CellType) );
-    // Save external activation flag
-    f.write( (char *) &external_activation, sizeof(external_activation) );
-
-    // Save activation data
-    f.write( (char *) &blocked, sizeof(blocked) );
-    f.write( (char *) &beat, sizeof(beat) );
-    f.write( (char *) &conduction_vel, sizeof(conduction_vel) );
-    f.write( (char *) &orientation, sizeof(orientation) );
-
-    f.write( (char *) &local_activation_time, sizeof(local_activation_time) );
-    f.write( (char *) &kapd_v, sizeof(kapd_v) );
-    f.write( (char *) &received_potential, sizeof(received_potential) );
-    f.write( (char *) &next_activation_time, sizeof(next_activation_time) );
-    f.write( (char *) &next_deactivation_time, sizeof(next_deactivation_time) );
-
-    // Save APD model state
-    apd_model.SaveState(f);
-
-    // Save CV model state
-    cv_model.SaveState(f);
-
-    // Save events. It is possible to know the index directly from node position, but this way is safer and prepared for possible changes.
-    // Save next activation event state
-    size_t next_act_index = std::numeric_limits<size_t>::max();
-    if(next_activation_event != nullptr)
-        next_act_index = event_queue.GetIndex(next_activation_event);
-    f.write( (char *) &next_act_index, sizeof(next_act_index) );
-
-    // Save next deactivation event state
-    size_t next_deact_index = std::numeric_limits<size_t>::max();
-    if(next_deactivation_event != nullptr)
-        next_deact_index = event_queue.GetIndex(next_deactivation_event);
-    f.write( (char *) &next_deact_index, sizeof(next_deact_index) );
-
-    // Save activation parent
-    size_t act_parent_index = std::numeric_limits<size_t>::max();
-    if(activation_parent != nullptr)
-        act_parent_index = activation_parent->id;
-    f.write( (char *) &act_parent_index, sizeof(act_parent_index) );
+
+    f.Add("node_parameters", std::move(param_index));
+    f.Add("node_id", std::move(id));
+    f.Add("node_type", std::move(type));
+    f.Add("node_external_activation", std::move(external_activation));
+    f.Add("node_blocked", std::move(blocked));
+    f.Add("node_beat", std::move(beat));
+    f.Add("node_conduction_vel", std::move(conduction_vel));
+    f.Add("node_orientation", std::move(orientation));
+    f.Add("node_lat", std::move(local_activation_time));
+    f.Add("node_kapd_v", std::move(kapd_v));
+    f.Add("node_received_potential", std::move(received_potential));
+    f.Add("node_next_activation_time", std::move(next_activation_time));
+    f.Add("node_next_deactivation_time", std::move(next_deactivation_time));
+    f.Add("node_apd_state", std::move(apd_state));
+    f.Add("node_cv_state", std::move(cv_state));
+    f.Add("node_next_activation_event", std::move(next_act_index));
+    f.Add("node_next_deactivation_event", std::move(next_deact_index));
+    f.Add("node_activation_parent", std::move(act_parent_index));
 }
 
+/**
+ * Load the state of the nodes from a state file. The nodes must have been created for the
+ * live nodes of the file, and the parameters pool and the event queue must have been loaded.
+ */
 template <typename APD, typename CVM>
-void NodeT<APD, CVM>::LoadState(std::ifstream & f, ParametersPool & parameters_pool, CellEventQueue<NodeT> & event_queue, BasicTissue<APD, CVM> & tissue)
+void NodeT<APD, CVM>::LoadState(StateReader & f, vector<NodeT> & nodes, ParametersPool & parameters_pool, CellEventQueue<NodeT> & event_queue, const BasicTissue<APD, CVM> & tissue)
 {
-    int version;
-    f.read( (char *) &version, sizeof(int) );
-    if(version != SAVE_VERSION)
-        throw std::runtime_error("NodeT::LoadState: Wrong file version.");
-
-    // Get the pointer to the parameters
-    size_t param_index;
-    f.read( (char *) &param_index, sizeof(size_t) );
-    if(param_index != std::numeric_limits<size_t>::max())
-        parameters = parameters_pool.GetParamPtr(param_index);
-    else
-        parameters = nullptr;
-
-    // Load id
-    f.read( (char *) &id, sizeof(id) );
-    // Load type
-    f.read( (char *) &type, sizeof(CellType) );
-    // Load external activation flag
-    f.read( (char *) &external_activation, sizeof(external_activation) );
-
-    // Load activation data
-    f.read( (char *) &blocked, sizeof(blocked) );
-    f.read( (char *) &beat, sizeof(beat) );
-    f.read( (char *) &conduction_vel, sizeof(conduction_vel) );
-    f.read( (char *) &orientation, sizeof(orientation) );
-
-    f.read( (char *) &local_activation_time, sizeof(local_activation_time) );
-    f.read( (char *) &kapd_v, sizeof(kapd_v) );
-    f.read( (char *) &received_potential, sizeof(received_potential) );
-    f.read( (char *) &next_activation_time, sizeof(next_activation_time) );
-    f.read( (char *) &next_deactivation_time, sizeof(next_deactivation_time) );
-
-    // Load APD model state
-    apd_model.LoadState(f, type);
-
-    // Load CV model state
-    cv_model.LoadState(f, type);
-
-    // Load next activation event state
-    size_t next_act_index;
-    f.read( (char *) &next_act_index, sizeof(next_act_index) );
-    if(next_act_index != std::numeric_limits<size_t>::max())
-        next_activation_event = event_queue.GetEventPtr(next_act_index);
-    else
-        next_activation_event = nullptr;
-
-    // Load next deactivation event state
-    size_t next_deact_index;
-    f.read( (char *) &next_deact_index, sizeof(next_deact_index) );
-    if(next_deact_index != std::numeric_limits<size_t>::max())
-        next_deactivation_event = event_queue.GetEventPtr(next_deact_index);
-    else
-        next_deactivation_event = nullptr;
-
-    // Load activation parent
-    size_t act_parent_index;
-    f.read( (char *) &act_parent_index, sizeof(act_parent_index) );
-    if(act_parent_index != std::numeric_limits<size_t>::max())
-        activation_parent = tissue.GetNodePtr(act_parent_index);
-    else
-        activation_parent = nullptr;
+    constexpr uint32_t NONE = std::numeric_limits<uint32_t>::max();
+    const size_t n = nodes.size();
+    const uint32_t * param_index = f.Get<uint32_t>("node_parameters", n);
+    const uint32_t * id = f.Get<uint32_t>("node_id", n);
+    const CellType * type = f.Get<CellType>("node_type", n);
+    const unsigned char * external_activation = f.Get<unsigned char>("node_external_activation", n);
+    const unsigned char * blocked = f.Get<unsigned char>("node_blocked", n);
+    const int * beat = f.Get<int>("node_beat", n);
+    const float * conduction_vel = f.Get<float>("node_conduction_vel", n);
+    const float * orientation = f.Get<float>("node_orientation", 3 * n);
+    const float * local_activation_time = f.Get<float>("node_lat", n);
+    const float * kapd_v = f.Get<float>("node_kapd_v", n);
+    const float * received_potential = f.Get<float>("node_received_potential", n);
+    const float * next_activation_time = f.Get<float>("node_next_activation_time", n);
+    const float * next_deactivation_time = f.Get<float>("node_next_deactivation_time", n);
+    const float * apd_state = f.Get<float>("node_apd_state", n * APD::STATE_SIZE);
+    const float * cv_state = f.Get<float>("node_cv_state", n * CVM::STATE_SIZE);
+    const uint32_t * next_act_index = f.Get<uint32_t>("node_next_activation_event", n);
+    const uint32_t * next_deact_index = f.Get<uint32_t>("node_next_deactivation_event", n);
+    const uint32_t * act_parent_index = f.Get<uint32_t>("node_activation_parent", n);
+
+    for(size_t i = 0; i < n; i++)
+    {
+        NodeT & node = nodes[i];
+        // Get the pointer to the parameters
+        node.parameters = param_index[i] != NONE ? parameters_pool.GetParamPtr(param_index[i]) : nullptr;
+        node.id = id[i];
+        node.type = type[i];
+        node.external_activation = external_activation[i];
+        node.blocked = blocked[i];
+        node.beat = beat[i];
+        node.conduction_vel = conduction_vel[i];
+        node.orientation = Vector3(orientation[3 * i], orientation[3 * i + 1], orientation[3 * i + 2]);
+        node.local_activation_time = local_activation_time[i];
+        node.kapd_v = kapd_v[i];
+        node.received_potential = received_potential[i];
+        node.next_activation_time = next_activation_time[i];
+        node.next_deactivation_time = next_deactivation_time[i];
+        node.apd_model.LoadState(&apd_state[i * APD::STATE_SIZE], node.parameters, *tissue.apd_models, node.type);
+        node.cv_model.LoadState(&cv_state[i * CVM::STATE_SIZE], node.parameters, *tissue.cv_models, node.type);
+        // GetEventPtr gives nullptr for NONE
+        node.next_activation_event = event_queue.GetEventPtr(next_act_index[i]);
+        node.next_deactivation_event = event_queue.GetEventPtr(next_deact_index[i]);
+        node.activation_parent = act_parent_index[i] < n ? &nodes[act_parent_index[i]] : nullptr;
+    }
 }
 
 
@@ -17,6 +17,7 @@
 #include "node_parameters.h"
 #include "cell_event_queue.h"
 #include "geometry.h"
+#include "state_file.h"
 
 using std::vector;
 
@@ -45,17 +46,22 @@ public:
     enum class CellActivationState : char { INACTIVE = 0, WAITING_FOR_ACTIVATION, ACTIVE };
 
     NodeT();
-    void Init(float current_time_, float initial_apd_);
-    void ReApplyParam(float current_time_);
+    void Init(float current_time_, float initial_apd_, const BasicTissue<ActionPotentialModel, ConductionVelocityModel> & tissue);
+    void ReApplyParam(float current_time_, const BasicTissue<ActionPotentialModel, ConductionVelocityModel> & tissue);
     float ComputeDirectionalConductionVelocity(const NodeT::Vector3 &direction_);
+    float ComputeAnisotropyFactor(const NodeT::Vector3 &direction_) const;
     CellEvent* ScheduleActivation( NodeT *origin_, float activation_time_);
     CellEvent* ScheduleExternalActivation(float activation_time_, int beat_n_);
 
     unsigned int GetId() const { return id; }
     CellActivationState GetState(float current_time_) const;
     int GetBeat() const { return beat; }
-    void SaveState(std::ofstream & f, const ParametersPool & parameters_pool, const CellEventQueue<NodeT> & event_queue) const;
-    void LoadState(std::ifstream & f, ParametersPool & parameters_pool, CellEventQueue<NodeT> & event_queue, BasicTissue<ActionPotentialModel, ConductionVelocityModel> & tissue);
+    /** Get the action potential at time t */
+    float GetActionPotential(float t) const { return apd_model.getActionPotential(t); }
+    /** Get the fraction of the APD elapsed at time t, 1 once the action potential has finished */
+    float GetLife(float t) const { return apd_model.getLife(t); }
+    static void SaveState(StateWriter & f, const vector<NodeT> & nodes, const ParametersPool & parameters_pool, const CellEventQueue<NodeT> & event_queue);
+    static void LoadState(StateReader & f, vector<NodeT> & nodes, ParametersPool & parameters_pool, CellEventQueue<NodeT> & event_queue, const BasicTissue<ActionPotentialModel, ConductionVelocityModel> & tissue);
 
     // Data extraction ---
     using NodeData = std::tuple<float, int, int, int, float, int, float, float, float, float, float, float>;
@@ -89,7 +95,6 @@ public:
     }
 
 private:
-    constexpr static int SAVE_VERSION = 2;  ///< Version of the NodeT class for state saving/loading.
     NodeParameters*  parameters;         ///< @brief Parameters of the Node
     unsigned int    id;                 ///< @brief Unique Node id
 
@@ -124,8 +129,8 @@ private:
 
 
     //void Deactivate(float current_time_);
-    bool Activate(float current_time_, const Geometry &geometry);
-    bool ComputeActivation(float current_time_, const Geometry &geometry);
+    bool Activate(float current_time_, const BasicTissue<ActionPotentialModel, ConductionVelocityModel> & tissue);
+    bool ComputeActivation(float current_time_, const BasicTissue<ActionPotentialModel, ConductionVelocityModel> & tissue);
 
 };
 
@@ -19,6 +19,8 @@
 #include <cstring>
 #include <cassert>
 
+#include "state_file.h"
+
 /**
  * @brief Parameters for a Node object.
  * Parameters that determine the Node behaviour.
@@ -209,40 +211,24 @@ public:
     }
 
     /**
-     * Save the state of the parameters pool to a file.
+     * Save the state of the parameters pool to a state file.
+     * The parameters are saved as they are in memory, so the size of NodeParameters is checked when loading.
      * @param f Output file.
     */
-    void SaveState(std::ofstream & f) const
+    void SaveState(StateWriter & f) const
     {
-        const int version = 1;
-        f.write( (char *) &version, sizeof(int) );
-
-        // Save number of parameters in the pool
-        size_t n_params = pool.size();
-        f.write( (char *) &n_params, sizeof(size_t) );
-        // Save the parameters
-        f.write( (char *) &pool[0], sizeof(NodeParameters) * n_params );
+        f.Add("parameters", pool);
     }
 
     /**
-     * Load the state of the parameters pool from a file.
+     * Load the state of the parameters pool from a state file.
      * @param f Input file.
     */
-    void LoadState(std::ifstream & f)
+    void LoadState(StateReader & f)
     {
-        const int version = 1;
-
-        int file_version;
-        f.read( (char *) &file_version, sizeof(int) );
-        if(file_version != version)
-            throw std::runtime_error("ParametersPool::LoadState: Wrong file version.");
-
-        // Load number of parameters in the pool
-        size_t n_params;
-        f.read( (char *) &n_params, sizeof(size_t) );
-        // Load the parameters
-        pool.resize(n_params);
-        f.read( (char *) &pool[0], sizeof(NodeParameters) * n_params );
+        size_t n_params = f.GetSize("parameters");
+        const NodeParameters * params = f.Get<NodeParameters>("parameters", n_params);
+        pool.assign(params, params + n_params);
     }
 
     /**
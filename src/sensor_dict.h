@@ -8,19 +8,67 @@
 #define SENSOR_DICT_H
 #include <map>
 #include <string>
+#include <tuple>
+#include <utility>
 #include <vector>
 #include "utility.h"
 
 // File for showing the contents of any container.
 //#include "prettyprint.hpp"
 
+template <typename T>
+struct SensorColumns;
+
+/**
+ * Records of the sensors stored by columns: the node id of each record and one contiguous
+ * vector for each element of the data tuple.
+ */
+template <typename... Ts>
+struct SensorColumns<std::tuple<Ts...>>
+{
+    using Data = std::tuple<Ts...>;
+    static constexpr size_t N_COLUMNS = sizeof...(Ts);
+
+    std::vector<int> node_ids;
+    std::tuple<std::vector<Ts>...> columns;
+
+    size_t size() const { return node_ids.size(); }
+
+    void Add(int node_id, const Data & data)
+    {
+        node_ids.push_back(node_id);
+        AddData(data, std::index_sequence_for<Ts...>{});
+    }
+
+    /** Get the data of record i as a tuple */
+    Data Get(size_t i) const
+    {
+        return std::apply([i](const auto &... column) { return Data(column[i]...); }, columns);
+    }
+
+    void Clear()
+    {
+        node_ids.clear();
+        std::apply([](auto &... column) { (column.clear(), ...); }, columns);
+    }
+
+private:
+    template <size_t... I>
+    void AddData(const Data & data, std::index_sequence<I...>)
+    {
+        (std::get<I>(columns).push_back(std::get<I>(data)), ...);
+    }
+};
+
 template <typename T>
 class SensorDict
 {
     std::vector<std::string> data_names;
-    std::map<int, std::vector<T> > sensor_info;
+    SensorColumns<T> records;   ///< Records of all the sensors, in the order they were added
 
 public:
+    using Columns = SensorColumns<T>;
+
     SensorDict(std::vector<std::string> names) : data_names(names)
     {}
 
@@ -29,12 +77,12 @@ public:
      */
     void Init()
     {
-        sensor_info.clear();
+        records.Clear();
     }
 
     void AddData(int node_id, const T & data)
     {
-        sensor_info[node_id].push_back(data);
+        records.Add(node_id, data);
     }
 
     /**
@@ -43,9 +91,31 @@ public:
      */
     std::map<int, std::vector<T>> GetSensorInfo() const
     {
+        std::map<int, std::vector<T>> sensor_info;
+        for(size_t i = 0; i < records.size(); ++i)
+            sensor_info[records.node_ids[i]].push_back(records.Get(i));
         return sensor_info;
     }
 
+    /**
+     * @brief Get the records of all sensors, by columns.
+     */
+    const Columns & GetColumns() const
+    {
+        return records;
+    }
+
+    /**
+     * @brief Get the records stored since the last call and remove them from the dictionary.
+     * @return The new records, by columns.
+     */
+    Columns Drain()
+    {
+        Columns new_records;
+        std::swap(new_records, records);
+        return new_records;
+    }
+
     /**
      * @brief Get the names of the data stored in the sensors.
      * @return A vector of strings containing the names of the data.
@@ -87,7 +157,7 @@ public:
                 os << separator;
         }
         os << "\n";
-        for (const auto &pair : sensor_info)
+        for (const auto &pair : GetSensorInfo())
         {
             os << "Node ID: " << pair.first << "\n";
             ShowNode(pair, os, separator);
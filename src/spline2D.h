@@ -13,6 +13,8 @@
 #include <string>
 #include <cassert>
 #include <map>
+#include <memory>
+#include <mutex>
 #include <cmath>
 #include <filesystem>
 #include <initializer_list>
@@ -99,6 +101,14 @@ public:
 
     }
 
+    /**
+     * @brief Get the largest value of the table.
+     */
+    float getMaxValue() const
+    {
+        return y.maxCoeff();
+    }
+
     float getEquilibrium(int dim, float value) const
     {
         assert(dim == 0 || dim == 1);
@@ -329,6 +339,47 @@ public:
         return &it->second;
     }
 
+    const Spline2D * getSpline(CellType type) const
+    {
+        auto it = splines.find(type);
+        if (it == splines.end())
+            return nullptr;
+        return &it->second;
+    }
+
+    /**
+     * @brief Get a shared, read-only container loaded from a configuration file.
+     *
+     * Containers are cached by the canonical path of the configuration file, so all the
+     * tissues using the same models share one copy. A container is released when the last
+     * tissue using it is destroyed. Model files are assumed not to change while in use.
+     * This function is thread-safe.
+     * @param filename Name of the configuration file containing the list of restitution models.
+     * @return Shared pointer to the container.
+     */
+    static std::shared_ptr<const SplineContainer2D> Load(const fs::path &filename)
+    {
+        static std::mutex cache_mutex;
+        static std::map<std::string, std::weak_ptr<const SplineContainer2D>> cache;
+
+        std::error_code ec;
+        fs::path key_path = fs::canonical(filename, ec);
+        std::string key = ec ? filename.string() : key_path.string();
+
+        std::lock_guard<std::mutex> lock(cache_mutex);
+        auto it = cache.find(key);
+        if(it != cache.end())
+        {
+            if(auto container = it->second.lock())
+                return container;
+        }
+
+        auto container = std::make_shared<SplineContainer2D>();
+        container->Init(filename);
+        cache[key] = container;
+        return container;
+    }
+
 private:
     std::map<CellType,Spline2D> splines;
 };
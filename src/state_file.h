@@ -0,0 +1,358 @@
+/**
+ * @file state_file.h
+ * Block file used to save and load the state of the simulation.
+ *
+ */
+
+#ifndef STATE_FILE_H
+#define STATE_FILE_H
+
+#include <cstdint>
+#include <cstring>
+#include <fstream>
+#include <iostream>
+#include <map>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <type_traits>
+#include <vector>
+
+#ifdef ARRITMIC3D_ZLIB
+#include <zlib.h>
+#endif
+
+#if defined(__unix__) || defined(__APPLE__)
+#define STATE_FILE_MMAP
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+/**
+ * @brief Layout of the state files.
+ *
+ * A state file has a header, a table of blocks and the data of the blocks. Each block is
+ * a contiguous array (e.g. one field of all the nodes), stored at an offset aligned to
+ * BLOCK_ALIGNMENT. All the values are little-endian. A block can be compressed with zlib.
+ */
+namespace StateFile
+{
+    constexpr char MAGIC[8] = {'A', '3', 'D', 'S', 'T', 'A', 'T', 'E'};
+    constexpr uint64_t BLOCK_ALIGNMENT = 64;
+    constexpr uint32_t COMPRESSED = 1;     ///< Flag of the compressed blocks
+
+    struct Header
+    {
+        char magic[8];
+        uint32_t version;                   ///< Version of the saved tissue
+        uint32_t n_blocks;
+    };
+
+    struct BlockEntry
+    {
+        char name[32];
+        uint32_t element_size;              ///< Size in bytes of each element of the block
+        uint32_t flags;
+        uint64_t n_elements;
+        uint64_t offset;                    ///< Position of the data from the beginning of the file
+        uint64_t stored_size;               ///< Size in bytes of the data in the file
+    };
+
+    inline bool IsLittleEndian()
+    {
+        const uint16_t one = 1;
+        return *reinterpret_cast<const unsigned char *>(&one) == 1;
+    }
+
+    /** Check if the state files can be compressed */
+    inline bool CompressionAvailable()
+    {
+#ifdef ARRITMIC3D_ZLIB
+        return true;
+#else
+        return false;
+#endif
+    }
+}
+
+/**
+ * @brief Collects the blocks of a state file and writes them.
+ *
+ * The blocks keep their data until Write is called, so the arrays can be moved into them.
+ */
+class StateWriter
+{
+public:
+    /**
+     * @param version_ Version of the saved tissue.
+     * @param compress_ Compress the blocks with zlib. It is ignored, with a warning, if
+     * the module was built without zlib.
+     */
+    StateWriter(uint32_t version_, bool compress_ = false) : version(version_), compress(compress_)
+    {
+        if(!StateFile::IsLittleEndian())
+            throw std::runtime_error("StateWriter: state files can only be saved in little-endian systems.");
+        if(compress && !StateFile::CompressionAvailable())
+        {
+            std::cerr << "Warning: arritmic3d was built without zlib, the state is saved uncompressed." << std::endl;
+            compress = false;
+        }
+    }
+
+    /**
+     * @brief Add a block with the elements of an array.
+     * @param name Name of the block, at most 31 characters.
+     * @param data Elements of the block. They must be trivially copyable.
+     */
+    template <typename T>
+    void Add(const std::string & name, std::vector<T> data)
+    {
+        static_assert(std::is_trivially_copyable<T>::value, "State blocks must be trivially copyable");
+        if(name.size() >= sizeof(StateFile::BlockEntry::name))
+            throw std::invalid_argument("StateWriter: block name too long: " + name);
+        auto holder = std::make_shared<std::vector<T>>(std::move(data));
+        blocks.push_back({name, sizeof(T), holder->size(), holder->data(), holder});
+    }
+
+    /**
+     * @brief Write the blocks to a file.
+     */
+    void Write(const std::string & filename) const
+    {
+        // Compressed data of each block, or empty if it is stored as it is
+        std::vector<std::vector<unsigned char>> compressed(blocks.size());
+        std::vector<StateFile::BlockEntry> entries(blocks.size());
+        uint64_t offset = Align(sizeof(StateFile::Header) + blocks.size() * sizeof(StateFile::BlockEntry));
+        for(size_t i = 0; i < blocks.size(); i++)
+        {
+            const Block & block = blocks[i];
+            StateFile::BlockEntry & entry = entries[i];
+            std::memset(&entry, 0, sizeof(entry));
+            std::strncpy(entry.name, block.name.c_str(), sizeof(entry.name) - 1);
+            entry.element_size = block.element_size;
+            entry.n_elements = block.n_elements;
+            entry.stored_size = block.Size();
+            if(compress)
+                Compress(block, compressed[i], entry);
+            entry.offset = offset;
+            offset = Align(offset + entry.stored_size);
+        }
+
+        std::ofstream f(filename, std::ios::binary);
+        if(!f)
+            throw std::runtime_error("Could not open file " + filename + " for writing.");
+        StateFile::Header header;
+        std::memcpy(header.magic, StateFile::MAGIC, sizeof(header.magic));
+        header.version = version;
+        header.n_blocks = blocks.size();
+        f.write((const char *) &header, sizeof(header));
+        f.write((const char *) entries.data(), entries.size() * sizeof(StateFile::BlockEntry));
+
+        static const char padding[StateFile::BLOCK_ALIGNMENT] = {};
+        for(size_t i = 0; i < blocks.size(); i++)
+        {
+            f.write(padding, entries[i].offset - f.tellp());
+            if(entries[i].flags & StateFile::COMPRESSED)
+                f.write((const char *) compressed[i].data(), entries[i].stored_size);
+            else
+                f.write((const char *) blocks[i].data, entries[i].stored_size);
+        }
+        if(!f)
+            throw std::runtime_error("Error writing file " + filename + ".");
+    }
+
+private:
+    struct Block
+    {
+        std::string name;
+        uint32_t element_size;
+        uint64_t n_elements;
+        const void * data;
+        std::shared_ptr<const void> holder;     ///< Owner of data
+
+        uint64_t Size() const { return element_size * n_elements; }
+    };
+
+    static uint64_t Align(uint64_t offset)
+    {
+        return (offset + StateFile::BLOCK_ALIGNMENT - 1) / StateFile::BLOCK_ALIGNMENT * StateFile::BLOCK_ALIGNMENT;
+    }
+
+    /** Compress a block, if it reduces its size */
+    static void Compress(const Block & block, std::vector<unsigned char> & out, StateFile::BlockEntry & entry)
+    {
+#ifdef ARRITMIC3D_ZLIB
+        uLongf size = compressBound(block.Size());
+        out.resize(size);
+        if(compress2(out.data(), &size, (const Bytef *) block.data, block.Size(), Z_BEST_SPEED) == Z_OK && size < block.Size())
+        {
+            entry.flags |= StateFile::COMPRESSED;
+            entry.stored_size = size;
+        }
+        else
+            out.clear();
+#endif
+    }
+
+    uint32_t version;
+    bool compress;
+    std::vector<Block> blocks;
+};
+
+/**
+ * @brief Reads the blocks of a state file.
+ *
+ * The file is memory-mapped, when the system allows it, and the uncompressed blocks are read
+ * directly from the mapping. Compressed blocks are decompressed when they are requested.
+ */
+class StateReader
+{
+public:
+    explicit StateReader(const std::string & filename_) : filename(filename_)
+    {
+        if(!StateFile::IsLittleEndian())
+            throw std::runtime_error("StateReader: state files can only be loaded in little-endian systems.");
+        Map();
+        StateFile::Header header;
+        if(file_size < sizeof(header))
+            throw std::runtime_error("File " + filename + " is not an arritmic3d state file.");
+        std::memcpy(&header, file_data, sizeof(header));
+        if(std::memcmp(header.magic, StateFile::MAGIC, sizeof(header.magic)) != 0)
+            throw std::runtime_error("File " + filename + " is not an arritmic3d state file.");
+        version = header.version;
+
+        if(file_size < sizeof(header) + uint64_t(header.n_blocks) * sizeof(StateFile::BlockEntry))
+            throw std::runtime_error("File " + filename + " is truncated.");
+        const char * table = file_data + sizeof(header);
+        for(uint32_t i = 0; i < header.n_blocks; i++)
+        {
+            StateFile::BlockEntry entry;
+            std::memcpy(&entry, table + i * sizeof(entry), sizeof(entry));
+            entry.name[sizeof(entry.name) - 1] = '\0';
+            if(entry.offset > file_size || entry.stored_size > file_size - entry.offset)
+                throw std::runtime_error("File " + filename + " is truncated.");
+            // Uncompressed blocks are read in place, so they must have the size of their elements
+            if(!(entry.flags & StateFile::COMPRESSED) &&
+               (entry.element_size == 0 ? entry.stored_size != 0 :
+                entry.stored_size % entry.element_size != 0 || entry.stored_size / entry.element_size != entry.n_elements))
+                throw std::runtime_error("State block " + std::string(entry.name) + " of " + filename + " is corrupted.");
+            entries[entry.name] = entry;
+        }
+    }
+
+    ~StateReader()
+    {
+#ifdef STATE_FILE_MMAP
+        if(file_data != nullptr && file_size > 0)
+            munmap((void *) file_data, file_size);
+#endif
+    }
+
+    StateReader(const StateReader &) = delete;
+    StateReader & operator=(const StateReader &) = delete;
+
+    /** Get the version of the saved tissue */
+    uint32_t GetVersion() const { return version; }
+
+    /** Get the number of elements of a block */
+    size_t GetSize(const std::string & name) const
+    {
+        return GetEntry(name).n_elements;
+    }
+
+    /**
+     * @brief Get the elements of a block.
+     * @param name Name of the block.
+     * @param n_elements Expected number of elements.
+     * @return Pointer to the elements. It is valid while the reader exists.
+     */
+    template <typename T>
+    const T * Get(const std::string & name, size_t n_elements)
+    {
+        const StateFile::BlockEntry & entry = GetEntry(name);
+        if(entry.element_size != sizeof(T) || entry.n_elements != n_elements)
+            throw std::runtime_error("State block " + name + " has " + std::to_string(entry.n_elements) + " elements of " +
+                                     std::to_string(entry.element_size) + " bytes, expected " + std::to_string(n_elements) +
+                                     " of " + std::to_string(sizeof(T)) + ".");
+        if(!(entry.flags & StateFile::COMPRESSED))
+            return reinterpret_cast<const T *>(file_data + entry.offset);
+
+        std::vector<char> & data = decompressed[name];
+        if(data.empty())
+            Decompress(entry, data);
+        return reinterpret_cast<const T *>(data.data());
+    }
+
+private:
+    const StateFile::BlockEntry & GetEntry(const std::string & name) const
+    {
+        auto it = entries.find(name);
+        if(it == entries.end())
+            throw std::runtime_error("State block " + name + " not found in " + filename + ".");
+        return it->second;
+    }
+
+    /** Map the file in memory, or read it if mmap is not available */
+    void Map()
+    {
+#ifdef STATE_FILE_MMAP
+        int fd = open(filename.c_str(), O_RDONLY);
+        if(fd < 0)
+            throw std::runtime_error("Could not open file " + filename + " for reading.");
+        struct stat st;
+        if(fstat(fd, &st) != 0)
+        {
+            close(fd);
+            throw std::runtime_error("Could not open file " + filename + " for reading.");
+        }
+        file_size = st.st_size;
+        if(file_size > 0)
+        {
+            void * mapping = mmap(nullptr, file_size, PROT_READ, MAP_PRIVATE, fd, 0);
+            close(fd);
+            if(mapping == MAP_FAILED)
+                throw std::runtime_error("Could not map file " + filename + ".");
+            file_data = static_cast<const char *>(mapping);
+        }
+        else
+            close(fd);
+#else
+        std::ifstream f(filename, std::ios::binary | std::ios::ate);
+        if(!f)
+            throw std::runtime_error("Could not open file " + filename + " for reading.");
+        file_size = f.tellg();
+        // 8-byte elements keep the blocks aligned
+        buffer.resize((file_size + 7) / 8);
+        f.seekg(0);
+        f.read((char *) buffer.data(), file_size);
+        file_data = (const char *) buffer.data();
+#endif
+    }
+
+    void Decompress(const StateFile::BlockEntry & entry, std::vector<char> & data) const
+    {
+#ifdef ARRITMIC3D_ZLIB
+        uLongf size = entry.element_size * entry.n_elements;
+        data.resize(size);
+        if(uncompress((Bytef *) data.data(), &size, (const Bytef *) (file_data + entry.offset), entry.stored_size) != Z_OK ||
+           size != data.size())
+            throw std::runtime_error("State block " + std::string(entry.name) + " of " + filename + " is corrupted.");
+#else
+        throw std::runtime_error("File " + filename + " is compressed, but arritmic3d was built without zlib.");
+#endif
+    }
+
+    std::string filename;
+    uint32_t version = 0;
+    const char * file_data = nullptr;
+    uint64_t file_size = 0;
+#ifndef STATE_FILE_MMAP
+    std::vector<uint64_t> buffer;       ///< Contents of the file, if it cannot be mapped
+#endif
+    std::map<std::string, StateFile::BlockEntry> entries;
+    std::map<std::string, std::vector<char>> decompressed;
+};
+
+#endif // STATE_FILE_H
@@ -0,0 +1,227 @@
+/**
+ * @file stimulus_protocol.h
+ * Stimulation protocol of the cardiac tissue, fired by the tissue while the simulation runs.
+ *
+ */
+
+#ifndef STIMULUS_PROTOCOL_H
+#define STIMULUS_PROTOCOL_H
+#include <algorithm>
+#include <cstdint>
+#include <numeric>
+#include <stdexcept>
+#include <vector>
+
+#include "definitions.h"
+#include "state_file.h"
+
+/**
+ * @brief Trains of external activations of sets of nodes.
+ *
+ * A train stimulates a set of nodes several times. Each node has its own time for the first
+ * stimulus, and the stimulus k of the train is applied offsets[k] later to all its nodes, with
+ * the beat number beats[k]. The activations are not expanded: the nodes of a train are sorted
+ * by their first time, and each stimulus keeps the position of the next node to stimulate.
+ * The time of the stimulus k of a node is float(first time + offsets[k]), so the nodes
+ * stimulated at the same time are found by exact comparison.
+ */
+class StimulusProtocol
+{
+public:
+    /**
+     * @brief Add a train of stimuli.
+     * @param nodes Positions in the live nodes of the stimulated nodes.
+     * @param first_times Time of the first stimulus of each node, or a single time for all of them.
+     * @param offsets Time of each stimulus from the first time of the node.
+     * @param beats Beat number of each stimulus.
+     */
+    void AddTrain(const std::vector<size_t> & nodes, const std::vector<float> & first_times,
+                  const std::vector<double> & offsets, const std::vector<int> & beats)
+    {
+        if(first_times.size() != nodes.size() && first_times.size() != 1)
+            throw std::invalid_argument("StimulusProtocol::AddTrain: Expected one first time per node, or a single one.");
+        if(offsets.size() != beats.size())
+            throw std::invalid_argument("StimulusProtocol::AddTrain: Expected one beat per stimulus.");
+        if(nodes.empty() || offsets.empty())
+            return;
+
+        Train train;
+        std::vector<size_t> order(nodes.size());
+        std::iota(order.begin(), order.end(), 0);
+        if(first_times.size() > 1)
+            std::stable_sort(order.begin(), order.end(), [&](size_t a, size_t b) { return first_times[a] < first_times[b]; });
+        train.nodes.reserve(nodes.size());
+        train.first_times.reserve(nodes.size());
+        for(size_t i : order)
+        {
+            train.nodes.push_back(nodes[i]);
+            train.first_times.push_back(first_times.size() > 1 ? first_times[i] : first_times[0]);
+        }
+        train.offsets = offsets;
+        train.beats = beats;
+        train.next.assign(offsets.size(), 0);
+        trains.push_back(std::move(train));
+        UpdateNextTime();
+    }
+
+    /**
+     * @brief Compute the offsets and the beats of a pacing protocol, given as blocks of stimuli.
+     * The block b has n_stims[b] stimuli separated by bcl[b]. The first stimulus of the next
+     * block comes bcl[b+1] after the last one of the block b.
+     * @param bcl Basic cycle length of each block.
+     * @param n_stims Number of stimuli of each block.
+     * @param first_beat Beat number of the first stimulus. The next ones are numbered consecutively.
+     * @param offsets Output: time of each stimulus from the first one.
+     * @param beats Output: beat number of each stimulus.
+     */
+    static void PacingSchedule(const std::vector<float> & bcl, const std::vector<int> & n_stims, int first_beat,
+                               std::vector<double> & offsets, std::vector<int> & beats)
+    {
+        if(bcl.size() != n_stims.size())
+            throw std::invalid_argument("StimulusProtocol::PacingSchedule: Expected one BCL per block of stimuli.");
+        offsets.clear();
+        beats.clear();
+        double t = 0.0;
+        for(size_t b = 0; b < bcl.size(); b++)
+            for(int s = 0; s < n_stims[b]; s++)
+            {
+                offsets.push_back(t);
+                beats.push_back(first_beat++);
+                t += (b + 1 < bcl.size() && s + 1 >= n_stims[b]) ? bcl[b + 1] : bcl[b];
+            }
+    }
+
+    /** Remove all the stimuli */
+    void Clear()
+    {
+        trains.clear();
+        next_time = MAX_TIME;
+    }
+
+    /** Get the time of the next stimulus, or MAX_TIME if there are no more stimuli */
+    float GetNextTime() const { return next_time; }
+
+    /** Get the number of trains */
+    size_t GetNumTrains() const { return trains.size(); }
+
+    /**
+     * @brief Apply the stimuli at time t, and move to the next ones. There must not be stimuli
+     * earlier than t. The nodes of each train stimulated with the same beat are passed together.
+     * @param t Time of the stimuli, as given by GetNextTime.
+     * @param activate Function called as activate(nodes, n_nodes, beat), with the positions of the nodes.
+     */
+    template <typename F>
+    void Apply(float t, F && activate)
+    {
+        for(Train & train : trains)
+            for(size_t k = 0; k < train.offsets.size(); k++)
+            {
+                size_t & next = train.next[k];
+                const size_t begin = next;
+                while(next < train.nodes.size() && train.Time(next, k) <= t)
+                    next++;
+                if(next > begin)
+                    activate(&train.nodes[begin], next - begin, train.beats[k]);
+            }
+        UpdateNextTime();
+    }
+
+    /**
+     * Save the trains and the position of their next stimuli to a state file.
+     * @param f Output file.
+     */
+    void SaveState(StateWriter & f) const
+    {
+        std::vector<uint64_t> sizes, nodes, next;
+        std::vector<float> first_times;
+        std::vector<double> offsets;
+        std::vector<int> beats;
+        for(const Train & train : trains)
+        {
+            sizes.push_back(train.nodes.size());
+            sizes.push_back(train.offsets.size());
+            nodes.insert(nodes.end(), train.nodes.begin(), train.nodes.end());
+            first_times.insert(first_times.end(), train.first_times.begin(), train.first_times.end());
+            offsets.insert(offsets.end(), train.offsets.begin(), train.offsets.end());
+            beats.insert(beats.end(), train.beats.begin(), train.beats.end());
+            next.insert(next.end(), train.next.begin(), train.next.end());
+        }
+        f.Add("stim_sizes", std::move(sizes));
+        f.Add("stim_nodes", std::move(nodes));
+        f.Add("stim_first_times", std::move(first_times));
+        f.Add("stim_offsets", std::move(offsets));
+        f.Add("stim_beats", std::move(beats));
+        f.Add("stim_next", std::move(next));
+    }
+
+    /**
+     * Load the trains and the position of their next stimuli from a state file.
+     * @param f Input file.
+     * @param n_nodes Number of live nodes.
+     */
+    void LoadState(StateReader & f, size_t n_nodes)
+    {
+        const size_t n_sizes = f.GetSize("stim_sizes");
+        const uint64_t * sizes = f.Get<uint64_t>("stim_sizes", n_sizes);
+        size_t total_nodes = 0, total_stimuli = 0;
+        for(size_t i = 0; i + 1 < n_sizes; i += 2)
+        {
+            total_nodes += sizes[i];
+            total_stimuli += sizes[i + 1];
+        }
+        const uint64_t * nodes = f.Get<uint64_t>("stim_nodes", total_nodes);
+        const float * first_times = f.Get<float>("stim_first_times", total_nodes);
+        const double * offsets = f.Get<double>("stim_offsets", total_stimuli);
+        const int * beats = f.Get<int>("stim_beats", total_stimuli);
+        const uint64_t * next = f.Get<uint64_t>("stim_next", total_stimuli);
+
+        trains.clear();
+        for(size_t i = 0; i + 1 < n_sizes; i += 2)
+        {
+            const size_t n = sizes[i], n_stimuli = sizes[i + 1];
+            Train train;
+            train.nodes.assign(nodes, nodes + n);
+            train.first_times.assign(first_times, first_times + n);
+            train.offsets.assign(offsets, offsets + n_stimuli);
+            train.beats.assign(beats, beats + n_stimuli);
+            train.next.assign(next, next + n_stimuli);
+            for(size_t node : train.nodes)
+                if(node >= n_nodes)
+                    throw std::runtime_error("StimulusProtocol::LoadState: Wrong stimulated node.");
+            nodes += n;
+            first_times += n;
+            offsets += n_stimuli;
+            beats += n_stimuli;
+            next += n_stimuli;
+            trains.push_back(std::move(train));
+        }
+        UpdateNextTime();
+    }
+
+private:
+    struct Train
+    {
+        std::vector<size_t> nodes;          ///< Positions in the live nodes, sorted by first time
+        std::vector<float> first_times;     ///< Time of the first stimulus of each node
+        std::vector<double> offsets;        ///< Time of each stimulus from the first time of the nodes
+        std::vector<int> beats;             ///< Beat number of each stimulus
+        std::vector<size_t> next;           ///< Position in nodes of the next node of each stimulus
+
+        /** Time of the stimulus k of the node at position i */
+        float Time(size_t i, size_t k) const { return float(first_times[i] + offsets[k]); }
+    };
+
+    void UpdateNextTime()
+    {
+        next_time = MAX_TIME;
+        for(const Train & train : trains)
+            for(size_t k = 0; k < train.offsets.size(); k++)
+                if(train.next[k] < train.nodes.size())
+                    next_time = std::min(next_time, train.Time(train.next[k], k));
+    }
+
+    std::vector<Train> trains;
+    float next_time = MAX_TIME;         ///< Time of the next stimulus
+};
+
+#endif // STIMULUS_PROTOCOL_H
@@ -8,9 +8,13 @@
 #define TISSUE_H
 
 #include <vector>
+#include <array>
 #include <iostream>
 #include <fstream>
 #include <cassert>
+#include <algorithm>
+#include <numeric>
+#include <memory>
 #include <Eigen/Dense>
 
 #include "geometry.h"
@@ -18,6 +22,9 @@
 #include "cell_event_queue.h"
 #include "error.h"
 #include "basic_tissue.h"
+#include "beat_recorder.h"
+#include "electrogram.h"
+#include "stimulus_protocol.h"
 
 using std::vector;
 
@@ -35,31 +42,208 @@ public:
     using CellEvent = Event<NodeT<APM,CVM> >;
     using Node = NodeT<APM,CVM>;
 
-    CardiacTissue(int size_x_, int size_y_, int size_z_, float dx_, float dy_, float dz_) :
-                BasicTissue<APM,CVM>(size_x_, size_y_, size_z_, dx_, dy_, dz_) {}
+    CardiacTissue(int size_x_, int size_y_, int size_z_, float dx_, float dy_, float dz_, EventQueueType queue_type_ = EventQueueType::HEAP) :
+                BasicTissue<APM,CVM>(size_x_, size_y_, size_z_, dx_, dy_, dz_, queue_type_) {}
+    std::unique_ptr<CardiacTissue> Clone() const;
     SystemEventType update(int debug = 0);
+    SystemEventType RunUntil(float t_stop, const vector<SystemEventType> & stop_on = {SystemEventType::EXT_ACTIVATION, SystemEventType::FILE_WRITE}, int debug = 0);
     void ExternalActivation(const vector<size_t> & nodes, float activation_time, int beat_n);
+    void ExternalActivation(const vector<size_t> & nodes, const vector<float> & activation_times, const vector<int> & beats);
     void TriggerEvent(CellEvent* ev);
     void ResetVariations() { apd_variation = 0.0; cv_variation = 0.0; }
     float GetAPDMeanVariation() const { return apd_variation / this->GetNumLiveNodes(); }
     float GetCVVariation() const { return cv_variation / this->GetNumLiveNodes(); }
     void SetLongAPDReactivation(bool val) { long_apd_reactivation = val; }
+    /** Get the number of node events processed since the tissue was created */
+    size_t GetNumEvents() const { return n_events; }
+    void SaveState(const std::string & filename, bool compress = false) const;
+    void LoadState(const std::string & filename);
+
+    // Domain decomposition. Functions to run the tissue as a subdomain of a larger one.
+    static constexpr int num_state_fields = 6;  ///< Fields of the state of a node copied to the ghost nodes of other subdomains
+    float GetMinTravelTime() const;
+    float GetNextEventTime() const;
+    float GetNextActivationTime(const vector<size_t> & ids) const;
+    void RunWindow(float t_end, int debug = 0);
+    void AdvanceTime(float t);
+    void SetExchangeNodes(const vector<size_t> & boundary_ids, const vector<size_t> & ghost_ids);
+    /** Get the number of nodes whose state is sent to other subdomains */
+    size_t GetNumBoundaryNodes() const { return boundary_nodes.size(); }
+    /** Get the number of nodes owned by other subdomains */
+    size_t GetNumGhostNodes() const { return ghost_nodes.size(); }
+    void GetBoundaryStates(float * states) const;
+    void SetGhostStates(const float * states);
+    void ExportGhostActivations(float * times, int * parents, float * potentials);
+    void ImportActivations(const float * times, const int * parents, const float * potentials);
+
+    // Changed nodes. Functions to save only the nodes that changed between two outputs.
+    void SetChangeTracking(bool enabled);
+    /** Check if the nodes that change are tracked */
+    bool GetChangeTracking() const { return track_changes; }
+    vector<size_t> GetChangedNodes();
+
+    // Beat maps. Functions to record the activation maps of each beat.
+    void SetBeatRecorder(bool enabled, int first_beat = 0, int last_beat = -1);
+    /** Check if the beat maps are recorded */
+    bool GetBeatRecorder() const { return beat_recorder.IsEnabled(); }
+    /** Get the beats with recorded activations, in increasing order */
+    vector<int> GetRecordedBeats() const { return beat_recorder.GetBeats(); }
+    bool GetBeatMap(int beat, BeatRecorder::BeatField field, float * values) const;
+    /** Discard the maps of a beat */
+    void EraseBeatMaps(int beat) { beat_recorder.Erase(beat); }
+
+    // Stimulation protocol. Functions to apply external activations from the tissue while it runs.
+    void AddStimulusTrain(const vector<size_t> & nodes, const vector<float> & first_times, const vector<float> & bcl,
+                          const vector<int> & n_stims, int first_beat = 1);
+    void AddStimuli(const vector<size_t> & nodes, const vector<float> & times, const vector<int> & beats);
+    /** Remove the stimuli that have not been applied yet */
+    void ClearStimuli() { stimuli.Clear(); }
+    /** Get the time of the next stimulus of the protocol, or MAX_TIME if there are no more stimuli */
+    float GetNextStimulusTime() const { return stimuli.GetNextTime(); }
+
+    // Pseudo-ECG
+    void SetElectrogram(const vector<size_t> & nodes, const vector<float> & weights, size_t n_leads, float period, float start_time);
+    /** Get the number of leads of the pseudo-ECG, 0 if it is not computed */
+    size_t GetNumLeads() const { return electrogram.GetNumLeads(); }
+    void GetElectrogram(vector<float> & times, vector<float> & signals);
 
 private:
+    /// Only used by Clone, that moves the pointers of the copy
+    CardiacTissue(const CardiacTissue &) = default;
+
+    void MarkChanged(const Node * node);
+    void ActivateExternally(Node * node, float activation_time, int beat_n);
+    void AddStimulusNodes(const vector<size_t> & nodes, const vector<float> & first_times, const vector<double> & offsets, const vector<int> & beats);
+    void ApplyStimuli();
+
     bool long_apd_reactivation = false;
     float apd_plateau_duration = 0.8; // Percentage of APD considered as plateau for reactivation
     float apd_variation = 0.0;
     float cv_variation = 0.0;
+    size_t n_events = 0;    ///< Number of node events processed
+
+    // Domain decomposition. nullptr for VOID nodes
+    vector<Node*> boundary_nodes;               ///< Nodes whose state is sent to the neighbour subdomains
+    vector<Node*> ghost_nodes;                  ///< Copies of the nodes of the neighbour subdomains
+
+    // Changed nodes
+    bool track_changes = false;
+    vector<char> node_changed;                  ///< Whether each live node is in changed_nodes
+    vector<size_t> changed_nodes;               ///< Ids of the nodes changed since the last call to GetChangedNodes
+
+    BeatRecorder beat_recorder;                 ///< Activation maps of each beat
+    Electrogram<Node> electrogram;              ///< Pseudo-ECG
+    StimulusProtocol stimuli;                   ///< External activations applied by update()
 };
 
+/**
+ * Copy the tissue in memory, so several simulations can continue from the same state.
+ * The nodes, the event queue and the rest of the simulation state are copied. The tables that
+ * do not change while the simulation runs (neighbours, anisotropy factors, node parameters and
+ * restitution models) are shared with the copy, until one of the tissues changes them.
+ * The tissue must not be running in another thread.
+ * @return The copy of the tissue.
+ */
+template <typename APM,typename CVM>
+std::unique_ptr<CardiacTissue<APM,CVM>> CardiacTissue<APM,CVM>::Clone() const
+{
+    std::unique_ptr<CardiacTissue> copy(new CardiacTissue(*this));
+    copy->RebasePointers(*this);
+
+    const Node * source_nodes = this->tissue_nodes.data();
+    Node * nodes = copy->tissue_nodes.data();
+    for(auto * exchange_nodes : {&copy->boundary_nodes, &copy->ghost_nodes})
+        for(Node *& node : *exchange_nodes)
+            if(node != nullptr)
+                node = nodes + (node - source_nodes);
+    copy->electrogram.Rebase(nodes);
+    return copy;
+}
+
+/**
+ * Save the state of the simulation to a file. Besides the state saved by BasicTissue, the file
+ * has the number of processed events, the changed nodes, the beat maps, the pseudo-ECG and the
+ * stimuli of the protocol, so a simulation loaded with LoadState gives the same results as the original one.
+ * @param filename Name of the file.
+ * @param compress Compress the blocks with zlib, if the module was built with it.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::SaveState(const std::string & filename, bool compress) const
+{
+    StateWriter state_file(this->SAVE_VERSION, compress);
+    this->SaveBlocks(state_file);
+    state_file.Add("n_events", vector<uint64_t>{n_events});
+    state_file.Add("track_changes", vector<unsigned char>{track_changes});
+    state_file.Add("changed_nodes", vector<uint64_t>(changed_nodes.begin(), changed_nodes.end()));
+    beat_recorder.SaveState(state_file);
+    electrogram.SaveState(state_file);
+    stimuli.SaveState(state_file);
+    state_file.Write(filename);
+}
+
+/**
+ * Load the state of the simulation from a file saved with SaveState.
+ * The tissue must have the same size and spacing, and InitModels must have been called.
+ * The exchange nodes set with SetExchangeNodes are kept.
+ * @param filename Name of the file.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::LoadState(const std::string & filename)
+{
+    // The nodes are rebuilt, so the exchange nodes are found again from their ids
+    const size_t no_node = this->size();
+    auto get_ids = [no_node](const vector<Node*> & nodes)
+    {
+        vector<size_t> ids;
+        for(const Node * node : nodes)
+            ids.push_back(node != nullptr ? node->id : no_node);
+        return ids;
+    };
+    vector<size_t> boundary_ids = get_ids(boundary_nodes);
+    vector<size_t> ghost_ids = get_ids(ghost_nodes);
+
+    StateReader state_file(filename);
+    this->LoadBlocks(state_file);
+
+    n_events = *state_file.Get<uint64_t>("n_events", 1);
+    track_changes = *state_file.Get<unsigned char>("track_changes", 1);
+    const size_t n_changed = state_file.GetSize("changed_nodes");
+    const uint64_t * changed = state_file.Get<uint64_t>("changed_nodes", n_changed);
+    changed_nodes.assign(changed, changed + n_changed);
+    node_changed.assign(track_changes ? this->tissue_nodes.size() : 0, false);
+    for(size_t id : changed_nodes)
+        node_changed.at((*this->live_index)[id]) = true;
+    beat_recorder.LoadState(state_file, this->tissue_nodes.size());
+    electrogram.LoadState(state_file, this->tissue_nodes.data(), this->tissue_nodes.size());
+    stimuli.LoadState(state_file, this->tissue_nodes.size());
+
+    for(size_t i = 0; i < boundary_ids.size(); i++)
+        boundary_nodes[i] = boundary_ids[i] == no_node ? nullptr : this->GetNodePtr(boundary_ids[i]);
+    for(size_t i = 0; i < ghost_ids.size(); i++)
+        ghost_nodes[i] = ghost_ids[i] == no_node ? nullptr : this->GetNodePtr(ghost_ids[i]);
+}
+
 /**
  * Update the tissue simulation processing an event.
+ * The stimuli of the protocol (AddStimulusTrain, AddStimuli) are applied before the rest of
+ * the events at the same time, and they are processed as a node event.
  * @param debug Debug level
  * @return true if there is an event of the simulation.
 */
 template <typename APM,typename CVM>
 SystemEventType CardiacTissue<APM,CVM>::update(int debug)
 {
+    const float stimulus_time = stimuli.GetNextTime();
+    if(stimulus_time < MAX_TIME && (this->event_queue.IsEmpty() || stimulus_time <= std::get<0>(this->event_queue.GetInfo())))
+    {
+        LOG::Info(debug > 0, "Stimulus at t=", stimulus_time);
+        LOG::Warning(stimulus_time < this->tissue_time, " t=", this->tissue_time, " older than stimulus t=", stimulus_time);
+        if(electrogram.IsEnabled())
+            electrogram.SampleUntil(stimulus_time);
+        this->tissue_time = stimulus_time;
+        ApplyStimuli();
+        return SystemEventType::NODE_EVENT;
+    }
 
     if(!this->event_queue.IsEmpty())
     {
@@ -69,6 +253,10 @@ SystemEventType CardiacTissue<APM,CVM>::update(int debug)
         float new_t = ev_time;
         LOG::Warning(new_t < this->tissue_time, " t=", this->tissue_time, " older than   ev.t=", new_t);
 
+        // All the events before new_t have been processed
+        if(electrogram.IsEnabled())
+            electrogram.SampleUntil(new_t);
+
         this->tissue_time = new_t;
 
         // System event
@@ -96,7 +284,7 @@ SystemEventType CardiacTissue<APM,CVM>::update(int debug)
         LOG::Info(debug > 1, "Before processing event. Node value: ", *(ev->cell_node) );
 
         TriggerEvent(ev);
-        //n_cells_updated++;
+        n_events++;
 
         // Check next event
         if(!this->event_queue.IsEmpty())
@@ -120,6 +308,382 @@ SystemEventType CardiacTissue<APM,CVM>::update(int debug)
 }
 
 
+/**
+ * Run the simulation until a system event listed in stop_on is processed or
+ * the tissue time reaches t_stop.
+ * Node events, and system events not listed in stop_on, are processed internally
+ * without returning to the caller.
+ * @param t_stop Stop time. As with a loop of update() calls, the event that reaches t_stop is processed.
+ * @param stop_on System event types that return control to the caller.
+ * @param debug Debug level
+ * @return The type of the system event that stopped the loop, the type of the last processed
+ * event if t_stop was reached, or NO_EVENT if the queue is empty or t_stop had already been reached.
+ */
+template <typename APM,typename CVM>
+SystemEventType CardiacTissue<APM,CVM>::RunUntil(float t_stop, const vector<SystemEventType> & stop_on, int debug)
+{
+    std::array<bool, int(SystemEventType::SIZE)> stop_mask;
+    stop_mask.fill(false);
+    for(auto type : stop_on)
+        stop_mask.at(int(type)) = true;
+
+    SystemEventType ev_type = SystemEventType::NO_EVENT;
+    while(this->tissue_time < t_stop)
+    {
+        ev_type = update(debug);
+        if(ev_type == SystemEventType::NO_EVENT || stop_mask[int(ev_type)])
+            break;
+    }
+
+    return ev_type;
+}
+
+/**
+ * Get a lower bound of the travel time between two neighbours. It is the shortest
+ * neighbour distance over the largest conduction velocity the nodes can reach, according
+ * to their current velocity and their restitution models.
+ * An activation at time t cannot schedule another one before t + GetMinTravelTime().
+ * @return The travel time, or MAX_TIME if no node conducts.
+ */
+template <typename APM,typename CVM>
+float CardiacTissue<APM,CVM>::GetMinTravelTime() const
+{
+    // Anisotropy only reduces the conduction velocity, so the longitudinal one is the fastest
+    float max_cv = 0.0;
+    for(const Node & node : this->tissue_nodes)
+        max_cv = std::max({max_cv, node.conduction_vel, node.cv_model.getMaxConductionVelocity()});
+    if(max_cv <= 0.0)
+        return MAX_TIME;
+
+    const auto & distances = this->tissue_geometry.distance_to_neighbour;
+    return *std::min_element(distances.begin(), distances.end()) / max_cv;
+}
+
+/**
+ * Get the time of the next event in the queue, or of the next stimulus of the protocol if it is earlier.
+ * @return The time of the next event, or MAX_TIME if there are no more events.
+ */
+template <typename APM,typename CVM>
+float CardiacTissue<APM,CVM>::GetNextEventTime() const
+{
+    if(this->event_queue.IsEmpty())
+        return stimuli.GetNextTime();
+    return std::min(std::get<0>(this->event_queue.GetInfo()), stimuli.GetNextTime());
+}
+
+/**
+ * Get the earliest activation scheduled for a set of nodes.
+ * @param ids Ids of the nodes. VOID nodes are skipped.
+ * @return The activation time, or MAX_TIME if none of the nodes has a scheduled activation.
+ */
+template <typename APM,typename CVM>
+float CardiacTissue<APM,CVM>::GetNextActivationTime(const vector<size_t> & ids) const
+{
+    float t = MAX_TIME;
+    for(size_t id : ids)
+    {
+        const Node * node = this->GetNodePtr(id);
+        if(node != nullptr)
+            t = std::min(t, node->next_activation_time);
+    }
+    return t;
+}
+
+/**
+ * Process the events earlier than t_end, without returning to the caller.
+ * Unlike RunUntil, the first event at t_end or later is not processed.
+ * @param t_end End of the time window.
+ * @param debug Debug level
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::RunWindow(float t_end, int debug)
+{
+    while(GetNextEventTime() < t_end)
+        update(debug);
+}
+
+/**
+ * Advance the time of the tissue without processing events, to follow the system events
+ * of the simulation when the tissue is a subdomain of a larger one.
+ * @param t New time. It must not be later than the next event.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::AdvanceTime(float t)
+{
+    LOG::Error(t > GetNextEventTime(), "AdvanceTime(): Time ", t, " is later than the next event at ", GetNextEventTime());
+    this->tissue_time = std::max(this->tissue_time, t);
+}
+
+/**
+ * Set the nodes exchanged with the neighbour subdomains when the tissue is a subdomain
+ * of a larger one.
+ * Boundary nodes are owned by this subdomain and their state is copied to the ghost nodes
+ * of the neighbours. Ghost nodes are owned by a neighbour subdomain: they are never
+ * activated here, and the activations scheduled for them are sent to their owner.
+ * It must be called after Init.
+ * @param boundary_ids Ids of the boundary nodes.
+ * @param ghost_ids Ids of the ghost nodes.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::SetExchangeNodes(const vector<size_t> & boundary_ids, const vector<size_t> & ghost_ids)
+{
+    boundary_nodes.clear();
+    for(size_t id : boundary_ids)
+        boundary_nodes.push_back(this->GetNodePtr(id));
+    ghost_nodes.clear();
+    for(size_t id : ghost_ids)
+        ghost_nodes.push_back(this->GetNodePtr(id));
+}
+
+/**
+ * Copy the state of the boundary nodes, as read by their neighbours during propagation.
+ * @param states Array of GetNumBoundaryNodes() x num_state_fields values: activation time
+ * and APD of the APD model, LAT, conduction velocity, next activation time and beat.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::GetBoundaryStates(float * states) const
+{
+    for(const Node * node : boundary_nodes)
+    {
+        if(node == nullptr)
+            node = &this->void_node;
+        states[0] = node->apd_model.getActivationTime();
+        states[1] = node->apd_model.getAPD();
+        states[2] = node->local_activation_time;
+        states[3] = node->conduction_vel;
+        states[4] = node->next_activation_time;
+        states[5] = node->beat;
+        states += num_state_fields;
+    }
+}
+
+/**
+ * Set the state of the ghost nodes.
+ * @param states Array of GetNumGhostNodes() x num_state_fields values, as given by
+ * GetBoundaryStates in the subdomains that own them.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::SetGhostStates(const float * states)
+{
+    for(Node * node : ghost_nodes)
+    {
+        if(node != nullptr)
+        {
+            node->apd_model.SetActivation(states[0], states[1]);
+            node->local_activation_time = states[2];
+            node->conduction_vel = states[3];
+            node->next_activation_time = states[4];
+            node->beat = int(states[5]);
+        }
+        states += num_state_fields;
+    }
+}
+
+/**
+ * Extract the activations of ghost nodes scheduled in this subdomain. Their events are
+ * removed from the queue, as the activation is processed by the owner of the node.
+ * @param times Activation time of each ghost node.
+ * @param parents Id of the node that scheduled the activation, or -1 if there is no activation.
+ * @param potentials Potential received by each ghost node.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::ExportGhostActivations(float * times, int * parents, float * potentials)
+{
+    for(size_t i = 0; i < ghost_nodes.size(); i++)
+    {
+        Node * node = ghost_nodes[i];
+        times[i] = MAX_TIME;
+        parents[i] = -1;
+        potentials[i] = 0.0;
+        if(node == nullptr || !this->event_queue.RemoveCellEvent(node->next_activation_event))
+            continue;
+
+        LOG::Warning(node->next_activation_time < this->tissue_time, "ExportGhostActivations(): Ghost node ", node->id,
+                     " scheduled at ", node->next_activation_time, " before the current time ", this->tissue_time);
+        times[i] = node->next_activation_time;
+        parents[i] = node->activation_parent->id;
+        potentials[i] = node->received_potential;
+        node->received_potential = 0.0;
+        node->activation_parent = nullptr;
+    }
+}
+
+/**
+ * Schedule the activations of boundary nodes sent by the neighbour subdomains.
+ * @param times Activation time of each boundary node.
+ * @param parents Id in this subdomain of the node that scheduled the activation, or -1 if there is no activation.
+ * @param potentials Potential received by each boundary node.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::ImportActivations(const float * times, const int * parents, const float * potentials)
+{
+    for(size_t i = 0; i < boundary_nodes.size(); i++)
+    {
+        Node * node = boundary_nodes[i];
+        if(node == nullptr || parents[i] < 0)
+            continue;
+
+        LOG::Warning(times[i] < this->tissue_time, "ImportActivations(): Node ", node->id, " activated at ", times[i],
+                     " before the current time ", this->tissue_time);
+        node->received_potential += potentials[i];
+        CellEvent * ev = node->ScheduleActivation(this->GetNodePtr(parents[i]), times[i]);
+        if(ev != nullptr)
+        {
+            this->event_queue.InsertCellEvent(ev);
+            MarkChanged(node);
+        }
+    }
+}
+
+/**
+ * Enable or disable the tracking of the nodes that change. A node changes when it has an
+ * event (activation or deactivation) or when an activation is scheduled for it.
+ * The rest of the nodes keep the values of their fields, except those that depend on
+ * the time (AP, DI and Life).
+ * It must be called after Init.
+ * @param enabled Track the changed nodes.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::SetChangeTracking(bool enabled)
+{
+    track_changes = enabled;
+    changed_nodes.clear();
+    node_changed.assign(enabled ? this->tissue_nodes.size() : 0, false);
+}
+
+/**
+ * Get the nodes that changed since the last call, and start a new list.
+ * @return Ids of the changed nodes, in the order of their first change.
+ */
+template <typename APM,typename CVM>
+vector<size_t> CardiacTissue<APM,CVM>::GetChangedNodes()
+{
+    LOG::Warning(!track_changes, "GetChangedNodes(): Change tracking is disabled. Use SetChangeTracking first.");
+    vector<size_t> nodes;
+    nodes.swap(changed_nodes);
+    for(size_t id : nodes)
+        node_changed[(*this->live_index)[id]] = false;
+    return nodes;
+}
+
+/**
+ * Enable or disable the recording of the activation maps of each beat. On each activation
+ * of a node in a beat of the range, its LAT, APD, DI and CV are stored in the maps of the beat.
+ * Enabling it discards the maps recorded before.
+ * It must be called after Init.
+ * @param enabled Record the beat maps.
+ * @param first_beat First beat recorded.
+ * @param last_beat Last beat recorded. If negative, all the beats from first_beat are recorded.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::SetBeatRecorder(bool enabled, int first_beat, int last_beat)
+{
+    if(enabled)
+        beat_recorder.Init(this->tissue_nodes.size(), first_beat, last_beat);
+    else
+        beat_recorder.Disable();
+}
+
+/**
+ * Get a field of the activation maps of a beat, with one value per grid node.
+ * VOID nodes and nodes not activated in the beat get NaN.
+ * @param beat Beat.
+ * @param field Field of the maps.
+ * @param values Output buffer with size() elements.
+ * @return false if the beat has no recorded activations.
+ */
+template <typename APM,typename CVM>
+bool CardiacTissue<APM,CVM>::GetBeatMap(int beat, BeatRecorder::BeatField field, float * values) const
+{
+    const auto * maps = beat_recorder.GetMaps(beat);
+    if(maps == nullptr)
+        return false;
+    const vector<float> & map = (*maps)[int(field)];
+    const vector<int> & index = *this->live_index;
+    for(size_t i = 0; i < index.size(); i++)
+        values[i] = index[i] < 0 ? std::numeric_limits<float>::quiet_NaN() : map[index[i]];
+    return true;
+}
+
+/**
+ * Compute a pseudo-ECG while the simulation runs. The signal of each lead is sampled every period
+ * as the sum over the given nodes of weight * (AP - resting potential).
+ * Previous samples are discarded. It must be called after Init.
+ * @param nodes Ids of the nodes with weights. VOID nodes are ignored.
+ * @param weights Weights of the nodes, n_leads values per node.
+ * @param n_leads Number of leads.
+ * @param period Sampling period.
+ * @param start_time Time of the first sample. It must not be earlier than the current time.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::SetElectrogram(const vector<size_t> & nodes, const vector<float> & weights, size_t n_leads, float period, float start_time)
+{
+    LOG::Error(weights.size() != nodes.size() * n_leads, "SetElectrogram(): Expected ", nodes.size() * n_leads, " weights, got ", weights.size());
+    LOG::Error(period <= 0.0, "SetElectrogram(): The sampling period must be positive");
+    LOG::Error(start_time < this->tissue_time, "SetElectrogram(): Start time ", start_time, " is earlier than the current time ", this->tissue_time);
+    if(weights.size() != nodes.size() * n_leads || period <= 0.0 || start_time < this->tissue_time)
+        return;
+
+    vector<size_t> positions;
+    vector<float> live_weights;
+    for(size_t i = 0; i < nodes.size(); i++)
+    {
+        if(this->live_index->at(nodes[i]) < 0)
+            continue;
+        positions.push_back((*this->live_index)[nodes[i]]);
+        live_weights.insert(live_weights.end(), weights.begin() + i * n_leads, weights.begin() + (i + 1) * n_leads);
+    }
+    electrogram.Init(this->tissue_nodes.size(), positions, live_weights, n_leads, period, start_time, APM::GetRestingPotential());
+
+    // Nodes already active
+    for(size_t i = 0; i < this->tissue_nodes.size(); i++)
+        if(this->tissue_nodes[i].apd_model.IsActive(this->tissue_time))
+            electrogram.AddActivation(&this->tissue_nodes[i], i);
+}
+
+/**
+ * Get the samples of the pseudo-ECG taken up to the current time.
+ * @param times Output: times of the samples.
+ * @param signals Output: samples, GetNumLeads() values per sample.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::GetElectrogram(vector<float> & times, vector<float> & signals)
+{
+    // The events at the current time may not have been processed yet
+    electrogram.SampleUntil(std::min(this->tissue_time, GetNextEventTime()));
+    times = electrogram.GetTimes();
+    signals = electrogram.GetSignals();
+}
+
+/**
+ * Add a node to the list of changed nodes, if the changes are tracked.
+ */
+template <typename APM,typename CVM>
+inline void CardiacTissue<APM,CVM>::MarkChanged(const Node * node)
+{
+    if(!track_changes)
+        return;
+    size_t i = node - this->tissue_nodes.data();
+    if(!node_changed[i])
+    {
+        node_changed[i] = true;
+        changed_nodes.push_back(node->id);
+    }
+}
+
+/**
+ * Schedule the external activation of a node.
+ */
+template <typename APM,typename CVM>
+inline void CardiacTissue<APM,CVM>::ActivateExternally(Node * node, float activation_time, int beat_n)
+{
+    CellEvent * e = node->ScheduleExternalActivation(activation_time, beat_n);
+    if(e != nullptr)
+    {
+        this->event_queue.InsertCellEvent(e);
+        MarkChanged(node);
+    }
+}
 
 /**
  * External activation of a set of nodes.
@@ -133,15 +697,147 @@ void CardiacTissue<APM,CVM>::ExternalActivation(const vector<size_t> & nodes, fl
 {
     for(size_t i = 0; i < nodes.size(); i++)
     {
-        if(this->tissue_nodes.at(nodes[i]).type == CELL_TYPE_VOID)
+        if(this->live_index->at(nodes[i]) < 0)
         {
             LOG::Warning(true, "ExternalActivation(): Node ", nodes[i], " is a CORE node. Activation ignored.");
             continue;
         }
-        CellEvent * e = this->tissue_nodes.at(nodes[i]).ScheduleExternalActivation(activation_time, beat_n);
-        if(e != nullptr)
-            this->event_queue.InsertCellEvent(e);
+        ActivateExternally(this->GetNodePtr(nodes[i]), activation_time, beat_n);
+    }
+}
+
+/**
+ * External activation of a set of nodes, each one at its own time and with its own beat.
+ * @param nodes List of nodes to activate.
+ * @param activation_times Time of activation of each node, or a single time for all of them.
+ * @param beats Beat of each node, or a single beat for all of them.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::ExternalActivation(const vector<size_t> & nodes, const vector<float> & activation_times, const vector<int> & beats)
+{
+    LOG::Error(activation_times.size() != nodes.size() && activation_times.size() != 1, "ExternalActivation(): Expected ", nodes.size(),
+               " activation times or a single one, got ", activation_times.size());
+    LOG::Error(beats.size() != nodes.size() && beats.size() != 1, "ExternalActivation(): Expected ", nodes.size(),
+               " beats or a single one, got ", beats.size());
+    if((activation_times.size() != nodes.size() && activation_times.size() != 1) || (beats.size() != nodes.size() && beats.size() != 1))
+        return;
+    size_t n_void = 0;
+    for(size_t i = 0; i < nodes.size(); i++)
+    {
+        if(this->live_index->at(nodes[i]) < 0)
+        {
+            n_void++;
+            continue;
+        }
+        ActivateExternally(this->GetNodePtr(nodes[i]), activation_times[activation_times.size() > 1 ? i : 0], beats[beats.size() > 1 ? i : 0]);
+    }
+    LOG::Warning(n_void > 0, "ExternalActivation(): ", n_void, " CORE nodes. Activations ignored.");
+}
+
+/**
+ * Add a train of stimuli to the protocol. Each node is stimulated first at its first time,
+ * and then following the blocks of the pacing protocol: n_stims[b] stimuli separated by bcl[b],
+ * with bcl[b+1] between the last stimulus of the block b and the first one of the next block.
+ * The beats are numbered consecutively from first_beat.
+ * The stimuli are applied by the tissue while it runs, before the other events at the same time.
+ * @param nodes Ids of the stimulated nodes. VOID nodes are ignored.
+ * @param first_times Time of the first stimulus of each node, or a single time for all of them.
+ * @param bcl Basic cycle length of each block.
+ * @param n_stims Number of stimuli of each block.
+ * @param first_beat Beat number of the first stimulus.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::AddStimulusTrain(const vector<size_t> & nodes, const vector<float> & first_times, const vector<float> & bcl,
+                                              const vector<int> & n_stims, int first_beat)
+{
+    LOG::Error(bcl.size() != n_stims.size(), "AddStimulusTrain(): Expected one BCL per block of stimuli, got ", bcl.size(), " and ", n_stims.size());
+    if(bcl.size() != n_stims.size())
+        return;
+    vector<double> offsets;
+    vector<int> beats;
+    StimulusProtocol::PacingSchedule(bcl, n_stims, first_beat, offsets, beats);
+    AddStimulusNodes(nodes, first_times, offsets, beats);
+}
+
+/**
+ * Add single stimuli to the protocol: node[i] is stimulated at times[i] with the beat number beats[i].
+ * The stimuli are applied by the tissue while it runs, before the other events at the same time.
+ * @param nodes Ids of the stimulated nodes. VOID nodes are ignored.
+ * @param times Time of each stimulus.
+ * @param beats Beat number of each stimulus.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::AddStimuli(const vector<size_t> & nodes, const vector<float> & times, const vector<int> & beats)
+{
+    LOG::Error(times.size() != nodes.size() || beats.size() != nodes.size(), "AddStimuli(): Expected one time and one beat per node, got ",
+               nodes.size(), " nodes, ", times.size(), " times and ", beats.size(), " beats");
+    if(times.size() != nodes.size() || beats.size() != nodes.size())
+        return;
+
+    // One train for each beat, with a single stimulus at the time of each node
+    vector<size_t> order(nodes.size());
+    std::iota(order.begin(), order.end(), 0);
+    std::stable_sort(order.begin(), order.end(), [&](size_t a, size_t b) { return beats[a] < beats[b]; });
+    for(size_t begin = 0, end; begin < order.size(); begin = end)
+    {
+        vector<size_t> beat_nodes;
+        vector<float> beat_times;
+        for(end = begin; end < order.size() && beats[order[end]] == beats[order[begin]]; end++)
+        {
+            beat_nodes.push_back(nodes[order[end]]);
+            beat_times.push_back(times[order[end]]);
+        }
+        AddStimulusNodes(beat_nodes, beat_times, {0.0}, {beats[order[begin]]});
+    }
+}
+
+/**
+ * Add a train of stimuli of the nodes given by their ids, skipping the VOID nodes.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::AddStimulusNodes(const vector<size_t> & nodes, const vector<float> & first_times,
+                                              const vector<double> & offsets, const vector<int> & beats)
+{
+    LOG::Error(first_times.size() != nodes.size() && first_times.size() != 1, "AddStimulusTrain(): Expected ", nodes.size(),
+               " first times or a single one, got ", first_times.size());
+    if(first_times.size() != nodes.size() && first_times.size() != 1)
+        return;
+
+    vector<size_t> positions;
+    vector<float> live_first_times;
+    positions.reserve(nodes.size());
+    size_t n_void = 0;
+    for(size_t i = 0; i < nodes.size(); i++)
+    {
+        const int position = this->live_index->at(nodes[i]);
+        if(position < 0)
+        {
+            n_void++;
+            continue;
+        }
+        positions.push_back(position);
+        if(first_times.size() > 1)
+            live_first_times.push_back(first_times[i]);
     }
+    LOG::Warning(n_void > 0, "AddStimulusTrain(): ", n_void, " CORE nodes ignored.");
+    if(first_times.size() == 1)
+        live_first_times = first_times;
+    stimuli.AddTrain(positions, live_first_times, offsets, beats);
+    LOG::Warning(stimuli.GetNextTime() < this->tissue_time, "AddStimulusTrain(): Stimulus at ", stimuli.GetNextTime(),
+                 " before the current time ", this->tissue_time);
+}
+
+/**
+ * Apply the stimuli of the protocol at the current time.
+ */
+template <typename APM,typename CVM>
+void CardiacTissue<APM,CVM>::ApplyStimuli()
+{
+    stimuli.Apply(this->tissue_time, [this](const size_t * positions, size_t n, int beat_n)
+    {
+        for(size_t i = 0; i < n; i++)
+            ActivateExternally(&this->tissue_nodes[positions[i]], this->tissue_time, beat_n);
+    });
 }
 
 /**
@@ -152,6 +848,7 @@ template <typename APM,typename CVM>
 void CardiacTissue<APM,CVM>::TriggerEvent(CellEvent* ev)
 {
     Node * node_ = ev->cell_node;
+    MarkChanged(node_);
 
     // Time must match
     LOG::Warning(ev->event_time != this->tissue_time, "TriggerEvent(): In node ", node_->id,
@@ -175,7 +872,7 @@ void CardiacTissue<APM,CVM>::TriggerEvent(CellEvent* ev)
         {
             /// @todo Missing reentry checks
             // The Node is activated.
-            if (node_->Activate(this->tissue_time, this->tissue_geometry))
+            if (node_->Activate(this->tissue_time, *this))
             {
                 // Once activated and computed the APD, we set the next deactivation event
                 node_->next_deactivation_event->ChangeEvent(node_->next_deactivation_time);
@@ -184,26 +881,29 @@ void CardiacTissue<APM,CVM>::TriggerEvent(CellEvent* ev)
                 // We accumulate the variations
                 apd_variation += node_->apd_model.getDeltaAPD();
 
+                beat_recorder.Record(node_ - this->tissue_nodes.data(), node_->beat, node_->local_activation_time,
+                                     node_->apd_model.getAPD(), node_->apd_model.getLastDI(), node_->conduction_vel);
+                if(electrogram.IsEnabled())
+                    electrogram.AddActivation(node_, node_ - this->tissue_nodes.data());
+
                 // The potential is sent to inactive neighbours.
-                vector<Node*> inactive_neighs;
+                // Fixed-size buffer: this runs for every activation and must not allocate.
+                std::array<Node*, Geometry::num_neighbours> inactive_neighs;
+                size_t n_inactive_neighs = 0;
+                const int * neighbours = this->GetNeighbours(node_);
                 for (unsigned int i = 0; i < this->tissue_geometry.num_neighbours; ++i )
                 {
-                    // We get the neighbour node
-                    // Danger! May go out of the array of Node
-                    Node* neigh = node_ + this->tissue_geometry.displacement[i];  // @todo Look for a better way to do this
-                    assert(neigh >= this->tissue_nodes.data() && neigh < this->tissue_nodes.data() + this->tissue_nodes.size());
-
-                    // We skip core nodes
-                    if ( neigh->type == CELL_TYPE_VOID )
+                    // We skip core nodes, which are not stored
+                    if ( neighbours[i] < 0 )
                     {
                         continue;
                     }
+                    Node* neigh = &this->tissue_nodes[neighbours[i]];
 
                     float distance = this->tissue_geometry.distance_to_neighbour[i];
-                    Vector3 activation_dir = - this->tissue_geometry.relative_position[i]; // @todo Maybe we should define the opposite direction in geometry
 
                     // We compute the direct diffusion, through the graph.
-                    float direct_vel = node_->ComputeDirectionalConductionVelocity(activation_dir);
+                    float direct_vel = this->GetDirectionalConductionVelocity(node_, i);
                     float direct_activation_time = node_->local_activation_time + distance/direct_vel;
 
                     if (neigh->GetState(this->tissue_time) == Node::CellActivationState::ACTIVE) // direct_activation_time
@@ -234,15 +934,16 @@ void CardiacTissue<APM,CVM>::TriggerEvent(CellEvent* ev)
                     if (ev_neigh != nullptr)
                     {
                         this->event_queue.InsertCellEvent(ev_neigh);
-                        inactive_neighs.push_back(neigh); // @todo Maybe it should include nodes with earlier activation time
+                        MarkChanged(neigh);
+                        inactive_neighs[n_inactive_neighs++] = neigh; // @todo Maybe it should include nodes with earlier activation time
                     }
                 }
 
-                if (inactive_neighs.size() > 0)
+                if (n_inactive_neighs > 0)
                 {
-                    float potential_to_send = node_->received_potential/inactive_neighs.size()*node_->parameters->safety_factor;
-                    for (auto neigh : inactive_neighs)
-                        neigh->received_potential += potential_to_send;
+                    float potential_to_send = node_->received_potential/n_inactive_neighs*node_->parameters->safety_factor;
+                    for (size_t i = 0; i < n_inactive_neighs; ++i)
+                        inactive_neighs[i]->received_potential += potential_to_send;
                 }
 
             }
@@ -268,14 +969,13 @@ void CardiacTissue<APM,CVM>::TriggerEvent(CellEvent* ev)
         {
             float node_excitable_at_time = node_->local_activation_time + 1.05*node_->apd_model.getERP(); // @todo Convert to parameter
             Node* parent_node_ = nullptr;
+            const int * neighbours = this->GetNeighbours(node_);
             for (unsigned int i = 0; i < this->tissue_geometry.num_neighbours; ++i )
             {
-                // Danger! May go out of the array of Node
-                Node* neigh = node_ + this->tissue_geometry.displacement[i];  // @todo Look for a better way to do this
-                assert(neigh >= this->tissue_nodes.data() && neigh < this->tissue_nodes.data() + this->tissue_nodes.size());
-                // We skip core nodes
-                if ( neigh->type != CELL_TYPE_VOID )
+                // We skip core nodes, which are not stored
+                if ( neighbours[i] >= 0 )
                 {
+                    Node* neigh = &this->tissue_nodes[neighbours[i]];
                     // If neighbour is active
                     if (neigh->GetState(node_excitable_at_time) == Node::CellActivationState::ACTIVE)
                     {
@@ -0,0 +1,179 @@
+/**
+ * ARRITMIC3D
+ * Benchmark of the event queues (binary heap and calendar queue)
+ *
+ * A trace of queue operations is recorded from a model of activation fronts,
+ * with the event time distribution of the simulations: activations a few ms after
+ * the current time and deactivations one APD later. The trace is replayed in both
+ * queues. Then the same slab is simulated with each queue, which must give the same LAT and APD.
+ *
+ * (C) CoMMLab-UV 2026
+ * */
+#include <iostream>
+#include <string>
+#include <vector>
+#include <random>
+#include <chrono>
+#include "../src/node.h"
+#include "../src/tissue.h"
+#include "../src/action_potential_rs.h"
+#include "../src/conduction_velocity.h"
+
+using Tissue = CardiacTissue<ActionPotentialRestSurface,ConductionVelocity>;
+using Node = Tissue::Node;
+using Clock = std::chrono::steady_clock;
+
+/// Queue operation. Events with time < 0 are extractions.
+struct TraceOp
+{
+    int event;
+    float time;
+};
+
+/**
+ * Record a trace of operations of fronts propagating in a size x size grid of nodes.
+ */
+vector<TraceOp> RecordTrace(int size, int n_beats, float bcl)
+{
+    const int n_nodes = size * size;
+    std::mt19937 rng(1);
+    std::uniform_real_distribution<float> cv(0.5, 0.7);
+    std::uniform_real_distribution<float> apd(220.0, 280.0);
+
+    // Reference queue to generate the trace
+    vector<Node> nodes(n_nodes);
+    CellEventQueue<Node> queue;
+    queue.Init(nodes, n_nodes);
+    vector<float> lat(n_nodes, -1000.0);
+    vector<TraceOp> trace;
+
+    auto insert = [&](int ev, float t) {
+        queue.GetEvent(ev / 2, CellEventType(ev % 2))->ChangeEvent(t);
+        queue.InsertCellEvent(queue.GetEvent(ev / 2, CellEventType(ev % 2)));
+        trace.push_back({ev, t});
+    };
+
+    for(int beat = 0; beat < n_beats; beat++)
+        insert(0, beat * bcl);
+
+    while(!queue.IsEmpty())
+    {
+        auto * ev = queue.GetFirstCell();
+        float t = ev->event_time;
+        int id = queue.GetIndex(ev) / 2;
+        queue.ExtractFirstCell();
+        trace.push_back({-1, -1.0});
+
+        // Only activations of excitable nodes propagate
+        if(ev->event_type == CellEventType::DEACTIVATION || t < lat[id] + 280.0)
+            continue;
+        lat[id] = t;
+        insert(2 * id + 1, t + apd(rng));
+        int x = id % size, y = id / size;
+        for(int dy = -1; dy <= 1; dy++)
+            for(int dx = -1; dx <= 1; dx++)
+            {
+                int nx = x + dx, ny = y + dy;
+                if((dx == 0 && dy == 0) || nx < 0 || ny < 0 || nx >= size || ny >= size)
+                    continue;
+                int neigh = ny * size + nx;
+                float t_neigh = t + 0.1 * std::sqrt(float(dx * dx + dy * dy)) / cv(rng);
+                auto * neigh_ev = queue.GetEvent(neigh, CellEventType::ACTIVATION);
+                bool queued = neigh_ev->position_in_tree >= 0;
+                if(t_neigh > lat[neigh] + 280.0 && (!queued || t_neigh < neigh_ev->event_time))
+                    insert(2 * neigh, t_neigh);
+            }
+    }
+
+    return trace;
+}
+
+/**
+ * Replay a trace in a queue.
+ * @return Elapsed time in seconds. The times of the extracted events are stored in extracted.
+ */
+double Replay(const vector<TraceOp> & trace, int n_nodes, EventQueueType type, vector<float> & extracted)
+{
+    vector<Node> nodes(n_nodes);
+    CellEventQueue<Node> queue(type);
+    queue.Init(nodes, n_nodes);
+    extracted.clear();
+    extracted.reserve(trace.size());
+
+    auto t0 = Clock::now();
+    for(const auto & op : trace)
+    {
+        if(op.event < 0)
+        {
+            extracted.push_back(queue.GetFirstCell()->event_time);
+            queue.ExtractFirstCell();
+        }
+        else
+        {
+            auto * ev = queue.GetEvent(op.event / 2, CellEventType(op.event % 2));
+            ev->ChangeEvent(op.time);
+            queue.InsertCellEvent(ev);
+        }
+    }
+    return std::chrono::duration<double>(Clock::now() - t0).count();
+}
+
+/**
+ * Simulate a slab paced from a corner.
+ * @return Elapsed time in seconds.
+ */
+double RunSlab(Tissue & tissue)
+{
+    std::vector<CellType> v_type(tissue.size(), 1);
+    vector<NodeParameters> v_np(1);
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv","restitutionModels/config_TenTuscher_CV.csv");
+    tissue.Init(v_type, v_np, {Eigen::Vector3f(1.0, 0.0, 0.0)});
+    tissue.SetTimer(SystemEventType::EXT_ACTIVATION, 400.0);
+
+    const float t_end = 2000.0;
+    size_t initial_node = tissue.GetIndex(2, 2, 2);
+    int beat = 0;
+    auto t0 = Clock::now();
+    while(tissue.GetTime() < t_end)
+    {
+        auto tick = tissue.RunUntil(t_end);
+        if(tick == SystemEventType::EXT_ACTIVATION)
+            tissue.ExternalActivation({initial_node}, tissue.GetTime(), ++beat);
+        else if(tick == SystemEventType::NO_EVENT)
+            break;
+    }
+    return std::chrono::duration<double>(Clock::now() - t0).count();
+}
+
+int main(int argc, char **argv)
+{
+    const int size = argc > 1 ? std::stoi(argv[1]) : 300;
+    bool ok = true;
+
+    // Trace replay
+    vector<TraceOp> trace = RecordTrace(size, 4, 400.0);
+    vector<float> extracted_heap, extracted_calendar;
+    double t_heap = Replay(trace, size * size, EventQueueType::HEAP, extracted_heap);
+    double t_calendar = Replay(trace, size * size, EventQueueType::CALENDAR, extracted_calendar);
+    ok = ok && extracted_heap == extracted_calendar;
+
+    std::cout << "Trace: " << trace.size() << " operations" << std::endl;
+    std::cout << "  Heap:     " << trace.size() / t_heap << " op/s" << std::endl;
+    std::cout << "  Calendar: " << trace.size() / t_calendar << " op/s" << std::endl;
+
+    // Simulation
+    Tissue tissue_heap(size / 2, size / 2, 6, 0.05, 0.05, 0.05, EventQueueType::HEAP);
+    Tissue tissue_calendar(size / 2, size / 2, 6, 0.05, 0.05, 0.05, EventQueueType::CALENDAR);
+    t_heap = RunSlab(tissue_heap);
+    t_calendar = RunSlab(tissue_calendar);
+    ok = ok && tissue_heap.GetNumEvents() == tissue_calendar.GetNumEvents() &&
+         tissue_heap.GetLAT() == tissue_calendar.GetLAT() && tissue_heap.GetAPD() == tissue_calendar.GetAPD();
+
+    std::cout << "Slab: " << tissue_heap.GetNumEvents() << " events" << std::endl;
+    std::cout << "  Heap:     " << tissue_heap.GetNumEvents() / t_heap << " events/s" << std::endl;
+    std::cout << "  Calendar: " << tissue_calendar.GetNumEvents() / t_calendar << " events/s" << std::endl;
+
+    std::cout << (ok ? "Both queues extract the events in the same order and give the same LAT and APD" : "ERROR: The queues extract the events in different order") << std::endl;
+
+    return ok ? 0 : 1;
+}
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+
+import arritmic3d as a3d
+from arritmic3d.arritmic3D import load_grid, create_tissue
+from arritmic3d.arr3D_activations import schedule_activation
+from arritmic3d.arr3D_config import make_default_config, resolve_models_in_parameters
+
+# Events per second of the native event loop on slab cases.
+# No output is written, so the time is spent processing node events.
+
+CASES = {
+    "s1s2": dict(nnodes=(15, 15, 5), spacing=(0.4, 0.4, 0.4),
+                 region='{"shape" : "square", "cx" : 3.0, "cy" : 3.0, "r1" : 2.0, "r2" : 2.0, "restitution_model" : 5}',
+                 protocol=[{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 100, "N_STIMS_PACING": [6, 3], "BCL": [600, 400]}],
+                 duration=5000),
+    "reentry": dict(nnodes=(70, 70, 2), spacing=(0.1, 0.1, 0.1),
+                    region='{"shape" : "square", "cx" : 3.5, "cy" : 3.5, "r1" : 2.0, "r2" : 2.0, "restitution_model" : 5}',
+                    protocol=[{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 0, "N_STIMS_PACING": [7, 1], "BCL": [500, 350]}],
+                    duration=3700, extra={"ELECTROTONIC_EFFECT": 0.0, "CV_MEMORY_COEFF": 0.05, "APD_MEMORY_COEFF": 0.0}),
+    "large": dict(nnodes=(150, 150, 6), spacing=(0.05, 0.05, 0.05),
+                  region='{"shape" : "square", "cx" : 3.75, "cy" : 3.75, "r1" : 2.0, "r2" : 2.0, "restitution_model" : 5}',
+                  protocol=[{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 0, "N_STIMS_PACING": [3], "BCL": [500]}],
+                  duration=1500),
+}
+
+
+def run_case(name, nnodes, spacing, region, protocol, duration, extra=None, out_dir="out_benchmark"):
+    case_dir = os.path.join(out_dir, name)
+    os.makedirs(case_dir, exist_ok=True)
+    slab = os.path.join(case_dir, "slab.vtk")
+    a3d.build_slab(args_list=[slab, "--nnodes", *map(str, nnodes), "--spacing", *map(str, spacing),
+                              "--region-by-side", "south", "1", "--field", "restitution_model", "2",
+                              "--region", region], save=True)
+
+    cfg = make_default_config() | {"VTK_INPUT_FILE": slab, "APD_MODEL": "TenTuscher", "CV_MODEL": "TenTuscher",
+                                   "PROTOCOL": protocol, "SIMULATION_DURATION": duration} | (extra or {})
+    resolve_models_in_parameters(cfg)
+
+    grid = load_grid(slab)
+    tissue = create_tissue(grid, cfg)
+    schedule_activation(cfg, grid, tissue)
+
+    # The stimuli are applied by the tissue, so the whole simulation is a single call
+    t0 = time.perf_counter()
+    tissue.RunUntil(duration, [])
+    elapsed = time.perf_counter() - t0
+
+    return tissue.size(), tissue.GetNumEvents(), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the number of node events processed per second.")
+    parser.add_argument("cases", nargs="*", default=list(CASES), help="Cases to run: " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each case. The best one is reported.")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.cases:
+        best = None
+        for _ in range(args.repeat):
+            n_nodes, n_events, elapsed = run_case(name, **CASES[name])
+            if best is None or elapsed < best[2]:
+                best = (n_nodes, n_events, elapsed)
+        results.append((name, *best))
+
+    print(f"\n{'case':<10}{'nodes':>10}{'events':>12}{'time (s)':>10}{'events/s':>14}")
+    for name, n_nodes, n_events, elapsed in results:
+        print(f"{name:<10}{n_nodes:>10}{n_events:>12}{elapsed:>10.3f}{n_events / elapsed:>14.0f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import json
+import os
+import time
+
+import numpy as np
+import arritmic3d as a3d
+from arritmic3d.arritmic3D import create_tissue
+from arritmic3d.arr3D_activations import parse_protocol_entry, resolve_activation_region, schedule_activation
+from arritmic3d.arr3D_config import make_default_config, resolve_models_in_parameters
+
+# Slab with a PROTOCOL whose first times are read from a file, and ACTIVATE_NODES given by a region
+# and by a file of [node, time, beat]. The protocol is resolved to numpy arrays and scheduled as
+# stimuli of the tissue. The results must be the same as activating the nodes of each time from
+# Python with the bulk ExternalActivation, and the resolution of a large region must be fast.
+
+CASE_DIR = "out_test/activations"
+FIELDS = ["State", "LAT", "APD", "Beat"]
+T_END = 1800.0
+LARGE_REGION = (200, 200, 25)
+LARGE_SETUP_TIME = 2.0  # s
+
+
+def build_case():
+    os.makedirs(CASE_DIR, exist_ok=True)
+    grid = a3d.build_slab(args_list=[
+        os.path.join(CASE_DIR, "slab.vtk"),
+        "--nnodes", "30", "30", "3",
+        "--spacing", "0.1", "0.1", "0.1",
+        "--region-by-side", "south", "1",
+        "--field", "restitution_model", "2",
+    ], save=False)
+    south = np.flatnonzero(np.asarray(grid.point_data["activation_region"]) == 1)
+    # Purkinje-like first times, later towards the east of the slab
+    first_times_file = os.path.join(CASE_DIR, "first_times.json")
+    with open(first_times_file, "w") as f:
+        json.dump([10.0 + 0.2 * (node % 30) for node in south.tolist()], f)
+    # Single activations of a corner, with their own beats
+    corner = [int(grid.find_closest_point((2.5, 2.5, 0.1)))]
+    nodes_file = os.path.join(CASE_DIR, "activate_nodes.json")
+    with open(nodes_file, "w") as f:
+        json.dump([[corner[0], 1500.0, 20], [corner[0], 1700.0, 21]], f)
+
+    cfg = make_default_config() | {
+        "APD_MODEL": "TenTuscher", "CV_MODEL": "TenTuscher",
+        "PROTOCOL": [{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": {"file": first_times_file},
+                      "N_STIMS_PACING": [2, 1], "BCL": [450, 350]}],
+        "ACTIVATE_NODES": [{"ACTIVATION_REGION": corner, "ACTIVATION_TIMES": [[1200.0, 10], [1350.0, 11]]},
+                           {"file": nodes_file}],
+    }
+    resolve_models_in_parameters(cfg)
+    return grid, cfg
+
+
+def expected_activations(grid, cfg):
+    """ Activations of the configuration as arrays of nodes, times and beats, expanded without the tissue. """
+    nodes, first_times, bcl, n_stims = parse_protocol_entry(cfg["PROTOCOL"][0], grid)
+    offsets = np.array([0.0, bcl[0], bcl[0] + bcl[1]])
+    protocol = (np.repeat(nodes, 3), (first_times[:, None] + offsets).reshape(-1), np.tile([1, 2, 3], nodes.size))
+    corner = cfg["ACTIVATE_NODES"][0]["ACTIVATION_REGION"] * 4
+    single = (np.array(corner), np.array([1200.0, 1350.0, 1500.0, 1700.0]), np.array([10, 11, 20, 21]))
+    return [np.concatenate(arrays) for arrays in zip(protocol, single)]
+
+
+def run_python(grid, cfg):
+    """ Activate the nodes of each time on EXT_ACTIVATION events, grouped with numpy. """
+    tissue = create_tissue(grid, cfg)
+    nodes, times, beats = expected_activations(grid, cfg)
+    times = times.astype(np.float32)
+    order = np.argsort(times, kind="stable")
+    event_times, starts = np.unique(times[order], return_index=True)
+    groups = np.split(order, starts[1:])
+    for t in event_times:
+        tissue.SetSystemEvent(a3d.SystemEventType.EXT_ACTIVATION, t)
+    group = 0
+    while tissue.GetTime() < T_END:
+        tick = tissue.RunUntil(T_END, [a3d.SystemEventType.EXT_ACTIVATION])
+        if tick == a3d.SystemEventType.EXT_ACTIVATION:
+            selected = groups[group]
+            tissue.ExternalActivation(nodes[selected], times[selected], beats[selected])
+            group += 1
+        elif tick == a3d.SystemEventType.NO_EVENT:
+            break
+    assert group == len(groups), f"{group} of {len(groups)} activation times processed"
+    return tissue.GetFields(FIELDS)
+
+
+def main():
+    grid, cfg = build_case()
+    tissue = create_tissue(grid, cfg)
+    schedule_activation(cfg, grid, tissue)
+    tissue.RunUntil(T_END, [])
+    fields = tissue.GetFields(FIELDS)
+    reference = run_python(grid, cfg)
+    for name in FIELDS:
+        assert np.array_equal(fields[name], reference[name]), f"{name} differs from the Python activations"
+    assert fields["Beat"].max() == 21, f"Last beat {fields['Beat'].max()}"
+    print(f"{int((fields['LAT'] > 0).sum())} activated nodes, beats {sorted(set(fields['Beat'].tolist()))}")
+
+    # Resolution of a large region and scheduling of its stimuli
+    size_x, size_y, size_z = LARGE_REGION
+    large = a3d.CardiacTissue(size_x, size_y, size_z, 0.1, 0.1, 0.1)
+    large.InitModels(cfg["APD_MODEL_CONFIG_PATH"], cfg["CV_MODEL_CONFIG_PATH"])
+    large.SetInitialAPD(cfg["INITIAL_APD"])
+    large.InitPy([1] * large.size(), {}, [[0.0, 0.0, 0.0]])
+    region = np.zeros(large.size(), dtype=np.int32)
+    region[large.size() // 2:] = 1
+
+    class Grid:
+        point_data = {"activation_region": region}
+
+    t0 = time.perf_counter()
+    protocol = {"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 0.0, "N_STIMS_PACING": [10, 5], "BCL": [500, 300]}
+    nodes = resolve_activation_region(1, Grid)
+    schedule_activation({"PROTOCOL": [protocol]}, Grid, large)
+    elapsed = time.perf_counter() - t0
+    print(f"{nodes.size} stimulated nodes scheduled in {elapsed:.2f} s")
+    assert large.GetNextStimulusTime() == 0.0
+    assert elapsed < LARGE_SETUP_TIME, "Protocol setup is too slow"
+    print("Activations match the Python schedule")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+/**
+ * ARRITMIC3D
+ * Test the precomputed anisotropy table against computing the conduction velocity on each activation
+ *
+ * (C) CoMMLab-UV 2026
+ * */
+#include <iostream>
+#include <string>
+#include "../src/node.h"
+#include "../src/tissue.h"
+#include "../src/action_potential_rs.h"
+#include "../src/conduction_velocity.h"
+
+enum CellTypeVentricle { HEALTHY_ENDO = 1, HEALTHY_MID, HEALTHY_EPI, BZ_ENDO, BZ_MID, BZ_EPI };
+
+using Tissue = CardiacTissue<ActionPotentialRestSurface,ConductionVelocity>;
+
+void RunTissue(Tissue & tissue, bool use_table)
+{
+    std::vector<CellType> v_type(tissue.size(), HEALTHY_ENDO);
+    NodeParameters np;
+    vector<NodeParameters> v_np(tissue.size(), np);
+    Eigen::Vector3f fiber_dir(0.6, 0.48, 0.64);
+
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv","restitutionModels/config_TenTuscher_CV.csv");
+    tissue.Init(v_type, v_np, {fiber_dir});
+    tissue.SetAnisotropyTable(use_table);
+    tissue.SetTimer(SystemEventType::EXT_ACTIVATION, 300.0);
+
+    const float t_end = 1500.0;
+    size_t initial_node = tissue.GetIndex(10,10,3);
+    int beat = 0;
+    while(tissue.GetTime() < t_end)
+    {
+        auto tick = tissue.RunUntil(t_end);
+        if(tick == SystemEventType::EXT_ACTIVATION)
+            tissue.ExternalActivation({initial_node}, tissue.GetTime(), ++beat);
+        else if(tick == SystemEventType::NO_EVENT)
+            break;
+    }
+}
+
+int main(int argc, char **argv)
+{
+    Tissue tissue_a(20, 20, 7, 0.1, 0.1, 0.1);
+    Tissue tissue_b(20, 20, 7, 0.1, 0.1, 0.1);
+    RunTissue(tissue_a, false);
+    RunTissue(tissue_b, true);
+
+    bool ok = tissue_a.GetTime() == tissue_b.GetTime() && tissue_a.GetNumEvents() == tissue_b.GetNumEvents() &&
+              tissue_a.GetLAT() == tissue_b.GetLAT() && tissue_a.GetCV() == tissue_b.GetCV() &&
+              tissue_a.GetAPD() == tissue_b.GetAPD();
+
+    std::cout << "Time: " << tissue_b.GetTime() << " Events: " << tissue_b.GetNumEvents() << std::endl;
+    std::cout << (ok ? "Anisotropy table matches direct computation" : "ERROR: Anisotropy table differs from direct computation") << std::endl;
+
+    return ok ? 0 : 1;
+}
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+import numpy as np
+import pyvista as pv
+import arritmic3d
+from arritmic3d.arr3D_output import save_beat_maps
+
+# Slab paced from one corner, recording the activation maps of some beats.
+# At the end of each beat, before the next stimulus, the maps recorded for it must match
+# the LAT, APD and CV of the tissue in the nodes activated in that beat. In the middle of the
+# last recorded beat, only the maps of the previous beats are saved as finished.
+
+HEALTHY_ENDO = 1
+SIZE = (40, 40, 4)
+SPACING = 0.1
+CL = 350.0
+N_BEATS = 5
+RECORDED_BEATS = (2, 4)
+
+
+def main():
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    tissue = arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING)
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy([HEALTHY_ENDO] * n_nodes, {"APD_MEMORY_COEFF": [0.2] * n_nodes})
+    tissue.SetBeatRecorder(True, *RECORDED_BEATS)
+    tissue.SetTimer(arritmic3d.SystemEventType.EXT_ACTIVATION, CL)
+
+    grid = pv.ImageData(dimensions=SIZE, spacing=(SPACING,) * 3)
+    grid.point_data["restitution_model"] = np.full(n_nodes, HEALTHY_ENDO)
+    out_dir = tempfile.mkdtemp()
+    base_name = os.path.join(out_dir, "slab")
+    lats = {}
+
+    initial_node = tissue.GetIndex(2, 2, 1)
+    beat = 0
+    while beat < N_BEATS:
+        tick = tissue.RunUntil(N_BEATS * CL, [arritmic3d.SystemEventType.EXT_ACTIVATION])
+        if tick != arritmic3d.SystemEventType.EXT_ACTIVATION:
+            break
+        if RECORDED_BEATS[0] <= beat <= RECORDED_BEATS[1]:
+            maps = tissue.GetBeatMaps(beat)
+            activated = tissue.GetBeat() == beat
+            assert np.array_equal(~np.isnan(maps["LAT"]), activated), f"Beat {beat}: different activated nodes"
+            assert np.array_equal(maps["LAT"][activated], tissue.GetLAT()[activated]), f"Beat {beat}: LAT differs"
+            assert np.array_equal(maps["APD"][activated], tissue.GetAPD()[activated]), f"Beat {beat}: APD differs"
+            assert np.array_equal(maps["CV"][activated], tissue.GetCV()[activated]), f"Beat {beat}: CV differs"
+            lats[beat] = maps["LAT"]
+            print(f"Beat {beat}: {activated.sum()} nodes, LAT {np.nanmin(maps['LAT']):.1f}-{np.nanmax(maps['LAT']):.1f} ms")
+        beat += 1
+        tissue.ExternalActivation([initial_node], tissue.GetTime(), beat)
+        if beat == RECORDED_BEATS[1]:
+            tissue.RunUntil(tissue.GetTime() + CL / 4, [])
+            saved = save_beat_maps(tissue, grid, base_name, finished_only=True)
+            expected = [f"{base_name}_beat_{b:03d}.vtu" for b in range(RECORDED_BEATS[0], beat)]
+            assert saved == expected, f"Saved {saved} in beat {beat}"
+
+    recorded = tissue.GetRecordedBeats()
+    assert recorded == [RECORDED_BEATS[1]], f"Recorded beats {recorded}"
+    for b in range(RECORDED_BEATS[0], RECORDED_BEATS[1]):
+        lat = pv.read(f"{base_name}_beat_{b:03d}.vtu").point_data["LAT"]
+        assert np.array_equal(lat, lats[b], equal_nan=True), f"Beat {b}: saved LAT differs"
+    print("Beat maps match the tissue")
+
+
+if __name__ == "__main__":
+    main()
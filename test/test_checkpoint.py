@@ -0,0 +1,124 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+import pyvista as pv
+import arritmic3d as a3d
+from arritmic3d.arr3D_checkpoint import list_checkpoints
+
+# Slab with sensors, pseudo-ECG and beat maps, run with the driver in one go and interrupted
+# and resumed from its last checkpoint. The outputs of both runs must be the same, with
+# the XDMF and the delta-encoded series.
+
+CASE_DIR = "out_test/checkpoint"
+DURATION = 2000
+INTERRUPTED_AT = 1150
+CHECKPOINT_PERIOD = 300
+CHECKPOINT_KEEP = 2
+FIELDS = ["State", "APD", "CV", "LAT", "Beat"]
+
+
+def build_case():
+    slab_path = os.path.join(CASE_DIR, "input_data", "slab.vtk")
+    os.makedirs(os.path.dirname(slab_path), exist_ok=True)
+    a3d.build_slab(args_list=[
+        slab_path,
+        "--nnodes", "20", "20", "3",
+        "--spacing", "0.4", "0.4", "0.4",
+        "--region-by-side", "south", "1",
+        "--field", "restitution_model", "2",
+        "--field", "sensor", "0",
+        "--region", '{"shape" : "square", "cx" : 4.0, "cy" : 4.0, "r1" : 0.5, "r2" : 0.5, "sensor" : 1}',
+        "--region", '{"shape" : "square", "cx" : 5.0, "cy" : 5.0, "r1" : 1.5, "r2" : 1.5, "restitution_model" : 5}',
+    ], save=True)
+    return {
+        "VTK_INPUT_FILE": slab_path,
+        "APD_MODEL": "TenTuscher",
+        "CV_MODEL": "TenTuscher",
+        "SIMULATION_DURATION": DURATION,
+        "VTK_OUTPUT_PERIOD": 10,
+        "VTK_OUTPUT_FIELDS": FIELDS,
+        "VTK_OUTPUT_KEYFRAME_PERIOD": 8,
+        "BEAT_MAPS_SAVE": True,
+        "ECG_ELECTRODES": [[4.0, 10.0, 0.4]],
+        "PROTOCOL": [{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 10, "N_STIMS_PACING": [3, 2], "BCL": [500, 330]}],
+    }
+
+
+def read_series(case_dir, out_format):
+    if out_format == "xdmf":
+        xdmf_file = os.path.join(case_dir, "slab.xdmf")
+        fields = {name: np.array(a3d.load_xdmf_field(xdmf_file, name)[1]) for name in FIELDS}
+        return a3d.load_xdmf_field(xdmf_file, FIELDS[0])[0], fields
+    reader = a3d.DeltaSeriesReader(os.path.join(case_dir, "slab.delta.json"))
+    frames = [reader.get_frame(i) for i in range(len(reader))]
+    return reader.times, {name: np.array([frame[name] for frame in frames]) for name in FIELDS}
+
+
+def compare_outputs(case_a, case_b, out_format):
+    times_a, series_a = read_series(case_a, out_format)
+    times_b, series_b = read_series(case_b, out_format)
+    assert np.array_equal(times_a, times_b), "Different output times"
+    for name in FIELDS:
+        assert np.array_equal(series_a[name], series_b[name]), f"Field {name} differs"
+
+    for name in ["ecg.csv"] + [os.path.join("sensors", os.path.basename(f)) for f in glob.glob(os.path.join(case_a, "sensors", "*.csv"))]:
+        with open(os.path.join(case_a, name)) as fa, open(os.path.join(case_b, name)) as fb:
+            assert fa.read() == fb.read(), f"{name} differs"
+    assert os.listdir(os.path.join(case_a, "sensors")), "No sensor output"
+
+    beat_files = sorted(os.path.basename(f) for f in glob.glob(os.path.join(case_a, "*_beat_*.vtu")))
+    assert beat_files == sorted(os.path.basename(f) for f in glob.glob(os.path.join(case_b, "*_beat_*.vtu")))
+    for name in beat_files:
+        grid_a, grid_b = pv.read(os.path.join(case_a, name)), pv.read(os.path.join(case_b, name))
+        for field in ("LAT", "APD", "DI", "CV"):
+            assert np.array_equal(grid_a.point_data[field], grid_b.point_data[field], equal_nan=True), f"{name} differs"
+    return len(times_a)
+
+
+def main():
+    shutil.rmtree(CASE_DIR, ignore_errors=True)
+    config = build_case()
+    for out_format in ("xdmf", "delta"):
+        full_dir = os.path.join(CASE_DIR, out_format + "_full")
+        resumed_dir = os.path.join(CASE_DIR, out_format + "_resumed")
+        config["VTK_OUTPUT_FORMAT"] = out_format
+        os.makedirs(full_dir)
+        os.makedirs(resumed_dir)
+        a3d.arritmic3d(full_dir, config=dict(config))
+
+        # The first run stops after some checkpoints, as if it had been killed
+        a3d.arritmic3d(resumed_dir, config=dict(config, SIMULATION_DURATION=INTERRUPTED_AT,
+                                                CHECKPOINT_PERIOD=CHECKPOINT_PERIOD, CHECKPOINT_KEEP=CHECKPOINT_KEEP))
+        checkpoints = list_checkpoints(resumed_dir)
+        assert [t for t, _ in checkpoints] == [600.0, 900.0], f"Checkpoints {checkpoints}"
+        a3d.arritmic3d(resumed_dir, config=dict(config, CHECKPOINT_PERIOD=CHECKPOINT_PERIOD,
+                                                CHECKPOINT_KEEP=CHECKPOINT_KEEP), resume=True)
+        assert len(list_checkpoints(resumed_dir)) == CHECKPOINT_KEEP
+
+        n_outputs = compare_outputs(full_dir, resumed_dir, out_format)
+        print(f"{out_format}: {n_outputs} outputs")
+
+    # A checkpoint saved with another version of the state file aborts the resumed run
+    # before the outputs are truncated
+    _, checkpoint_path = list_checkpoints(resumed_dir)[-1]
+    with open(os.path.join(checkpoint_path, "state.bin"), "r+b") as f:
+        f.seek(8)
+        f.write((0).to_bytes(4, "little"))
+    outputs = {name: open(name, "rb").read() for name in glob.glob(os.path.join(resumed_dir, "**", "*.*"), recursive=True)
+               if os.path.isfile(name) and "checkpoint" not in name}
+    try:
+        a3d.arritmic3d(resumed_dir, config=dict(config, CHECKPOINT_PERIOD=CHECKPOINT_PERIOD), resume=True)
+    except RuntimeError as e:
+        print(f"Resume from an old checkpoint: {e}")
+    else:
+        raise AssertionError("Resumed from a checkpoint with another version")
+    for name, data in outputs.items():
+        if not name.endswith("arr3D_config_run.json"):
+            assert open(name, "rb").read() == data, f"{name} changed by the failed resume"
+    print("Resumed simulations match the uninterrupted ones")
+
+
+if __name__ == "__main__":
+    main()
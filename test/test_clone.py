@@ -0,0 +1,60 @@
+import copy
+import numpy as np
+import arritmic3d
+
+# Anisotropic slab paced from one corner (S1) and cloned in the middle of the last beat.
+# Each clone receives a different S2. The original is run first with one of them and
+# deleted, and its clone must then give exactly the same fields, events and pseudo-ECG.
+
+HEALTHY_ENDO = 1
+SIZE = (40, 40, 4)
+SPACING = 0.1
+S1_CL = 350.0
+N_S1 = 3
+S2_INTERVALS = (260.0, 300.0)
+T_END = N_S1 * S1_CL + 500.0
+FIELDS = ["State", "LAT", "APD", "AP", "CV", "Beat"]
+
+
+def pace_s1():
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    tissue = arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING)
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy([HEALTHY_ENDO] * n_nodes, {"APD_MEMORY_COEFF": [0.2] * n_nodes}, [[1.0, 0.5, 0.0]])
+    nodes = np.arange(0, n_nodes, 7)
+    tissue.SetElectrogram(nodes, np.ones((len(nodes), 1), dtype=np.float32), 1.0)
+
+    corner = tissue.GetIndex(2, 2, 1)
+    for beat in range(N_S1):
+        tissue.ExternalActivation([corner], beat * S1_CL, beat)
+        tissue.RunUntil(beat * S1_CL + 100.0, [])
+    return tissue
+
+
+def run_s2(tissue, s2):
+    tissue.ExternalActivation([tissue.GetIndex(20, 20, 1)], (N_S1 - 1) * S1_CL + s2, N_S1)
+    tissue.RunUntil(T_END, [])
+    times, signals = tissue.GetElectrogram()
+    return tissue.GetFields(FIELDS), tissue.GetNumEvents(), signals
+
+
+def main():
+    tissue = pace_s1()
+    branches = [tissue.Clone(), copy.deepcopy(tissue)]
+    fields, n_events, signals = run_s2(tissue, S2_INTERVALS[-1])
+    del tissue
+
+    results = [run_s2(branch, s2) for branch, s2 in zip(branches, S2_INTERVALS)]
+    clone_fields, clone_events, clone_signals = results[-1]
+    for name in FIELDS:
+        assert np.array_equal(fields[name], clone_fields[name]), f"{name} differs from the clone"
+    assert n_events == clone_events, f"Events {n_events} != {clone_events}"
+    assert np.array_equal(signals, clone_signals), "Pseudo-ECG differs from the clone"
+    assert not np.array_equal(results[0][0]["LAT"], clone_fields["LAT"]), "The S2 of the clones had no effect"
+    print(f"{len(S2_INTERVALS)} clones, {n_events} events")
+    print("Clones match the original tissue")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+import arritmic3d
+
+# Slab paced from one corner, with the pseudo-ECG computed at two electrodes.
+# The native samples must match the sum of the lead field weights times the AP of the tissue
+# at the same times.
+
+HEALTHY_ENDO = 1
+SIZE = (40, 40, 4)
+SPACING = 0.1
+CL = 350.0
+N_BEATS = 3
+PERIOD = 5.0
+ELECTRODES = [[2.0, 2.0, 1.0], [-1.0, 0.5, 0.2]]
+
+
+def main():
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    tissue = arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING)
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy([HEALTHY_ENDO] * n_nodes, {"APD_MEMORY_COEFF": [0.2] * n_nodes})
+
+    live = np.ones(SIZE[::-1], dtype=bool)
+    nodes, weights = arritmic3d.lead_field(live, (SPACING,) * 3, ELECTRODES)
+    tissue.SetElectrogram(nodes, weights, PERIOD)
+    assert tissue.GetNumLeads() == len(ELECTRODES)
+
+    tissue.SetTimer(arritmic3d.SystemEventType.EXT_ACTIVATION, CL)
+    tissue.SetTimer(arritmic3d.SystemEventType.FILE_WRITE, PERIOD)
+    initial_node = tissue.GetIndex(2, 2, 1)
+    tissue.ExternalActivation([initial_node], tissue.GetTime(), 0)
+
+    expected = {}
+    beat = 0
+    while True:
+        tick = tissue.RunUntil(N_BEATS * CL)
+        if tick == arritmic3d.SystemEventType.FILE_WRITE:
+            expected[round(tissue.GetTime() / PERIOD)] = weights.T @ tissue.GetAP()[nodes]
+        elif tick == arritmic3d.SystemEventType.EXT_ACTIVATION:
+            beat += 1
+            tissue.ExternalActivation([initial_node], tissue.GetTime(), beat)
+        else:
+            break
+
+    times, signals = tissue.GetElectrogram()
+
+    # Invalid sampling settings are rejected and keep the current pseudo-ECG
+    for period, start_time in ((0.0, None), (-1.0, None), (PERIOD, tissue.GetTime() - 1.0)):
+        try:
+            tissue.SetElectrogram(nodes, weights, period, start_time)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"SetElectrogram accepted period {period} and start time {start_time}")
+    assert np.array_equal(tissue.GetElectrogram()[1], signals), "Invalid SetElectrogram changed the pseudo-ECG"
+
+    assert signals.shape == (len(times), len(ELECTRODES)), f"Shape {signals.shape}"
+    assert np.allclose(times, np.arange(len(times)) * PERIOD), "Wrong sampling times"
+    amplitude = np.abs(signals).max(axis=0)
+    assert np.all(amplitude > 0.0), "Empty pseudo-ECG"
+    for sample, value in expected.items():
+        if sample < len(times):
+            assert np.all(np.abs(signals[sample] - value) <= 1e-3 * amplitude), \
+                f"Sample at {times[sample]} ms: {signals[sample]} != {value}"
+    print(f"{len(times)} samples, amplitude {amplitude}")
+    print("Pseudo-ECG matches the action potentials of the tissue")
+
+
+if __name__ == "__main__":
+    main()
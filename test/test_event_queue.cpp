@@ -9,10 +9,44 @@
 #include "../src/node.h"
 #include "../src/cell_event_queue.h"
 #include "../src/tissue.h"
+#include "../src/action_potential_rs.h"
+#include "../src/conduction_velocity.h"
 
 class APM {};
 class CVM {};
 
+enum CellTypeVentricle { HEALTHY_ENDO = 1, HEALTHY_MID, HEALTHY_EPI, BZ_ENDO, BZ_MID, BZ_EPI };
+
+using Tissue = CardiacTissue<ActionPotentialRestSurface,ConductionVelocity>;
+
+/**
+ * Pace from a corner a slab with a border zone band, where many activations have the same time.
+ */
+void RunSlab(Tissue & tissue)
+{
+    std::vector<CellType> v_type(tissue.size(), HEALTHY_ENDO);
+    for(int z = 0; z < tissue.GetSizeZ(); z++)
+        for(int y = 0; y < tissue.GetSizeY(); y++)
+            v_type[tissue.GetIndex(15, y, z)] = BZ_ENDO;
+    vector<NodeParameters> v_np(1);
+    v_np[0].apd_memory_coeff = 0.2;
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv","restitutionModels/config_TenTuscher_CV.csv");
+    tissue.Init(v_type, v_np, {Eigen::Vector3f(1.0, 1.0, 0.0)});
+    tissue.SetTimer(SystemEventType::EXT_ACTIVATION, 350.0);
+
+    const float t_end = 1500.0;
+    size_t initial_node = tissue.GetIndex(3, 3, 3);
+    int beat = 0;
+    while(tissue.GetTime() < t_end)
+    {
+        auto tick = tissue.RunUntil(t_end);
+        if(tick == SystemEventType::EXT_ACTIVATION)
+            tissue.ExternalActivation({initial_node}, tissue.GetTime(), ++beat);
+        else if(tick == SystemEventType::NO_EVENT)
+            break;
+    }
+}
+
 int main(int argc, char **argv)
 {
     using Node = NodeT<APM, CVM>;
@@ -62,9 +96,9 @@ int main(int argc, char **argv)
     qq.InsertSystemEvent(1.0, SystemEventType::EXT_ACTIVATION, 0);
 
     // Save state
-    std::ofstream f("event_queue_state.bin", std::ios::binary);
+    StateWriter f(1);
     qq.SaveState(f, nodes);
-    f.close();
+    f.Write("event_queue_state.bin");
 
     while(not qq.IsEmpty())
     {
@@ -85,9 +119,8 @@ int main(int argc, char **argv)
     }
 
     // Load state
-    std::ifstream f_in("event_queue_state.bin",  std::ios::binary);
+    StateReader f_in("event_queue_state.bin");
     qq.LoadState(f_in, nodes);
-    f_in.close();
 
     std::cout << "After loading state:" << std::endl;
     while(not qq.IsEmpty())
@@ -108,5 +141,37 @@ int main(int argc, char **argv)
         std::cout << std::endl;
     }
 
-    return 0;
+    // Events with the same time are extracted by node, the activation first, with both queues
+    bool ok = true;
+    for(EventQueueType queue_type : {EventQueueType::HEAP, EventQueueType::CALENDAR})
+    {
+        CellEventQueue<Node> queue(queue_type);
+        queue.Init(nodes, nodes.size());
+        for(int i : {7, 2, 9, 4, 0})
+            for(CellEventType type : {CellEventType::DEACTIVATION, CellEventType::ACTIVATION})
+            {
+                ev = queue.GetEvent(i, type);
+                ev->ChangeEvent(i % 2 ? 3.0 : 5.0);
+                queue.InsertCellEvent(ev);
+            }
+        std::vector<size_t> extracted;
+        while(not queue.IsEmpty())
+        {
+            extracted.push_back(queue.GetIndex(queue.GetFirstCell()));
+            queue.ExtractFirstCell();
+        }
+        ok = ok && extracted == std::vector<size_t>{14, 15, 18, 19, 0, 1, 4, 5, 8, 9};
+    }
+    std::cout << (ok ? "Events with the same time extracted by node" : "ERROR: Events with the same time out of order") << std::endl;
+
+    // Both queues give the same simulation
+    Tissue tissue_heap(30, 30, 8, 0.1, 0.1, 0.1, EventQueueType::HEAP);
+    Tissue tissue_calendar(30, 30, 8, 0.1, 0.1, 0.1, EventQueueType::CALENDAR);
+    RunSlab(tissue_heap);
+    RunSlab(tissue_calendar);
+    bool same_slab = tissue_heap.GetNumEvents() == tissue_calendar.GetNumEvents() &&
+                     tissue_heap.GetLAT() == tissue_calendar.GetLAT() && tissue_heap.GetAPD() == tissue_calendar.GetAPD();
+    std::cout << (same_slab ? "Heap and calendar queues give the same LAT and APD" : "ERROR: Heap and calendar queues give different LAT or APD") << std::endl;
+
+    return ok && same_slab ? 0 : 1;
 }
@@ -0,0 +1,85 @@
+import glob
+import os
+import shutil
+
+import numpy as np
+import pyvista as pv
+import arritmic3d as a3d
+
+# Slab of 30x30x4 live nodes, padded with VOID layers, run with the driver saving the whole
+# tissue and, in a second run, the tissue decimated by VTK_OUTPUT_STRIDE together with the
+# region VTK_OUTPUT_ROI. The decimated output must start at the first live layer and keep the
+# last one along each axis, and both outputs must match the whole tissue at their nodes.
+
+CASE_DIR = "out_test/output_region"
+SIZE = (30, 30, 4)
+SPACING = 0.4
+STRIDE = [3, 3, 3]
+ROI = {"BOX": [[5, 8, 1], [12, 20, 3]]}
+FIELDS = ["State", "APD", "CV", "LAT", "Beat"]
+
+
+def build_case():
+    slab_path = os.path.join(CASE_DIR, "input_data", "slab.vtk")
+    os.makedirs(os.path.dirname(slab_path), exist_ok=True)
+    a3d.build_slab(args_list=[
+        slab_path,
+        "--nnodes", *map(str, SIZE),
+        "--spacing", *[str(SPACING)] * 3,
+        "--region-by-side", "south", "1",
+        "--field", "restitution_model", "1",
+    ], save=True)
+    return {
+        "VTK_INPUT_FILE": slab_path,
+        "APD_MODEL": "TenTuscher",
+        "CV_MODEL": "TenTuscher",
+        "SIMULATION_DURATION": 100,
+        "VTK_OUTPUT_PERIOD": 20,
+        "VTK_OUTPUT_FIELDS": FIELDS,
+        "PROTOCOL": [{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 10, "N_STIMS_PACING": [1], "BCL": [500]}],
+    }
+
+
+def point_values(mesh):
+    """ Field values of the points of a mesh, by the rounded coordinates of each point """
+    keys = [tuple(p) for p in np.round(np.asarray(mesh.points) / SPACING).astype(int)]
+    return {name: dict(zip(keys, np.asarray(mesh.point_data[name]))) for name in FIELDS}
+
+
+def main():
+    shutil.rmtree(CASE_DIR, ignore_errors=True)
+    config = build_case()
+    full_dir = os.path.join(CASE_DIR, "full")
+    region_dir = os.path.join(CASE_DIR, "region")
+    os.makedirs(full_dir)
+    os.makedirs(region_dir)
+    a3d.arritmic3d(full_dir, config=dict(config))
+    a3d.arritmic3d(region_dir, config=dict(config, VTK_OUTPUT_STRIDE=STRIDE, VTK_OUTPUT_ROI=ROI))
+
+    full_files = sorted(glob.glob(os.path.join(full_dir, "slab_[0-9]*.vtu")))
+    assert full_files, "No output"
+    origin = np.round(np.asarray(pv.read(full_files[0]).points).min(axis=0) / SPACING).astype(int)
+    for full_file in full_files:
+        name = os.path.basename(full_file)
+        full = point_values(pv.read(full_file))
+        decimated = pv.read(os.path.join(region_dir, name))
+        roi = pv.read(os.path.join(region_dir, name.replace("slab_", "slab_roi_")))
+
+        # Live nodes from the first to the last one, every STRIDE nodes, and the last one
+        indices = np.round(np.asarray(decimated.points) / SPACING).astype(int) - origin
+        for axis in range(3):
+            expected = sorted(set(range(0, SIZE[axis], STRIDE[axis])) | {SIZE[axis] - 1})
+            assert np.unique(indices[:, axis]).tolist() == expected, f"{name}: decimated axis {axis}"
+        # The box is given in indices of the padded grid
+        (i0, j0, k0), (i1, j1, k1) = ROI["BOX"]
+        assert roi.n_points == (i1 - i0 + 1) * (j1 - j0 + 1) * (k1 - k0 + 1), f"{name}: {roi.n_points} ROI nodes"
+
+        for mesh in (decimated, roi):
+            for field, values in point_values(mesh).items():
+                assert all(values[key] == full[field][key] for key in values), f"{name}: {field} differs"
+    print(f"{len(full_files)} outputs, {decimated.n_points} decimated and {roi.n_points} ROI nodes")
+    print("Decimated and ROI outputs match the whole tissue")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import sys
+import time
+
+import numpy as np
+import arritmic3d
+from arritmic3d.arr3D_partition import PartitionedTissue
+
+# Slab paced from one corner, simulated as a single tissue and split in several processes.
+# The LAT maps, the fields gathered in the middle of the run and the sensor records,
+# reassembled from the subdomains, must be identical. The border zone band at x = 20 crosses
+# the boundaries between the slabs.
+
+HEALTHY_ENDO = 1
+BZ_ENDO = 4
+SIZE = (40, 40, 24)
+SPACING = 0.1
+CL = 350.0
+DURATION = 1500.0
+SNAPSHOT_BEAT = 3
+FIELDS = ["State", "Beat", "LAT", "APD", "CV"]
+# Sums over the neighbours, which may receive the terms of the ghost nodes in another order
+ROUNDED_SENSOR_FIELDS = ["received_potential"]
+# Sensors in the middle of the slabs and next to their boundaries with 2 and 3 partitions
+SENSORS = [(20, 20, 4), (20, 20, 7), (20, 20, 8), (20, 20, 12), (30, 10, 15), (30, 10, 16)]
+
+
+def build_geometry():
+    """ Cell types, with a border zone band, and parameters of the slab. """
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    v_type = np.full(SIZE[::-1], HEALTHY_ENDO)
+    v_type[:, :, 20] = BZ_ENDO
+    sensor = np.zeros(SIZE[::-1])
+    for x, y, z in SENSORS:
+        sensor[z, y, x] = 1.0
+    parameters = {"APD_MEMORY_COEFF": [0.2] * n_nodes, "SENSOR": sensor.reshape(-1).tolist()}
+    fiber = [[1.0, 1.0, 0.0]]
+    return v_type.reshape(-1).tolist(), parameters, fiber
+
+
+def run(tissue, v_type, parameters, fiber):
+    """
+    Pace the tissue from a corner. Returns its final LAT map, the number of beats, the fields
+    at the beginning of beat SNAPSHOT_BEAT and the sensor records.
+    """
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy(v_type, parameters, fiber)
+    tissue.SetTimer(arritmic3d.SystemEventType.EXT_ACTIVATION, CL)
+
+    initial_node = tissue.GetIndex(3, 3, 3)
+    beat = 0
+    snapshot = None
+    while tissue.GetTime() < DURATION:
+        tick = tissue.RunUntil(DURATION, [arritmic3d.SystemEventType.EXT_ACTIVATION])
+        if tick == arritmic3d.SystemEventType.EXT_ACTIVATION:
+            beat += 1
+            if beat == SNAPSHOT_BEAT:
+                snapshot = tissue.GetFields(FIELDS)
+            tissue.ExternalActivation([initial_node], tissue.GetTime(), beat)
+        elif tick == arritmic3d.SystemEventType.NO_EVENT:
+            break
+    return tissue.GetLAT(), beat, snapshot, tissue.DrainSensorData()
+
+
+def main():
+    n_partitions = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    v_type, parameters, fiber = build_geometry()
+
+    t0 = time.perf_counter()
+    lat_a, beats_a, fields_a, sensors_a = run(arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING), v_type, parameters, fiber)
+    t_single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    tissue = PartitionedTissue(*SIZE, SPACING, SPACING, SPACING, n_partitions)
+    try:
+        lat_b, beats_b, fields_b, sensors_b = run(tissue, v_type, parameters, fiber)
+    finally:
+        tissue.close()
+    t_partitioned = time.perf_counter() - t0
+
+    print(f"1 process: {t_single:.2f} s  {n_partitions} processes: {t_partitioned:.2f} s", flush=True)
+    activated_a = lat_a > 0
+    activated_b = lat_b > 0
+    max_error = np.abs(lat_a - lat_b)[activated_a].max()
+    print(f"Beats: {beats_a} / {beats_b}  Activated nodes: {activated_a.sum()} / {activated_b.sum()}  Max LAT difference: {max_error:.3f} ms")
+
+    assert beats_a == beats_b, "Different number of beats"
+    assert np.array_equal(activated_a, activated_b), "Different activated nodes"
+    assert np.array_equal(lat_a, lat_b), "Partitioned LAT differs from the single tissue"
+
+    for name in FIELDS:
+        a, b = fields_a[name], fields_b[name]
+        assert np.array_equal(a, b), f"Field {name} differs at beat {SNAPSHOT_BEAT} by {np.abs(a - b).max()}"
+
+    # The records of each sensor, in time order
+    assert len(sensors_a) == len(sensors_b), f"Sensor records: {len(sensors_a)} / {len(sensors_b)}"
+    assert len(np.unique(sensors_a["node_id"])) == len(SENSORS), "Sensors without records"
+    sensors_a = sensors_a[np.lexsort((sensors_a["Time"], sensors_a["node_id"]))]
+    sensors_b = sensors_b[np.lexsort((sensors_b["Time"], sensors_b["node_id"]))]
+    for name in sensors_a.dtype.names:
+        a, b = sensors_a[name], sensors_b[name]
+        if name in ROUNDED_SENSOR_FIELDS:
+            assert np.allclose(a, b, rtol=1e-12, atol=1e-12), f"Sensor {name} differs by {np.abs(a - b).max()}"
+        else:
+            assert np.array_equal(a, b), f"Sensor {name} differs by {np.abs(a - b).max()}"
+    print(f"Fields at beat {SNAPSHOT_BEAT} and {len(sensors_a)} sensor records match")
+    print("Partitioned results match the single tissue")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+/**
+ * ARRITMIC3D
+ * Test RunUntil against a loop of update calls
+ *
+ * (C) CoMMLab-UV 2026
+ * */
+#include <iostream>
+#include <string>
+#include "../src/node.h"
+#include "../src/tissue.h"
+#include "../src/action_potential_rs.h"
+#include "../src/conduction_velocity.h"
+
+enum CellTypeVentricle { HEALTHY_ENDO = 1, HEALTHY_MID, HEALTHY_EPI, BZ_ENDO, BZ_MID, BZ_EPI };
+
+using Tissue = CardiacTissue<ActionPotentialRestSurface,ConductionVelocity>;
+
+void InitTissue(Tissue & tissue)
+{
+    std::vector<CellType> v_type(tissue.size(), HEALTHY_ENDO);
+    NodeParameters np;
+    vector<NodeParameters> v_np(tissue.size(), np);
+    Eigen::Vector3f fiber_dir(1.0, 0.0, 0.0);
+
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv","restitutionModels/config_TenTuscher_CV.csv");
+    tissue.Init(v_type, v_np, {fiber_dir});
+    tissue.SetTimer(SystemEventType::FILE_WRITE, 20.0);
+    tissue.SetTimer(SystemEventType::EXT_ACTIVATION, 300.0);
+}
+
+int main(int argc, char **argv)
+{
+    const float t_end = 2000.0;
+    Tissue tissue_a(20, 12, 5, 0.1, 0.1, 0.1);
+    Tissue tissue_b(20, 12, 5, 0.1, 0.1, 0.1);
+    InitTissue(tissue_a);
+    InitTissue(tissue_b);
+    size_t initial_node = tissue_a.GetIndex(2,2,2);
+
+    // Reference: one update call per event
+    int beat_a = 0, writes_a = 0;
+    while(tissue_a.GetTime() < t_end)
+    {
+        auto tick = tissue_a.update();
+        if(tick == SystemEventType::EXT_ACTIVATION)
+            tissue_a.ExternalActivation({initial_node}, tissue_a.GetTime(), ++beat_a);
+        else if(tick == SystemEventType::FILE_WRITE)
+            writes_a++;
+    }
+
+    // Native loop: control returns only for the requested system events
+    int beat_b = 0, writes_b = 0;
+    while(tissue_b.GetTime() < t_end)
+    {
+        auto tick = tissue_b.RunUntil(t_end);
+        if(tick == SystemEventType::EXT_ACTIVATION)
+            tissue_b.ExternalActivation({initial_node}, tissue_b.GetTime(), ++beat_b);
+        else if(tick == SystemEventType::FILE_WRITE)
+            writes_b++;
+        else if(tick == SystemEventType::NO_EVENT)
+            break;
+    }
+
+    bool ok = tissue_a.GetTime() == tissue_b.GetTime() && beat_a == beat_b && writes_a == writes_b &&
+              tissue_a.GetLAT() == tissue_b.GetLAT() && tissue_a.GetAPD() == tissue_b.GetAPD() &&
+              tissue_a.GetStates() == tissue_b.GetStates();
+
+    std::cout << "Time: " << tissue_b.GetTime() << " Beats: " << beat_b << " File writes: " << writes_b << std::endl;
+    std::cout << (ok ? "RunUntil matches update loop" : "ERROR: RunUntil differs from update loop") << std::endl;
+
+    return ok ? 0 : 1;
+}
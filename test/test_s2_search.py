@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import arritmic3d as a3d
+from arritmic3d.arritmic3D import create_tissue, load_grid
+from arritmic3d.arr3D_activations import schedule_activation
+from arritmic3d.arr3D_config import make_default_config, resolve_models_in_parameters
+from arritmic3d.arr3D_search import main as search_s2_main
+
+# Slab with a border zone paced at 420 ms and followed by S2 and S3 at the same coupling
+# interval, the case of the manual tries of test_reentry.py ("319, block before reentry. 322
+# late for reentry"). The search is run as a bisection in one process and with a pool of
+# workers from the command line. The thresholds of both must agree, and the outcome of each
+# candidate, evaluated on a clone of the paced tissue, must be the same as pacing a new
+# tissue from the beginning with the extrastimuli.
+
+CASE_DIR = "out_test/s2_search"
+S1_BCL = 420
+N_S1 = 8
+N_STIMS = 2
+CI_RANGE = [280.0, 420.0]
+TOLERANCE = 1.0
+OBSERVATION_TIME = 1500.0
+SAMPLE_PERIOD = 10.0
+
+
+def build_case():
+    slab_path = os.path.join(CASE_DIR, "input_data", "slab.vtk")
+    os.makedirs(os.path.dirname(slab_path), exist_ok=True)
+    a3d.build_slab(args_list=[
+        slab_path,
+        "--nnodes", "60", "60", "2",
+        "--spacing", "0.3", "0.3", "0.3",
+        "--region-by-side", "south", "1",
+        "--field", "restitution_model", "2",
+        "--region", '{"shape" : "square", "cx" : 9.0, "cy" : 9.0, "r1" : 6.0, "r2" : 6.0, "restitution_model" : 5}',
+    ], save=True)
+    return make_default_config() | {
+        "VTK_INPUT_FILE": os.path.abspath(slab_path),
+        "APD_MODEL": "TenTuscher",
+        "CV_MODEL": "TenTuscher",
+        "ELECTROTONIC_EFFECT": 0.0,
+        "CV_MEMORY_COEFF": 0.05,
+        "CORRECTION_FACTOR_CV": 0.9,
+        "APD_MEMORY_COEFF": 0.0,
+        "PROTOCOL": [{"ACTIVATION_REGION": 1, "FIRST_ACTIVATION_TIME": 0, "N_STIMS_PACING": [N_S1], "BCL": [S1_BCL]}],
+        "S2_SEARCH": {"CI_RANGE": CI_RANGE, "N_STIMS": N_STIMS, "TOLERANCE": TOLERANCE,
+                      "OBSERVATION_TIME": OBSERVATION_TIME},
+    }
+
+
+def paced_from_start(cfg, ci):
+    """ Activations of each node after the S2 of a new tissue paced with the S1 beats and the extrastimuli. """
+    grid = load_grid(cfg["VTK_INPUT_FILE"])
+    tissue = create_tissue(grid, dict(cfg))
+    schedule_activation(cfg, grid, tissue)
+    region = np.flatnonzero(np.asarray(grid.point_data["activation_region"]) == 1)
+    times = (N_S1 - 1) * S1_BCL + ci * np.arange(1, N_STIMS + 1)
+    tissue.AddStimuli(np.tile(region, N_STIMS), np.repeat(times, region.size), np.repeat(np.arange(N_STIMS) + N_S1 + 1, region.size))
+    lat = tissue.GetLAT()
+    n_activations = np.zeros(lat.size, dtype=np.int32)
+    for t in np.arange(SAMPLE_PERIOD, times[-1] + OBSERVATION_TIME + SAMPLE_PERIOD, SAMPLE_PERIOD):
+        tissue.RunUntil(t, [])
+        new_lat = tissue.GetLAT()
+        n_activations += (new_lat != lat) & (new_lat >= np.float32(times[0]))
+        lat = new_lat
+    observed = np.asarray(grid.point_data["restitution_model"]) > 0
+    observed[region] = False
+    return np.count_nonzero(n_activations[observed] >= N_STIMS) / np.count_nonzero(observed), int(n_activations.max())
+
+
+def check_report(report):
+    candidates = report["CANDIDATES"]
+    assert report["TIMING"]["N_CANDIDATES"] == len(candidates)
+    for name in ("BLOCK", "PROPAGATION"):
+        lo, hi = report["THRESHOLDS"][name]
+        assert lo is not None and hi - lo <= TOLERANCE, f"{name} threshold {lo} - {hi}"
+    assert report["THRESHOLDS"]["BLOCK"][1] <= report["THRESHOLDS"]["PROPAGATION"][1]
+
+
+def main():
+    shutil.rmtree(CASE_DIR, ignore_errors=True)
+    cfg = build_case()
+    resolve_models_in_parameters(cfg)
+
+    bisection = a3d.search_s2(os.path.join(CASE_DIR, "bisection"), dict(cfg, S2_SEARCH=dict(cfg["S2_SEARCH"], N_WORKERS=1)))
+    check_report(bisection)
+    assert bisection["TIMING"]["N_WORKERS"] == 1
+
+    # The same search from the command line, with a pool of workers
+    pool_dir = os.path.join(CASE_DIR, "pool")
+    os.makedirs(pool_dir)
+    with open(os.path.join(pool_dir, "arr3D_config.json"), "w") as f:
+        json.dump(cfg, f)
+    search_s2_main([pool_dir, "--workers", "3"])
+    with open(os.path.join(pool_dir, "s2_search.json")) as f:
+        pool = json.load(f)
+    check_report(pool)
+    assert pool["TIMING"]["N_WORKERS"] == 3
+    for name in ("BLOCK", "PROPAGATION"):
+        (lo_a, hi_a), (lo_b, hi_b) = bisection["THRESHOLDS"][name], pool["THRESHOLDS"][name]
+        assert lo_a < hi_b and lo_b < hi_a, f"{name} thresholds do not overlap"
+
+    # Reentry after the S3 at 319 ms, between the block and the late S3 of test_reentry.py
+    reentry = bisection["THRESHOLDS"]["REENTRY"]
+    assert reentry is not None and 319.0 <= reentry[0] <= reentry[1] < 322.0, f"Reentry window {reentry}"
+
+    # Candidates at both sides of each threshold, evaluated on a new tissue
+    ci_values = {ci for bracket in bisection["THRESHOLDS"].values() for ci in bracket}
+    for r in bisection["CANDIDATES"]:
+        if r["CI"] in ci_values:
+            activated, max_activations = paced_from_start(cfg, r["CI"])
+            assert np.isclose(activated, r["ACTIVATED"]) and max_activations == r["MAX_ACTIVATIONS"], \
+                f"S2 at {r['CI']} differs from pacing a new tissue"
+    print(f"Block {bisection['THRESHOLDS']['BLOCK']}, propagation {bisection['THRESHOLDS']['PROPAGATION']}, reentry {reentry}")
+    print("The S2 searches agree")
+
+
+if __name__ == "__main__":
+    main()
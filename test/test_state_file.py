@@ -0,0 +1,86 @@
+import os
+import struct
+import tempfile
+
+import numpy as np
+import arritmic3d
+
+# State file of a paced slab with corrupted block tables. Loading them must raise
+# RuntimeError instead of reading past the end of the file, and the original file must
+# still load.
+
+HEALTHY_ENDO = 1
+SIZE = (10, 10, 4)
+SPACING = 0.1
+HEADER = struct.Struct("<8sII")             # magic, version, n_blocks
+BLOCK_ENTRY = struct.Struct("<32sIIQQQ")    # name, element_size, flags, n_elements, offset, stored_size
+
+
+def new_tissue():
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    tissue = arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING)
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy([HEALTHY_ENDO] * n_nodes, {"APD_MEMORY_COEFF": [0.2] * n_nodes}, [[1.0, 1.0, 0.0]])
+    return tissue
+
+
+def read_table(data):
+    """ Offset in the file and fields of each block entry, by block name. """
+    _, _, n_blocks = HEADER.unpack_from(data)
+    table = {}
+    for i in range(n_blocks):
+        position = HEADER.size + i * BLOCK_ENTRY.size
+        entry = list(BLOCK_ENTRY.unpack_from(data, position))
+        table[entry[0].rstrip(b"\0").decode()] = (position, entry)
+    return table
+
+
+def corrupted(data, block, **fields):
+    """ Copy of the file with some fields of the entry of a block changed. """
+    position, entry = read_table(data)[block]
+    names = ["name", "element_size", "flags", "n_elements", "offset", "stored_size"]
+    for name, value in fields.items():
+        entry[names.index(name)] = value
+    data = bytearray(data)
+    BLOCK_ENTRY.pack_into(data, position, *entry)
+    return bytes(data)
+
+
+def main():
+    tissue = new_tissue()
+    tissue.ExternalActivation([tissue.GetIndex(2, 2, 1)], 0.0, 0)
+    tissue.RunUntil(20.0, [])
+    state_file = os.path.join(tempfile.mkdtemp(), "state.bin")
+    tissue.SaveState(state_file)
+    with open(state_file, "rb") as f:
+        data = f.read()
+    lat = tissue.GetLAT()
+
+    cases = {
+        # Smaller than its elements, at the end of the file: it passes the truncation check
+        "short block": corrupted(data, "anisotropy_factor", stored_size=64, offset=len(data) - 64),
+        "block past the end": corrupted(data, "anisotropy_factor", offset=len(data) - 8),
+        "offset overflow": corrupted(data, "anisotropy_factor", offset=2**64 - 8),
+        "element size": corrupted(data, "anisotropy_factor", element_size=8),
+        "truncated table": data[:HEADER.size + BLOCK_ENTRY.size],
+    }
+    for case, case_data in cases.items():
+        corrupted_file = state_file + ".corrupted"
+        with open(corrupted_file, "wb") as f:
+            f.write(case_data)
+        try:
+            new_tissue().LoadState(corrupted_file)
+        except RuntimeError as e:
+            print(f"{case}: {e}")
+        else:
+            raise AssertionError(f"Loaded a state file with a corrupted table ({case})")
+
+    loaded = new_tissue()
+    loaded.LoadState(state_file)
+    assert np.array_equal(loaded.GetLAT(), lat), "The loaded state differs"
+    print("Corrupted state files are rejected")
+
+
+if __name__ == "__main__":
+    main()
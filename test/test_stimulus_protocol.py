@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import arritmic3d
+
+# Slab stimulated along a line with a different first time for each node, as a Purkinje-like
+# activation, and at a second site with single stimuli. The tissue applies the stimuli of its
+# protocol by itself, and must give the same results as activating the nodes from Python on
+# EXT_ACTIVATION events. The protocol continues after saving and loading the state.
+
+HEALTHY_ENDO = 1
+SIZE = (40, 40, 3)
+SPACING = 0.1
+BCL = [400.0, 300.0]
+N_STIMS = [3, 2]
+FIRST_BEAT = 1
+SINGLE_STIMULI = [(1500.0, 10), (1800.0, 11)]
+T_SAVE = 900.0
+T_END = 2200.0
+FIELDS = ["State", "LAT", "APD", "CV", "Beat"]
+STATE_FILE = "out_test/stimulus_protocol.bin"
+
+
+def create_tissue():
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    tissue = arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING)
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy([HEALTHY_ENDO] * n_nodes, {"APD_MEMORY_COEFF": [0.2] * n_nodes}, [[1.0, 0.0, 0.0]])
+    return tissue
+
+
+def stimulation_sites(tissue):
+    """ Nodes of the line, with their first times, and nodes of the single stimuli. """
+    line = [tissue.GetIndex(x, 2, 1) for x in range(2, SIZE[0] - 2)]
+    first_times = [10.0 + 0.25 * x for x in range(2, SIZE[0] - 2)]
+    site = [tissue.GetIndex(30, 30, 1), tissue.GetIndex(31, 30, 1)]
+    return line, first_times, site
+
+
+def python_activations(tissue):
+    """ Activations of the protocol as time -> (nodes, beat), as the Python driver scheduled them. """
+    line, first_times, site = stimulation_sites(tissue)
+    activations = {}
+    for node, first_time in zip(line, first_times):
+        t, beat = first_time, FIRST_BEAT
+        for b, (n_stims, bcl) in enumerate(zip(N_STIMS, BCL)):
+            for s in range(n_stims):
+                activations.setdefault(np.float32(t), ([], beat))[0].append(node)
+                beat += 1
+                t += BCL[b + 1] if b + 1 < len(BCL) and s + 1 >= n_stims else bcl
+    for t, beat in SINGLE_STIMULI:
+        activations[np.float32(t)] = (site, beat)
+    return activations
+
+
+def run_python(tissue):
+    activations = python_activations(tissue)
+    for t in activations:
+        tissue.SetSystemEvent(arritmic3d.SystemEventType.EXT_ACTIVATION, t)
+    while tissue.GetTime() < T_END:
+        tick = tissue.RunUntil(T_END, [arritmic3d.SystemEventType.EXT_ACTIVATION])
+        if tick == arritmic3d.SystemEventType.EXT_ACTIVATION:
+            nodes, beat = activations[np.float32(tissue.GetTime())]
+            tissue.ExternalActivation(nodes, tissue.GetTime(), beat)
+        elif tick == arritmic3d.SystemEventType.NO_EVENT:
+            break
+    return tissue.GetFields(FIELDS), tissue.GetNumEvents()
+
+
+def add_protocol(tissue):
+    line, first_times, site = stimulation_sites(tissue)
+    tissue.AddStimulusTrain(line, first_times, BCL, N_STIMS, FIRST_BEAT)
+    nodes = [node for _ in SINGLE_STIMULI for node in site]
+    times = [t for t, _ in SINGLE_STIMULI for _ in site]
+    beats = [beat for _, beat in SINGLE_STIMULI for _ in site]
+    tissue.AddStimuli(nodes, times, beats)
+
+
+def main():
+    fields, n_events = run_python(create_tissue())
+
+    tissue = create_tissue()
+    add_protocol(tissue)
+    assert tissue.GetNextStimulusTime() == np.float32(10.5), f"First stimulus at {tissue.GetNextStimulusTime()}"
+    tissue.RunUntil(T_END, [])
+    native_fields = tissue.GetFields(FIELDS)
+    for name in FIELDS:
+        assert np.array_equal(fields[name], native_fields[name]), f"{name} differs from the Python activations"
+    assert tissue.GetNumEvents() == n_events, f"Events {tissue.GetNumEvents()} != {n_events}"
+    assert tissue.GetNextStimulusTime() > T_END, "Stimuli left after the protocol"
+    print(f"{n_events} events, last beat {int(native_fields['Beat'].max())}")
+
+    # The pending stimuli are part of the state of the tissue
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    tissue = create_tissue()
+    add_protocol(tissue)
+    tissue.RunUntil(T_SAVE, [])
+    tissue.SaveState(STATE_FILE)
+    loaded = create_tissue()
+    loaded.LoadState(STATE_FILE)
+    loaded.RunUntil(T_END, [])
+    loaded_fields = loaded.GetFields(FIELDS)
+    for name in FIELDS:
+        assert np.array_equal(fields[name], loaded_fields[name]), f"{name} differs after loading the state"
+
+    tissue.ClearStimuli()
+    tissue.RunUntil(T_END, [])
+    assert tissue.GetFields(["Beat"])["Beat"].max() < fields["Beat"].max(), "Stimuli applied after ClearStimuli"
+    print("Stimulus protocol matches the Python activations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import arritmic3d
+
+# Ensemble of independent tissues run from a Python thread pool.
+# Each variant paces the same geometry from a different site. RunUntil and the
+# bulk getters release the GIL, so the variants run concurrently on several cores.
+
+HEALTHY_ENDO = 1
+SIZE = (60, 60, 6)
+SPACING = 0.1
+CL = 350.0
+DURATION = 2000.0
+
+
+def build_geometry():
+    """ Cell types and parameters shared by all the variants. """
+    n_nodes = SIZE[0] * SIZE[1] * SIZE[2]
+    v_type = [HEALTHY_ENDO] * n_nodes
+    parameters = {"APD_MEMORY_COEFF": [0.2] * n_nodes}
+    return v_type, parameters
+
+
+def make_variant(v_type, parameters):
+    """ Create and initialize a tissue. All the variants share the same restitution model tables. """
+    tissue = arritmic3d.CardiacTissue(*SIZE, SPACING, SPACING, SPACING)
+    tissue.InitModels("restitutionModels/config_TenTuscher_APD.csv", "restitutionModels/config_TenTuscher_CV.csv")
+    tissue.SetInitialAPD(200.0)
+    tissue.InitPy(v_type, parameters)
+    tissue.SetTimer(arritmic3d.SystemEventType.EXT_ACTIVATION, CL)
+    return tissue
+
+
+def run_variant(tissue, pacing_site):
+    """ Pace the tissue from pacing_site and return its final LAT map. """
+    initial_node = tissue.GetIndex(*pacing_site)
+    beat = 0
+    while tissue.GetTime() < DURATION:
+        tick = tissue.RunUntil(DURATION, [arritmic3d.SystemEventType.EXT_ACTIVATION])
+        if tick == arritmic3d.SystemEventType.EXT_ACTIVATION:
+            beat += 1
+            tissue.ExternalActivation([initial_node], tissue.GetTime(), beat)
+        elif tick == arritmic3d.SystemEventType.NO_EVENT:
+            break
+
+    return tissue.GetLAT()
+
+
+def run_ensemble(pacing_sites, n_workers, v_type, parameters):
+    tissues = [make_variant(v_type, parameters) for _ in pacing_sites]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        results = list(pool.map(run_variant, tissues, pacing_sites))
+    return time.perf_counter() - t0, results
+
+
+def main():
+    n_cores = os.cpu_count() or 1
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else n_cores
+    pacing_sites = [(2 + 7 * (i % 8), 2 + 7 * (i // 8), 2) for i in range(max(2 * n_workers, 8))]
+    v_type, parameters = build_geometry()
+
+    print(f"-- {len(pacing_sites)} pacing sites, {n_cores} cores --", flush=True)
+    t_serial, serial = run_ensemble(pacing_sites, 1, v_type, parameters)
+    print(f"1 thread:  {t_serial:.2f} s", flush=True)
+    t_parallel, parallel = run_ensemble(pacing_sites, n_workers, v_type, parameters)
+    print(f"{n_workers} threads: {t_parallel:.2f} s  speed-up: {t_serial / t_parallel:.2f}x", flush=True)
+
+    assert all(np.array_equal(a, b) for a, b in zip(serial, parallel)), "Threaded results differ from serial results"
+    print("Threaded results match serial results")
+
+
+if __name__ == "__main__":
+    main()